@@ -4,12 +4,52 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_restful import Api
 from flask_cors import CORS
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy with engine settings tuned per database.
+
+    PostgreSQL gets a sized, pre-pinged connection pool. File-based SQLite
+    gets a pool too, instead of Flask-SQLAlchemy's NullPool, and every new
+    connection runs SQLITE_PRAGMAS.
+    """
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        pool = {
+            "pool_size": app.config['DATABASE_POOL_SIZE'],
+            "max_overflow": app.config['DATABASE_MAX_OVERFLOW'],
+            "pool_timeout": app.config['DATABASE_POOL_TIMEOUT'],
+        }
+        if sa_url.drivername.startswith("postgresql"):
+            options.update(pool, pool_recycle=app.config['DATABASE_POOL_RECYCLE'],
+                           pool_pre_ping=True)
+        elif sa_url.drivername == "sqlite" and sa_url.database not in (None, "", ":memory:"):
+            options.update(pool, poolclass=QueuePool)
+            # Pooled connections are handed to whichever thread checks them out.
+            options.setdefault("connect_args", {})["check_same_thread"] = False
+        super(Database, self).apply_driver_hacks(app, sa_url, options)
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(Database, self).create_engine(sa_url, engine_opts)
+        if engine.dialect.name == "sqlite":
+            event.listen(engine, "connect", set_sqlite_pragmas)
+        return engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS']:
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
 
 app = Flask(__name__)
 app.config.from_object(Config)
 api = Api(app)
-db = SQLAlchemy(app)
+db = Database(app)
 migrate = Migrate(app, db)
 CORS(app)
 
-from app import photo, models
+from app import photo, models, search, metrics, compression, user, timeline, changes, uploads
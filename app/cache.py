@@ -0,0 +1,386 @@
+import base64
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+from flask import request, Response
+from flask_restful import Resource
+from sqlalchemy import event, inspect
+from werkzeug.http import parse_date, unquote_etag
+from app import api, app, compression, db
+from app.conditional import not_modified
+from app.metrics import timed
+from app.models import Photo
+from app.serializers import dumps
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is only needed for the shared backend
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Every cached list page carries LIST_TAG plus the tag of each photo on it;
+# a cached photo carries only its own tag.
+LIST_TAG = "photos"
+
+# Changing these can move a photo onto or off any list page, not only the
+# pages it is already on.
+LISTED_ATTRIBUTES = (
+    "upload_date", "public", "user_id", "tags", "taken_at", "width", "height", "camera_model"
+)
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def photo_tag(id):
+    return f"photo:{id}"
+
+
+class MemoryBackend(object):
+    """In-process LRU with a per-entry TTL.
+
+    Each worker process has its own copy, so invalidations only reach the
+    process that made the change; other workers serve their copy until the
+    TTL runs out.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def epoch(self):
+        return self._epoch
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, tags, expires = item
+            if expires < time.monotonic():
+                self._forget(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, epoch):
+        with self._lock:
+            # Something was invalidated while the value was being built; it
+            # may already be stale.
+            if epoch != self._epoch:
+                return False
+            if key in self._entries:
+                self._forget(key)
+            self._entries[key] = (value, tags, time.monotonic() + self.ttl)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._forget(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._epoch += 1
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._entries:
+                        self._forget(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._tags.clear()
+
+    def _forget(self, key):
+        _, tags, _ = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class RedisBackend(object):
+    """Shared cache in Redis, so an invalidation reaches every worker.
+
+    Values are stored as JSON; the compressed bodies of response entries
+    are bytes, so they are kept base64 encoded.
+    """
+
+    def __init__(self, url, ttl, prefix="photoapi:cache:"):
+        self.ttl = ttl
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+
+    def __len__(self):
+        return sum(1 for _ in self._redis.scan_iter(f"{self.prefix}entry:*"))
+
+    def epoch(self):
+        return int(self._redis.get(f"{self.prefix}epoch") or 0)
+
+    def get(self, key):
+        raw = self._redis.get(f"{self.prefix}entry:{key}")
+        if raw is None:
+            return None
+        value = json.loads(raw)
+        if isinstance(value, dict) and value.get("encoded"):
+            value["encoded"] = {
+                coding: base64.b64decode(data) for coding, data in value["encoded"].items()
+            }
+        return value
+
+    def set(self, key, value, tags, epoch):
+        entry = f"{self.prefix}entry:{key}"
+        epoch_key = f"{self.prefix}epoch"
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(epoch_key)
+                if int(pipe.get(epoch_key) or 0) != epoch:
+                    return False
+                pipe.multi()
+                if isinstance(value, dict) and value.get("encoded"):
+                    value = dict(value, encoded={
+                        coding: base64.b64encode(data).decode("ascii")
+                        for coding, data in value["encoded"].items()
+                    })
+                pipe.set(entry, dumps(value), ex=self.ttl)
+                for tag in tags:
+                    pipe.sadd(f"{self.prefix}tag:{tag}", entry)
+                    pipe.expire(f"{self.prefix}tag:{tag}", self.ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def invalidate(self, tags):
+        tag_keys = [f"{self.prefix}tag:{tag}" for tag in tags]
+        with self._redis.pipeline() as pipe:
+            pipe.incr(f"{self.prefix}epoch")
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            members = pipe.execute()[1:]
+        entries = set().union(*members) if members else set()
+        if entries or tag_keys:
+            self._redis.delete(*entries, *tag_keys)
+
+    def clear(self):
+        self._redis.incr(f"{self.prefix}epoch")
+        keys = list(self._redis.scan_iter(f"{self.prefix}entry:*"))
+        keys += list(self._redis.scan_iter(f"{self.prefix}tag:*"))
+        if keys:
+            self._redis.delete(*keys)
+
+
+class ResponseCache(object):
+    """Rendered GET responses, invalidated by tag when photos change.
+
+    An entry holds the JSON body, the same body compressed in each
+    available coding, and the response headers, so a hit skips the
+    database, the serializer, the JSON encoder and the compressor.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key():
+        """Identify the current request: endpoint, view arguments and query."""
+        view_args = sorted((request.view_args or {}).items())
+        query = urlencode(sorted(request.args.items(multi=True)))
+        return f"{request.script_root}|{request.endpoint}|{view_args}|{query}"
+
+    def get(self, key):
+        entry = self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def epoch(self):
+        """Token to pass to store(), taken before reading the database."""
+        return self.backend.epoch()
+
+    def store(self, key, data, headers, tags, epoch):
+        with timed("serialize"):
+            body = dumps(data) + "\n"
+        entry = {"body": body, "encoded": compression.precompress(body), "headers": headers}
+        self.backend.set(key, entry, tags, epoch)
+        return entry
+
+    def invalidate(self, tags):
+        self.invalidations += 1
+        self.backend.invalidate(tags)
+
+    def clear(self):
+        self.invalidations += 1
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+
+def cached(render, tags):
+    """Serve the current GET request through the response cache.
+
+    On a miss ``render()`` builds the response as a resource method would.
+    Only ``(data, 200, headers)`` results are stored, tagged with
+    ``tags(data)``; anything else (304, 404) is passed through.
+    """
+    if not enabled():
+        return render()
+
+    response_cache = get_cache()
+    key = response_cache.key()
+    entry = response_cache.get(key)
+    if entry is None:
+        epoch = response_cache.epoch()
+        result = render()
+        if not isinstance(result, tuple) or result[1] != 200:
+            return result
+        data, _, headers = result
+        entry = response_cache.store(key, data, headers, tags(data), epoch)
+    return respond(entry)
+
+
+def respond(entry):
+    """Answer from a cache entry, with a 304 if the client's copy matches."""
+    headers = entry["headers"]
+    last_modified = headers.get("Last-Modified")
+    encoded = entry.get("encoded") if compression.enabled() else None
+    coding = compression.negotiate() if encoded else None
+    response = not_modified(
+        unquote_etag(headers["ETag"])[0], parse_date(last_modified) if last_modified else None
+    )
+    if response is None:
+        response = Response(entry["body"], mimetype="application/json", headers=headers)
+        if coding is not None and coding in encoded:
+            compression.encode(response, coding, encoded[coding])
+    elif coding is not None and coding in encoded:
+        # The 304 confirms the compressed copy, so it carries its ETag
+        compression.weaken_etag(response)
+    if encoded:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def get_cache():
+    """The shared ResponseCache for the configured backend."""
+    global _cache
+    config = (
+        app.config['CACHE_BACKEND'], app.config['CACHE_URL'], app.config['CACHE_TTL'],
+        app.config['CACHE_MAX_ENTRIES']
+    )
+    with _cache_lock:
+        if _cache is None or _cache.config != config:
+            _cache = ResponseCache(make_backend(*config))
+            _cache.config = config
+        return _cache
+
+
+def make_backend(name, url, ttl, max_entries):
+    if name == "redis":
+        if redis is not None and url:
+            return RedisBackend(url, ttl)
+        logger.warning("CACHE_BACKEND is 'redis' but redis or CACHE_URL is missing; "
+                       "using the in-process cache")
+    return MemoryBackend(max_entries, ttl)
+
+
+def enabled():
+    return app.config['CACHE_BACKEND'] != "none"
+
+
+# Invalidation. Changes are collected while the session flushes and applied
+# once the transaction commits, so a rollback invalidates nothing.
+
+def _pending(session):
+    return session.info.setdefault("cache_invalidate", set())
+
+
+@event.listens_for(db.session, "after_flush")
+def _collect_changes(session, flush_context):
+    tags = _pending(session)
+    for obj in session.new:
+        if isinstance(obj, Photo):
+            # Ids can be reused, so drop anything left under the new id.
+            tags.update((LIST_TAG, photo_tag(obj.id)))
+    for obj in session.deleted:
+        if isinstance(obj, Photo):
+            tags.add(photo_tag(obj.id))
+    for obj in session.dirty:
+        if isinstance(obj, Photo) and session.is_modified(obj):
+            tags.add(photo_tag(obj.id))
+            state = inspect(obj)
+            if any(state.attrs[name].history.has_changes() for name in LISTED_ATTRIBUTES):
+                tags.add(LIST_TAG)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+def _collect_bulk_update(update_context):
+    # The rows a bulk statement touched are unknown here; drop everything.
+    if update_context.mapper.class_ is Photo:
+        update_context.session.info["cache_clear"] = True
+
+
+@event.listens_for(db.session, "after_bulk_delete")
+def _collect_bulk_delete(delete_context):
+    if delete_context.mapper.class_ is Photo:
+        delete_context.session.info["cache_clear"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def _invalidate(session):
+    clear = session.info.pop("cache_clear", False)
+    tags = session.info.pop("cache_invalidate", None)
+    if not enabled():
+        return
+    if clear:
+        get_cache().clear()
+    elif tags:
+        get_cache().invalidate(tags)
+
+
+@event.listens_for(db.session, "after_rollback")
+def _discard(session):
+    session.info.pop("cache_clear", None)
+    session.info.pop("cache_invalidate", None)
+
+
+@event.listens_for(db.Model.metadata, "after_drop")
+def _dropped(target, connection, **kw):
+    # Tables were dropped and will be recreated with new rows under old ids.
+    if enabled():
+        get_cache().clear()
+
+
+class CacheStats(Resource):
+    """Hit and miss counters of this worker's response cache."""
+
+    def get(self):
+        return get_cache().stats(), 200
+
+
+api.add_resource(CacheStats, "/api/v1.0/cache", endpoint="cache_stats")
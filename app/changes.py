@@ -0,0 +1,123 @@
+from flask import abort, url_for
+from flask_restful import Resource, reqparse, inputs
+from sqlalchemy import DDL, event
+from app import api, app, db
+from app.models import Photo, PhotoChange
+from app.serializers import PHOTO_COLUMNS, serialize_photos
+
+# Triggers record every insert, every delete and every update that bumps
+# the version (which is every change visible in a response), including bulk
+# statements that never pass through the ORM. The previous row of the photo
+# is replaced, so the log holds one row per photo ever stored. Migration
+# 6f2b9d84c1e5 installs a copy and logs the photos already stored, so a
+# first sync from seq 0 sees them all.
+SQLITE_SCHEMA = (
+    """CREATE TRIGGER IF NOT EXISTS photo_change_ai AFTER INSERT ON photo BEGIN
+        DELETE FROM photo_change WHERE photo_id = new.id;
+        INSERT INTO photo_change(photo_id, deleted) VALUES (new.id, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_change_ad AFTER DELETE ON photo BEGIN
+        DELETE FROM photo_change WHERE photo_id = old.id;
+        INSERT INTO photo_change(photo_id, deleted) VALUES (old.id, 1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_change_au AFTER UPDATE OF version ON photo
+    WHEN new.version IS NOT old.version BEGIN
+        DELETE FROM photo_change WHERE photo_id = new.id;
+        INSERT INTO photo_change(photo_id, deleted) VALUES (new.id, 0);
+    END""",
+)
+
+# Sequence values are handed out in call order but become visible in commit
+# order, so a client could read seq 6 before seq 5 commits and never see 5.
+# The advisory lock makes writers take their seq, and commit, one at a time.
+POSTGRESQL_SCHEMA = (
+    """CREATE OR REPLACE FUNCTION photo_change_log() RETURNS trigger AS $$
+    DECLARE
+        changed integer;
+    BEGIN
+        IF TG_OP = 'UPDATE' AND NEW.version IS NOT DISTINCT FROM OLD.version THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP = 'DELETE' THEN
+            changed := OLD.id;
+        ELSE
+            changed := NEW.id;
+        END IF;
+        PERFORM pg_advisory_xact_lock(hashtext('photo_change'));
+        DELETE FROM photo_change WHERE photo_id = changed;
+        INSERT INTO photo_change(photo_id, deleted) VALUES (changed, TG_OP = 'DELETE');
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER photo_change_log
+    AFTER INSERT OR DELETE OR UPDATE OF version ON photo
+    FOR EACH ROW EXECUTE PROCEDURE photo_change_log()""",
+)
+
+# After every table exists, since the triggers write to photo_change
+for statement in SQLITE_SCHEMA:
+    event.listen(db.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRESQL_SCHEMA:
+    event.listen(db.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+class PhotoChangesAPI(Resource):
+    """Photos changed or deleted since a client last synced.
+
+    A client starts with ``since=0``, which lists every photo, and then
+    passes back the ``cursor`` of its last response. Each photo appears at
+    most once, with its current metadata or as a tombstone, so the cost of
+    a sync follows the number of photos changed rather than the size of the
+    library.
+    """
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("since", type=inputs.natural, default=0, location="args")
+        self.reqparse.add_argument("limit", type=inputs.positive, location="args")
+        super(PhotoChangesAPI, self).__init__()
+
+    def get(self):
+        args = self.reqparse.parse_args()
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+        since = args["since"]
+        if since > (db.session.query(db.func.max(PhotoChange.seq)).scalar() or 0):
+            # A cursor this server never handed out, e.g. from before a restore
+            abort(400)
+
+        changes = (
+            PhotoChange.query.filter(PhotoChange.seq > since)
+            .order_by(PhotoChange.seq)
+            .limit(limit + 1)
+            .all()
+        )
+        more = len(changes) > limit
+        changes = changes[:limit]
+
+        ids = [change.photo_id for change in changes if not change.deleted]
+        photos = {}
+        if ids:
+            rows = Photo.query.filter(Photo.id.in_(ids)).with_entities(*PHOTO_COLUMNS).all()
+            photos = {photo["id"]: photo for photo in serialize_photos(rows)}
+
+        body = []
+        for change in changes:
+            # A photo deleted after the log was read is sent as a tombstone;
+            # its own change comes later and repeats it.
+            photo = photos.get(change.photo_id)
+            body.append({
+                "seq": change.seq,
+                "id": change.photo_id,
+                "deleted": photo is None,
+                "photo": photo,
+            })
+
+        cursor = changes[-1].seq if changes else since
+        headers = {}
+        if more:
+            next_url = url_for("photo_changes", since=cursor, limit=limit)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return {"changes": body, "cursor": cursor, "more": more}, 200, headers
+
+
+api.add_resource(PhotoChangesAPI, "/api/v1.0/photos/changes", endpoint="photo_changes")
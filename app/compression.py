@@ -0,0 +1,121 @@
+import gzip
+from flask import request
+from app import app
+from app.metrics import timed
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional; gzip is always offered
+    brotli = None
+
+
+def enabled():
+    return app.config['COMPRESS_RESPONSES']
+
+
+def available():
+    """Content codings this process can produce, preferred first."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate():
+    """The coding to send the current request, or None for the identity.
+
+    Picks the highest quality the client's Accept-Encoding gives any
+    available coding; ties go to the preferred one.
+    """
+    best, best_quality = None, 0
+    for coding in available():
+        quality = request.accept_encodings.quality(coding)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def compressible(data):
+    return enabled() and len(data) >= app.config['COMPRESS_MIN_SIZE']
+
+
+def compress(data, coding):
+    with timed("compress"):
+        if coding == "br":
+            return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+        # mtime=0 keeps the output the same for the same input
+        return gzip.compress(data, compresslevel=app.config['COMPRESS_LEVEL'], mtime=0)
+
+
+def precompress(body):
+    """Compress a body ahead of time in every available coding.
+
+    Returns ``{coding: bytes}``, empty if the body is too small to bother.
+    """
+    data = body.encode("utf-8")
+    if not compressible(data):
+        return {}
+    return {coding: compress(data, coding) for coding in available()}
+
+
+def weaken_etag(response):
+    # A strong ETag promises identical bytes, which the identity and each
+    # coding do not share. If-None-Match compares weakly, so revalidation
+    # still matches either way.
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def encode(response, coding, data):
+    """Make ``response`` send ``data``, already compressed with ``coding``."""
+    response.set_data(data)
+    response.headers["Content-Encoding"] = coding
+    return weaken_etag(response)
+
+
+def revalidated(response):
+    """Give a 304 the validators of the compressed response it confirms.
+
+    The body is not rendered for a 304, so whether it would have been
+    compressed is judged from the client: it holds a compressed copy if
+    it revalidates with the weak ETag encode() hands out, and it still
+    negotiates a coding.
+    """
+    etag, weak = response.get_etag()
+    if (
+        etag is None
+        or weak
+        or not request.if_none_match.is_weak(etag)
+        or negotiate() is None
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    return weaken_etag(response)
+
+
+@app.after_request
+def compress_response(response):
+    """Compress JSON responses for clients that accept it.
+
+    Cached responses arrive already compressed and are left alone, as are
+    streamed ones such as the export. A 304 gets the headers of the
+    compressed response it stands in for.
+    """
+    if response.status_code == 304 and enabled():
+        return revalidated(response)
+    if (
+        response.status_code != 200
+        or response.mimetype not in app.config['COMPRESS_MIMETYPES']
+        or response.is_streamed
+        or response.direct_passthrough
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+    data = response.get_data()
+    if not compressible(data):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    coding = negotiate()
+    if coding is None:
+        return response
+    return encode(response, coding, compress(data, coding))
@@ -0,0 +1,50 @@
+import hashlib
+from flask import request, Response
+from werkzeug.http import http_date, is_resource_modified, quote_etag
+
+
+def make_etag(*parts):
+    """Build a strong ETag value from the values that identify a representation."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def validator_headers(etag, last_modified=None):
+    headers = {"ETag": quote_etag(etag)}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def not_modified(etag, last_modified=None):
+    """Return a 304 response if the request's validators still match.
+
+    Returns None when the client needs the full representation. Call this
+    before doing any serialization or file I/O so a match costs nothing.
+    """
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        return None
+    return Response(status=304, headers=validator_headers(etag, last_modified))
+
+
+def precondition_failed(etag):
+    """Return True if the request's If-Match does not name ``etag``.
+
+    Compared weakly: a compressed response carries the weak form of the
+    same ETag, and it still names the current version.
+    """
+    return bool(request.if_match) and not request.if_match.contains_weak(etag)
+
+
+def conflict(etag, last_modified=None):
+    """Answer a write that lost to a concurrent one.
+
+    412 if the client sent If-Match, 409 otherwise; either way with the
+    validators of the current version so the client can refetch and retry.
+    """
+    status = 412 if request.if_match else 409
+    body = {"message": "The photo was changed by another request"}
+    return body, status, validator_headers(etag, last_modified)
@@ -0,0 +1,170 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from flask import has_app_context
+from PIL import Image, ImageOps
+from sqlalchemy.orm.exc import StaleDataError
+from app import app, db, storage
+from app.models import Photo
+
+logger = logging.getLogger(__name__)
+
+# Values of Photo.derivatives
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp"}
+
+_executor = None
+
+
+def derivative_path(path, width, fmt):
+    """Location of a resized copy, stored next to the original.
+
+    ``ab/cd/<hash>.jpg`` becomes ``ab/cd/<hash>_640.webp``.
+    """
+    stem = path.rsplit(".", 1)[0]
+    return f"{stem}_{width}.{EXTENSIONS[fmt]}"
+
+
+def pick_width(size):
+    """Smallest configured width that covers ``size``, or the largest one."""
+    widths = sorted(app.config['DERIVATIVE_WIDTHS'])
+    for width in widths:
+        if width >= size:
+            return width
+    return widths[-1]
+
+
+def render_derivatives(source, widths, formats):
+    """Write every width/format of one original. Runs in a worker process.
+
+    Originals are never upscaled; widths past the original are saved at the
+    original size so every configured variant exists.
+    """
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        for width in widths:
+            resized = image.copy()
+            resized.thumbnail((width, width * 8), Image.LANCZOS)
+            for fmt in formats:
+                dest = derivative_path(source, width, fmt)
+                tmp = dest + ".part"
+                resized.save(tmp, format=fmt.upper(), quality=82)
+                os.replace(tmp, dest)
+                written.append(dest)
+    return written
+
+
+def render_stored(path, widths, formats):
+    """Render the derivatives of a stored file into storage.
+
+    Runs in a worker process. The local backend renders next to the
+    original in place; others render from a downloaded copy and upload the
+    results.
+    """
+    store = storage.get_storage()
+    with store.local_copy(path) as source:
+        rendered = render_derivatives(source, widths, formats)
+        try:
+            for width in widths:
+                for fmt in formats:
+                    store.put_file(
+                        derivative_path(source, width, fmt), derivative_path(path, width, fmt)
+                    )
+        except Exception:
+            # Don't leave rendered copies behind in the scratch folder
+            for local in rendered:
+                if os.path.exists(local):
+                    os.remove(local)
+            raise
+    return [derivative_path(path, width, fmt) for width in widths for fmt in formats]
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=app.config['DERIVATIVE_WORKERS'])
+    return _executor
+
+
+def enqueue(photo_id, path):
+    """Start generating derivatives for a committed photo.
+
+    With DERIVATIVE_WORKERS set to 0 the work is done inline, which keeps
+    tests and single-process setups free of background processes.
+    """
+    if not app.config['DERIVATIVE_WORKERS']:
+        generate(photo_id, path)
+        return
+
+    future = executor().submit(render_stored, *_job(path))
+    future.add_done_callback(lambda f: _record(photo_id, f))
+
+
+def generate(photo_id, path):
+    """Generate derivatives and record the outcome before returning.
+
+    Uses the process pool when there is one. Returns the new status.
+    """
+    try:
+        if app.config['DERIVATIVE_WORKERS']:
+            executor().submit(render_stored, *_job(path)).result()
+        else:
+            render_stored(*_job(path))
+    except Exception:
+        logger.exception("Derivatives failed for photo %s", photo_id)
+        status = FAILED
+    else:
+        status = READY
+    set_status(photo_id, status)
+    return status
+
+
+def _job(path):
+    return (path, tuple(app.config['DERIVATIVE_WIDTHS']),
+            tuple(app.config['DERIVATIVE_FORMATS']))
+
+
+def _record(photo_id, future):
+    if future.exception() is not None:
+        logger.error("Derivatives failed for photo %s: %s", photo_id, future.exception())
+        status = FAILED
+    else:
+        status = READY
+
+    # Callbacks normally run on the executor's management thread, but run
+    # in the request thread when the job finished before it was attached.
+    if has_app_context():
+        set_status(photo_id, status)
+    else:
+        with app.app_context():
+            set_status(photo_id, status)
+
+
+def set_status(photo_id, status):
+    photo = Photo.query.get(photo_id)
+    if photo is None:
+        return
+    photo.derivatives = status
+    try:
+        db.session.commit()
+    except StaleDataError:
+        # The photo was edited or deleted meanwhile; try once more on the
+        # fresh row.
+        db.session.rollback()
+        photo = Photo.query.get(photo_id)
+        if photo is not None:
+            photo.derivatives = status
+            db.session.commit()
+
+
+def delete_derivatives(path):
+    for width in app.config['DERIVATIVE_WIDTHS']:
+        for fmt in app.config['DERIVATIVE_FORMATS']:
+            storage.delete_file(derivative_path(path, width, fmt))
@@ -0,0 +1,189 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import click
+from PIL import Image
+from sqlalchemy import bindparam
+from app import app, cache, db, storage
+from app.models import Photo
+
+# EXIF tag ids
+MAKE = 0x010F
+MODEL = 0x0110
+ORIENTATION = 0x0112
+DATETIME = 0x0132
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATETIME_ORIGINAL = 0x9003
+OFFSET_TIME_ORIGINAL = 0x9011
+
+# GPS IFD tag ids
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+
+# Photo columns filled from the metadata
+FIELDS = ("taken_at", "camera_make", "camera_model", "width", "height", "latitude", "longitude")
+
+# Formats whose EXIF, if any, may come after the image data. Pillow loads
+# the whole image to find it, which a header cannot satisfy.
+TRAILING_EXIF_FORMATS = ("PNG",)
+
+
+def read_metadata(head):
+    """Parse capture details out of the first bytes of an image file.
+
+    Only the header is decoded: JPEG keeps EXIF and its frame size ahead of
+    the compressed data, PNG its size in the first chunk. Returns a dict with
+    a key for every name in FIELDS; anything missing or unreadable is None.
+    """
+    meta = dict.fromkeys(FIELDS)
+    try:
+        image = Image.open(io.BytesIO(head))
+    except Exception:
+        # Not an image Pillow can read, or the header did not fit in `head`
+        return meta
+    with image:
+        width, height = image.size
+        meta["width"], meta["height"] = width, height
+        if image.format in TRAILING_EXIF_FORMATS:
+            return meta
+        try:
+            exif = image.getexif()
+        except Exception:
+            # The EXIF block did not fit in `head`, or is corrupt
+            return meta
+
+    if hasattr(exif, "get_ifd"):
+        details = exif.get_ifd(EXIF_IFD)
+        gps = exif.get_ifd(GPS_IFD)
+    else:
+        # Older Pillow merges the sub-IFDs into the top level
+        details = exif
+        gps = exif.get(GPS_IFD) or {}
+
+    # Orientations 5-8 are rotated a quarter turn; store the size as shown.
+    if exif.get(ORIENTATION) in (5, 6, 7, 8):
+        width, height = height, width
+    meta["width"], meta["height"] = width, height
+
+    meta["camera_make"] = _text(exif.get(MAKE))
+    meta["camera_model"] = _text(exif.get(MODEL))
+    meta["taken_at"] = _timestamp(
+        details.get(DATETIME_ORIGINAL) or exif.get(DATETIME), details.get(OFFSET_TIME_ORIGINAL)
+    )
+    meta["latitude"] = _coordinate(gps.get(GPS_LATITUDE), gps.get(GPS_LATITUDE_REF), "S", 90)
+    meta["longitude"] = _coordinate(gps.get(GPS_LONGITUDE), gps.get(GPS_LONGITUDE_REF), "W", 180)
+    return meta
+
+
+def read_file_metadata(path, head_size):
+    """read_metadata for a stored file. Runs in backfill worker processes.
+
+    Only the first ``head_size`` bytes are read, with a ranged GET on s3.
+    """
+    try:
+        return read_metadata(storage.get_storage().read_head(path, head_size))
+    except (OSError, storage.ClientError):
+        return dict.fromkeys(FIELDS)
+
+
+def apply_metadata(photo, meta):
+    for field in FIELDS:
+        setattr(photo, field, meta[field])
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if not isinstance(value, str):
+        return None
+    value = value.strip("\x00 ")
+    return value[:64] or None
+
+
+def _timestamp(value, offset):
+    """EXIF ``YYYY:MM:DD HH:MM:SS``, converted to UTC when the offset is known."""
+    value = _text(value)
+    if value is None:
+        return None
+    try:
+        taken_at = datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+
+    offset = _text(offset)
+    if offset and len(offset) == 6 and offset[0] in "+-":
+        try:
+            delta = timedelta(hours=int(offset[1:3]), minutes=int(offset[4:6]))
+        except ValueError:
+            return taken_at
+        taken_at = taken_at - delta if offset[0] == "+" else taken_at + delta
+    return taken_at
+
+
+def _number(value):
+    # Rationals are IFDRational, or (numerator, denominator) in old Pillow
+    if isinstance(value, tuple):
+        return value[0] / value[1]
+    return float(value)
+
+
+def _coordinate(dms, ref, negative, limit):
+    """Degrees, minutes and seconds to signed decimal degrees."""
+    try:
+        degrees, minutes, seconds = (_number(part) for part in dms)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    value = degrees + minutes / 60 + seconds / 3600
+    if _text(ref) == negative:
+        value = -value
+    if value != value or abs(value) > limit:
+        return None
+    return round(value, 7)
+
+
+@app.cli.command("backfill-exif")
+@click.option("--all", "everything", is_flag=True,
+              help="Re-read every photo, not only those never read.")
+@click.option("--workers", type=int, default=None,
+              help="Worker processes; defaults to the number of CPUs.")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+def backfill_exif(everything, workers, batch_size):
+    """Read EXIF from stored files into the photo table."""
+    query = Photo.query.filter(Photo.path.isnot(None))
+    if not everything:
+        query = query.filter(Photo.width.is_(None))
+    rows = query.with_entities(Photo.id, Photo.path).order_by(Photo.id).all()
+    if not rows:
+        click.echo("Nothing to backfill.")
+        return
+
+    # One executemany per batch; the FIELDS keys of each parameter set become
+    # the SET clause. Bump the version so cached ETags change.
+    table = Photo.__table__
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam("_id"))
+        .values(version=table.c.version + 1, updated_at=bindparam("_updated_at"))
+    )
+
+    head_size = app.config['EXIF_HEADER_BYTES']
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            paths = [path for _, path in batch]
+            metas = pool.map(read_file_metadata, paths, [head_size] * len(paths), chunksize=16)
+            now = datetime.utcnow()
+            params = [dict(meta, _id=id, _updated_at=now) for (id, _), meta in zip(batch, metas)]
+            db.session.execute(statement, params)
+            db.session.commit()
+            done += len(batch)
+            click.echo(f"{done}/{len(rows)} photos")
+
+    # Core statements skip the session events that invalidate cached photos.
+    if cache.enabled():
+        cache.get_cache().clear()
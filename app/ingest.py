@@ -0,0 +1,239 @@
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import click
+from flask import has_app_context, url_for
+from flask_restful import Resource, fields, marshal
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import secure_filename
+from app import api, app, db, derivatives, exif, similar, storage
+from app.models import IngestJob, Photo
+
+logger = logging.getLogger(__name__)
+
+# Values of IngestJob.status
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Values of IngestJob.stage while running
+STORING = "storing"
+SAVING = "saving"
+DERIVATIVES = "derivatives"
+
+job_fields = {
+    "id": fields.String(),
+    "status": fields.String(),
+    "stage": fields.String(),
+    "filename": fields.String(),
+    "photo_id": fields.Integer(default=None),
+    "duplicate": fields.Boolean(),
+    "error": fields.String(),
+    "created_at": fields.DateTime(dt_format="iso8601"),
+    "updated_at": fields.DateTime(dt_format="iso8601"),
+}
+
+_executor = None
+
+
+def stored_photo(upload_file, title, upload_date, public):
+    """Stream an upload into storage and build its Photo, not yet added."""
+    filename = secure_filename(upload_file.filename)
+    ext = filename.rsplit('.', 1)[1].lower()
+    content_hash, path, head = storage.save_upload(upload_file.stream, ext)
+
+    p = new_photo(filename, content_hash, path, head, title, upload_date, public)
+    # Upload streams are spooled, so the image can be read again for its hash.
+    upload_file.stream.seek(0)
+    p.phash = similar.phash_of(upload_file.stream)
+    return p
+
+
+def spooled_photo(spool_path, content_hash, filename, title, upload_date, public):
+    """Move a spooled file with a verified SHA-256 into storage and build its
+    Photo, not yet added. The spool file may be gone afterwards.
+    """
+    spool = storage.full_path(spool_path)
+    with open(spool, "rb") as f:
+        phash = similar.phash_of(f)
+    ext = filename.rsplit('.', 1)[1].lower()
+    path, head = storage.store_file(spool, content_hash, ext)
+
+    p = new_photo(filename, content_hash, path, head, title, upload_date, public)
+    p.phash = phash
+    return p
+
+
+def new_photo(filename, content_hash, path, head, title, upload_date, public):
+    p = Photo(title, upload_date, public, filename)
+    p.content_hash = content_hash
+    p.path = path
+    p.derivatives = derivatives.PENDING
+    exif.apply_metadata(p, exif.read_metadata(head))
+    return p
+
+
+def save_photo(p, tags):
+    """Insert a stored photo unless the same file is already saved.
+
+    ``tags`` is the comma separated string sent with the upload. Returns the
+    photo and whether it was created; an existing photo comes back as is.
+    """
+    # The same bytes are only ever stored once.
+    existing = Photo.query.filter_by(content_hash=p.content_hash).first()
+    if existing is not None:
+        return existing, False
+
+    if tags:
+        p.set_tags(tags.split(","))
+    db.session.add(p)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        # A concurrent upload of the same file committed first; any other
+        # constraint is a real error.
+        existing = Photo.query.filter_by(content_hash=p.content_hash).first()
+        if existing is None:
+            raise
+        return existing, False
+    return p, True
+
+
+def job_representation(job):
+    data = marshal(job, job_fields)
+    data["uri"] = url_for("job", id=job.id)
+    data["photo"] = None if job.photo_id is None else url_for("photo", id=job.photo_id)
+    return data
+
+
+def start(upload_file, title, upload_date, public, tags):
+    """Spool an upload and queue a job for it. Returns the committed job.
+
+    Only the copy to the spool happens here; hashing, EXIF, the insert and
+    derivatives run in the job.
+    """
+    filename = secure_filename(upload_file.filename)
+    job_id = uuid.uuid4().hex
+    spool_path = spool_path_for(job_id, filename)
+
+    dest = storage.full_path(spool_path)
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    upload_file.save(dest, buffer_size=app.config['UPLOAD_CHUNK_SIZE'])
+    return queue(job_id, spool_path, filename, title, upload_date, public, tags)
+
+
+def spool_path_for(id, filename):
+    """Where an upload with this id is spooled, relative to UPLOAD_FOLDER."""
+    ext = filename.rsplit('.', 1)[1].lower()
+    return f".spool/{id}.{ext}"
+
+
+def queue(job_id, spool_path, filename, title, upload_date, public, tags):
+    """Queue a job for a file already in the spool. Returns the committed job.
+
+    The job removes the spool file when it ends.
+    """
+    job = IngestJob(
+        id=job_id, status=QUEUED, spool_path=spool_path, filename=filename, title=title,
+        upload_date=upload_date, public=public, tags=tags
+    )
+    db.session.add(job)
+    db.session.commit()
+    submit(job.id)
+    return job
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=app.config['INGEST_WORKERS'], thread_name_prefix="ingest"
+        )
+    return _executor
+
+
+def submit(job_id):
+    """Run a job on the worker threads, or right away with INGEST_WORKERS 0.
+
+    Returns a Future when the job was handed to a thread.
+    """
+    if not app.config['INGEST_WORKERS']:
+        run(job_id)
+        return None
+    return executor().submit(run, job_id)
+
+
+def run(job_id):
+    # Inline jobs run in the request thread, which already has a context
+    # and a session that must outlive the job.
+    if has_app_context():
+        _run(job_id)
+    else:
+        with app.app_context():
+            _run(job_id)
+
+
+def _run(job_id):
+    job = IngestJob.query.get(job_id)
+    if job is None or job.status != QUEUED:
+        return
+    spool_path = job.spool_path
+    _update(job, status=RUNNING, stage=STORING)
+
+    try:
+        with open(storage.full_path(spool_path), "rb") as f:
+            p = stored_photo(
+                FileStorage(f, filename=job.filename), job.title, job.upload_date, job.public
+            )
+        _update(job, stage=SAVING)
+        p, created = save_photo(p, job.tags)
+        job.photo_id = p.id
+        job.duplicate = not created
+        if created:
+            _update(job, stage=DERIVATIVES)
+            derivatives.generate(p.id, p.path)
+        _update(job, status=DONE, stage=None, spool_path=None)
+    except Exception as e:
+        logger.exception("Ingest job %s failed", job_id)
+        db.session.rollback()
+        job = IngestJob.query.get(job_id)
+        _update(job, status=FAILED, error=str(e)[:255] or type(e).__name__, spool_path=None)
+    finally:
+        # The spool is always on local disk, whatever the storage backend.
+        try:
+            os.remove(storage.full_path(spool_path))
+        except FileNotFoundError:
+            pass
+
+
+def _update(job, **values):
+    for key, value in values.items():
+        setattr(job, key, value)
+    db.session.commit()
+
+
+class JobAPI(Resource):
+    def get(self, id):
+        job = IngestJob.query.get(id)
+        if job is None:
+            return "Not found", 404
+        return job_representation(job), 200
+
+
+@app.cli.command("ingest-resume")
+def ingest_resume():
+    """Finish jobs left queued or running when their worker stopped."""
+    jobs = IngestJob.query.filter(IngestJob.status.in_((QUEUED, RUNNING))).all()
+    for job in jobs:
+        job.status = QUEUED
+    db.session.commit()
+    for job_id in [job.id for job in jobs]:
+        run(job_id)
+        click.echo(f"{job_id}: {IngestJob.query.get(job_id).status}")
+
+
+api.add_resource(JobAPI, "/api/v1.0/jobs/<id>", endpoint="job")
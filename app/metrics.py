@@ -0,0 +1,233 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request, Response
+from flask_restful import Resource
+from flask_sqlalchemy import get_debug_queries
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import api, app
+
+logger = logging.getLogger(__name__)
+
+# Where request time is spent besides the view's own code
+PHASES = ("db", "serialize", "compress", "file")
+
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram(object):
+    """Cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(labels, le=bound)} {bucket}')
+            lines.append(f'{self.name}_bucket{_labels(labels, le="+Inf")} {count}')
+            lines.append(f"{self.name}_sum{_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(labels)} {count}")
+        return lines
+
+
+class Counter(object):
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = {}
+
+    def inc(self, labels, value=1):
+        self._series[labels] = self._series.get(labels, 0) + value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_labels(labels)} {value}")
+        return lines
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Registry(object):
+    """Metrics of this worker process. Each gunicorn worker keeps its own."""
+
+    def __init__(self, buckets):
+        self.lock = threading.Lock()
+        self.requests = Counter("photoapi_requests_total", "Requests served")
+        self.duration = Histogram(
+            "photoapi_request_duration_seconds", "Time spent handling requests", buckets
+        )
+        self.phases = Counter(
+            "photoapi_request_phase_seconds_total",
+            "Request time spent on database, serialization, compression and file I/O"
+        )
+        self.queries = Histogram(
+            "photoapi_request_queries", "SQL statements run per request", QUERY_BUCKETS
+        )
+        self.slow = Counter("photoapi_slow_requests_total", "Requests over SLOW_REQUEST_MS")
+
+    def record(self, endpoint, method, status, timer, duration):
+        with self.lock:
+            self.requests.inc((("endpoint", endpoint), ("method", method), ("status", status)))
+            self.duration.observe((("endpoint", endpoint), ("method", method)), duration)
+            for phase in PHASES:
+                self.phases.inc((("endpoint", endpoint), ("phase", phase)), timer.phases[phase])
+            self.queries.observe((("endpoint", endpoint),), timer.queries)
+
+    def render(self):
+        with self.lock:
+            lines = []
+            for metric in (self.requests, self.duration, self.phases, self.queries, self.slow):
+                lines += metric.render()
+
+        # Imported here: the cache itself is timed through this module.
+        from app import cache
+        if cache.enabled():
+            stats = cache.get_cache().stats()
+            for name in ("hits", "misses", "invalidations"):
+                lines += [
+                    f"# TYPE photoapi_response_cache_{name}_total counter",
+                    f"photoapi_response_cache_{name}_total {stats[name]}",
+                ]
+        return "\n".join(lines) + "\n"
+
+
+class RequestTimer(object):
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+
+
+_registry = None
+
+
+def registry():
+    global _registry
+    if _registry is None:
+        _registry = Registry(app.config['METRICS_BUCKETS'])
+    return _registry
+
+
+def enabled():
+    return app.config['METRICS_ENABLED']
+
+
+def _timer():
+    if has_request_context():
+        return g.get("metrics_timer")
+    return None
+
+
+@contextmanager
+def timed(phase):
+    """Count the enclosed time towards ``phase`` of the current request.
+
+    Database time inside the block is left to the ``db`` phase.
+    """
+    timer = _timer()
+    if timer is None:
+        yield
+        return
+    db_before = timer.phases["db"]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timer.phases[phase] += elapsed - (timer.phases["db"] - db_before)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _timer() is not None:
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _timer()
+    starts = conn.info.get("metrics_query_start")
+    if timer is not None and starts:
+        timer.phases["db"] += time.perf_counter() - starts.pop()
+        timer.queries += 1
+
+
+@app.before_request
+def _start_timer():
+    if enabled():
+        g.metrics_timer = RequestTimer()
+
+
+@app.after_request
+def _finish_timer(response):
+    timer = g.pop("metrics_timer", None)
+    if timer is None:
+        return response
+
+    duration = time.perf_counter() - timer.start
+    endpoint = request.endpoint or "unmatched"
+    registry().record(endpoint, request.method, response.status_code, timer, duration)
+
+    response.headers.add("Server-Timing", ", ".join(
+        [f"{phase};dur={timer.phases[phase] * 1000:.1f}" for phase in PHASES]
+        + [f"total;dur={duration * 1000:.1f}"]
+    ))
+
+    slow = duration * 1000 >= app.config['SLOW_REQUEST_MS']
+    if slow or timer.queries > app.config['QUERY_COUNT_WARNING']:
+        if slow:
+            with registry().lock:
+                registry().slow.inc((("endpoint", endpoint),))
+        _log_request(timer, duration, response, slow)
+    return response
+
+
+def _log_request(timer, duration, response, slow):
+    logger.warning(
+        "%s %s %s -> %s in %.1f ms: %d queries, db %.1f ms, serialize %.1f ms, "
+        "compress %.1f ms, file %.1f ms",
+        "Slow request" if slow else "Query-heavy request", request.method,
+        request.full_path.rstrip("?"), response.status_code,
+        duration * 1000, timer.queries, timer.phases["db"] * 1000,
+        timer.phases["serialize"] * 1000, timer.phases["compress"] * 1000,
+        timer.phases["file"] * 1000
+    )
+    # Statements are only kept when SQLALCHEMY_RECORD_QUERIES is on.
+    for query in sorted(get_debug_queries(), key=lambda q: q.duration, reverse=True)[:5]:
+        logger.warning("  %.1f ms: %s", query.duration * 1000, query.statement)
+
+
+class MetricsAPI(Resource):
+    """Prometheus text exposition of this worker's metrics."""
+
+    def get(self):
+        if not enabled():
+            return "Not found", 404
+        return Response(registry().render(), mimetype="text/plain; version=0.0.4")
+
+
+api.add_resource(MetricsAPI, "/metrics", endpoint="metrics")
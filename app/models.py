@@ -1,6 +1,59 @@
 from app import db
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from hashlib import md5
+from datetime import datetime
+
+# Which tags each photo carries. The primary key answers "tags of a photo";
+# the (tag_id, photo_id) index is the inverted index for "photos with a tag".
+photo_tags = db.Table(
+    'photo_tag',
+    db.Column('photo_id', db.Integer, db.ForeignKey('photo.id'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id'), primary_key=True),
+    db.Index('ix_photo_tag_tag_id_photo_id', 'tag_id', 'photo_id'),
+)
+
+
+class Tag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), index=True, unique=True)
+
+    def __repr__(self):
+        return f"Tag: {self.name}"
+
+    @staticmethod
+    def normalize(names):
+        """Lowercase, trim and de-duplicate tag names, dropping empty ones."""
+        cleaned = (name.strip().lower()[:64] for name in names)
+        return sorted({name for name in cleaned if name})
+
+    @classmethod
+    def get_or_create(cls, names):
+        """Return Tag rows for ``names``, adding any that do not exist yet."""
+        names = cls.normalize(names)
+        if not names:
+            return []
+        tags = {tag.name: tag for tag in cls.query.filter(cls.name.in_(names))}
+        for name in names:
+            if name not in tags:
+                tags[name] = cls.create(name)
+        return [tags[name] for name in names]
+
+    @classmethod
+    def create(cls, name):
+        """Insert a tag, or return the one a concurrent request just added.
+
+        The insert runs in a savepoint, so losing the race on the unique
+        name only undoes the insert, not the caller's transaction.
+        """
+        tag = cls(name=name)
+        try:
+            with db.session.begin_nested():
+                db.session.add(tag)
+        except IntegrityError:
+            return cls.query.filter_by(name=name).one()
+        return tag
+
 
 class Photo(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -8,13 +61,53 @@ class Photo(db.Model):
     upload_date = db.Column(db.Integer)
     public = db.Column(db.Boolean, default=False)
     filename = db.Column(db.String(128))
+    # Where the file lives relative to UPLOAD_FOLDER. Uploads are stored by
+    # content hash; older rows keep their flat filename.
+    path = db.Column(db.String(160))
+    content_hash = db.Column(db.String(64), index=True, unique=True)
+    # Resized copies: None, 'pending', 'ready' or 'failed'
+    derivatives = db.Column(db.String(16))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    # Read from the file's EXIF header. taken_at is in UTC when the camera
+    # recorded its offset, and local time otherwise. width and height are as
+    # displayed, after the EXIF orientation is applied.
+    taken_at = db.Column(db.DateTime)
+    camera_make = db.Column(db.String(64))
+    camera_model = db.Column(db.String(64))
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    # Perceptual hash (dHash, 64 bits in hex) for finding near-duplicates
+    phash = db.Column(db.String(16))
+    # Bumped by SQLAlchemy on every UPDATE; together with the id it forms the
+    # ETag of the photo's metadata.
+    version = db.Column(db.Integer, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    tags = db.relationship('Tag', secondary=photo_tags, order_by='Tag.name',
+                           backref=db.backref('photos', lazy='dynamic'))
+
+    __mapper_args__ = {"version_id_col": version}
+
+    # Composite indexes backing keyset pagination of the photo list
+    __table_args__ = (
+        db.Index('ix_photo_upload_date_id', 'upload_date', 'id'),
+        db.Index('ix_photo_public_upload_date_id', 'public', 'upload_date', 'id'),
+        db.Index('ix_photo_user_id_upload_date_id', 'user_id', 'upload_date', 'id'),
+        # Date-range, dimension and camera filters
+        db.Index('ix_photo_taken_at_id', 'taken_at', 'id'),
+        db.Index('ix_photo_width_height', 'width', 'height'),
+        db.Index('ix_photo_camera_model', 'camera_model'),
+        db.Index('ix_photo_latitude_longitude', 'latitude', 'longitude'),
+    )
 
     def __init__(self, title, upload_date, public, filename):
         self.title = title
         self.upload_date = upload_date
         self.public = public
         self.filename = filename
+        self.path = filename
 
     def __repr__(self):
         return f"Photo: {self.title}"
@@ -22,19 +115,163 @@ class Photo(db.Model):
     def get_id(self):
         return self.id
 
+    # Mutators only stage changes; the caller commits once per request.
     def set_public(self):
         self.public = not self.public
-        db.session.commit()
 
     def set_title(self, title):
         self.title = title
-        db.session.commit()
 
     def update(self, k, v):
         setattr(self, k, v)
-        db.session.commit()
         return self
 
+    @property
+    def tag_names(self):
+        return [tag.name for tag in self.tags]
+
+    def set_tags(self, names):
+        self.tags = Tag.get_or_create(names)
+        # Tags live in another table; touch the row so its version moves.
+        self.updated_at = datetime.utcnow()
+
+    @classmethod
+    def tag_names_for(cls, ids):
+        """Map each photo id to its sorted tag names using a single query."""
+        names = {id: [] for id in ids}
+        if names:
+            rows = (
+                db.session.query(photo_tags.c.photo_id, Tag.name)
+                .join(Tag, Tag.id == photo_tags.c.tag_id)
+                .filter(photo_tags.c.photo_id.in_(list(names)))
+                .order_by(Tag.name)
+            )
+            for photo_id, name in rows:
+                names[photo_id].append(name)
+        return names
+
+    @classmethod
+    def bulk_update(cls, ids, values):
+        """Apply the same changes to many photos with one UPDATE statement.
+
+        Bulk statements bypass the ORM's version counter, so it is bumped here.
+        Returns the number of rows matched.
+        """
+        values = dict(values, version=cls.version + 1, updated_at=datetime.utcnow())
+        return cls.query.filter(cls.id.in_(ids)).update(values, synchronize_session=False)
+
+    @classmethod
+    def bulk_delete(cls, ids):
+        """Delete many photos with one DELETE statement.
+
+        Returns the storage paths of the deleted rows so their files can be
+        removed once the transaction commits.
+        """
+        paths = [path for path, in cls.query.filter(cls.id.in_(ids)).with_entities(cls.path)]
+        db.session.execute(photo_tags.delete().where(photo_tags.c.photo_id.in_(ids)))
+        cls.query.filter(cls.id.in_(ids)).delete(synchronize_session=False)
+        return paths
+
+
+class TimelineDay(db.Model):
+    """How many photos were uploaded on a day (UTC), public or not.
+
+    Maintained by database triggers on the photo table (see app.timeline),
+    so it also follows bulk and Core statements.
+    """
+    __tablename__ = 'photo_timeline'
+    day = db.Column(db.Date, primary_key=True)
+    public = db.Column(db.Boolean, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"TimelineDay: {self.day} {self.public} {self.count}"
+
+
+class PhotoChange(db.Model):
+    """The latest change to a photo, for clients syncing a local copy.
+
+    Written by database triggers on the photo table (see app.changes) in
+    the same transaction as the change itself. Each photo keeps one row:
+    a new change replaces the old one with a higher seq, so a client that
+    has seen everything up to some seq only needs the rows after it.
+    Deleted photos leave a tombstone row.
+    """
+    __tablename__ = 'photo_change'
+    seq = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: tombstones outlive the photo.
+    photo_id = db.Column(db.Integer, nullable=False, index=True, unique=True)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+
+    # Never hand out a seq twice, even after the row holding the highest
+    # one is replaced.
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    def __repr__(self):
+        return f"PhotoChange: {self.seq} {self.photo_id} {self.deleted}"
+
+
+class IngestJob(db.Model):
+    """An upload accepted for background processing.
+
+    Kept in the database so any worker process can report on it.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    # 'queued', 'running', 'done' or 'failed'
+    status = db.Column(db.String(16), index=True)
+    # What a running job is doing: 'storing', 'saving' or 'derivatives'
+    stage = db.Column(db.String(16))
+    # The spooled upload, relative to UPLOAD_FOLDER, until the job ends
+    spool_path = db.Column(db.String(160))
+    filename = db.Column(db.String(128))
+    title = db.Column(db.String(128))
+    upload_date = db.Column(db.Integer)
+    public = db.Column(db.Boolean, default=False)
+    # Comma separated, as sent
+    tags = db.Column(db.Text)
+    # Not a foreign key: the photo may be deleted while the job is kept.
+    photo_id = db.Column(db.Integer)
+    duplicate = db.Column(db.Boolean, default=False)
+    error = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"IngestJob: {self.id} {self.status}"
+
+
+class UploadSession(db.Model):
+    """A resumable upload, sent in chunks and then finalized into a photo.
+
+    The chunks are appended to a spool file; ``received`` is only moved
+    forward once they are on disk, so it is always safe to resume from.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    # 'uploading', 'finalizing' while the file is being stored, or 'done'
+    status = db.Column(db.String(16))
+    # The spool file, relative to UPLOAD_FOLDER, until the upload is done
+    spool_path = db.Column(db.String(160))
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    # SHA-256 the client expects the whole file to have, in hex
+    sha256 = db.Column(db.String(64))
+    filename = db.Column(db.String(128))
+    title = db.Column(db.String(128))
+    upload_date = db.Column(db.Integer)
+    public = db.Column(db.Boolean, default=False)
+    # Comma separated, as sent
+    tags = db.Column(db.Text)
+    # Set once done; in async ingest mode, the job storing the file
+    photo_id = db.Column(db.Integer)
+    job_id = db.Column(db.String(32))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
+
+    def __repr__(self):
+        return f"UploadSession: {self.id} {self.received}/{self.size}"
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,10 +279,27 @@ class User(db.Model):
     email = db.Column(db.String(120), index=True, unique=True)
     display_name = db.Column(db.String(64))
     pass_hash = db.Column(db.String(128))
+    # Dynamic so a user's photos are always read through a filtered, paged
+    # query on ix_photo_user_id_upload_date_id rather than loaded whole.
     photos = db.relationship('Photo', backref='photographer', lazy='dynamic')
 
     def __repr__(self):
-        return f'User: {self.name}'
+        return f'User: {self.username}'
+
+    @classmethod
+    def with_photo_counts(cls):
+        """Query (User, photo_count) rows in one statement.
+
+        The count is a correlated subquery, so only the users actually
+        returned are counted, each with a range scan of the user_id index.
+        """
+        photo_count = (
+            db.select([db.func.count(Photo.id)])
+            .where(Photo.user_id == cls.id)
+            .correlate(cls)
+            .label("photo_count")
+        )
+        return db.session.query(cls, photo_count)
 
     def set_password(self, password):
         self.pass_hash = generate_password_hash(password)
@@ -0,0 +1,88 @@
+import base64
+import binascii
+import json
+from sqlalchemy import tuple_
+from app.models import Photo
+
+
+# Photos are listed newest first on (upload_date, id). Rows without an
+# upload_date sort after every dated row, newest id first.
+def encode_cursor(upload_date, id):
+    raw = json.dumps([upload_date, id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the (upload_date, id) pair stored in a cursor.
+
+    Raises ValueError if the cursor was not produced by encode_cursor.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        upload_date, id = json.loads(base64.urlsafe_b64decode(padded))
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+
+    if not isinstance(id, int) or isinstance(id, bool):
+        raise ValueError("Invalid cursor")
+    if upload_date is not None and not isinstance(upload_date, (int, float)):
+        raise ValueError("Invalid cursor")
+    return upload_date, id
+
+
+def paginate(query, cursor=None, limit=50):
+    """Return one page of ``query`` and the cursor for the page after it.
+
+    Dated and undated photos are read with two separate range scans so both
+    can walk the (upload_date, id) indexes instead of sorting the table.
+    """
+    upload_date, id = decode_cursor(cursor) if cursor else (None, None)
+    rows = []
+
+    if cursor is None or upload_date is not None:
+        dated = query.filter(Photo.upload_date.isnot(None))
+        if cursor is not None:
+            dated = dated.filter(
+                tuple_(Photo.upload_date, Photo.id) < (upload_date, id)
+            )
+        rows = (
+            dated.order_by(Photo.upload_date.desc(), Photo.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+
+    if len(rows) <= limit:
+        undated = query.filter(Photo.upload_date.is_(None))
+        if cursor is not None and upload_date is None:
+            undated = undated.filter(Photo.id < id)
+        rows += undated.order_by(Photo.id.desc()).limit(limit + 1 - len(rows)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].upload_date, rows[-1].id)
+    return rows, next_cursor
+
+
+def paginate_by_id(query, column, cursor=None, limit=50):
+    """Keyset pagination in ascending order of a unique integer ``column``.
+
+    Cursors share the format of paginate's undated cursors. Raises
+    ValueError for a cursor that cannot be decoded.
+    """
+    if cursor:
+        _, after = decode_cursor(cursor)
+        query = query.filter(column > after)
+    rows = query.order_by(column).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(None, _row_id(rows[-1], column))
+    return rows, next_cursor
+
+
+def _row_id(row, column):
+    # Rows are either entities or tuples that start with one
+    entity = row[0] if isinstance(row, tuple) else row
+    return getattr(entity, column.key)
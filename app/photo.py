@@ -1,24 +1,141 @@
 import os
+import json
 import werkzeug
 from werkzeug.utils import secure_filename
-from flask import make_response, jsonify, abort, request, Response, send_from_directory
-from flask_restful import Resource, reqparse, fields, marshal, inputs
-from app import api, app, db
-from app.models import Photo
-from datetime import datetime
+from flask import abort, request, Response, url_for, stream_with_context, send_file, redirect
+from flask_restful import Resource, reqparse, fields, inputs
+from PIL import Image
+from sqlalchemy import false, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from app import api, app, cache, db, derivatives, ingest, serving, storage, transform
+from app.ingest import save_photo, stored_photo
+from app.models import Photo, Tag, photo_tags
+from app.conditional import conflict, make_etag, not_modified, precondition_failed, \
+    validator_headers
+from app.metrics import timed
+from app.pagination import paginate
+from app.serializers import PHOTO_COLUMNS, dumps, iter_serialized, serialize_photo, \
+    serialize_photos
+from datetime import datetime, timezone
 
 
-# Return all photos with a consistent URL
+# Return all photos with a consistent URL. The resources serialize through
+# app.serializers, which must produce exactly this shape.
 photo_fields = {
     "id": fields.Integer(),
     "title": fields.String(),
     "upload_date": fields.Integer(),
     "public": fields.Boolean(),
     "uri": fields.Url("photo"),
-    "filename": fields.String()
+    "filename": fields.String(),
+    "path": fields.String(),
+    "derivatives": fields.String(),
+    "taken_at": fields.DateTime(dt_format="iso8601"),
+    "camera_make": fields.String(),
+    "camera_model": fields.String(),
+    "width": fields.Integer(default=None),
+    "height": fields.Integer(default=None),
+    "latitude": fields.Float(),
+    "longitude": fields.Float(),
+    "tags": fields.List(fields.String, attribute="tag_names")
 }
 
 
+def utc_datetime(value):
+    """Parse an ISO 8601 date or datetime into the naive UTC taken_at uses."""
+    if "T" in value:
+        value = inputs.datetime_from_iso8601(value)
+    else:
+        value = inputs.date(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def tag_list(value):
+    """Accept only a JSON list of strings as tag names.
+
+    reqparse's ``type=list`` would turn the string "beach" into the tags
+    b, e, a, c and h.
+    """
+    if not isinstance(value, list) or not all(isinstance(name, str) for name in value):
+        raise ValueError("tags must be a list of strings")
+    return value
+
+
+def add_filter_arguments(parser):
+    """Add the query string filters understood by filter_photos."""
+    parser.add_argument("public", type=inputs.boolean, location="args")
+    parser.add_argument("user_id", type=int, location="args")
+    parser.add_argument("tags", type=str, location="args")
+    parser.add_argument("match", choices=("all", "any"), default="all", location="args")
+    parser.add_argument("taken_after", type=utc_datetime, location="args")
+    parser.add_argument("taken_before", type=utc_datetime, location="args")
+    parser.add_argument("min_width", type=inputs.natural, location="args")
+    parser.add_argument("min_height", type=inputs.natural, location="args")
+    parser.add_argument("camera", type=str, location="args")
+
+
+def filter_photos(query, args):
+    """Narrow a Photo query by the filters shared by the list endpoints."""
+    if args.get("public") is not None:
+        query = query.filter(Photo.public == args["public"])
+    if args.get("user_id") is not None:
+        query = query.filter(Photo.user_id == args["user_id"])
+    if args.get("tags"):
+        query = filter_tags(query, Tag.normalize(args["tags"].split(",")), args.get("match", "all"))
+    if args.get("taken_after") is not None:
+        query = query.filter(Photo.taken_at >= args["taken_after"])
+    if args.get("taken_before") is not None:
+        query = query.filter(Photo.taken_at < args["taken_before"])
+    if args.get("min_width") is not None:
+        query = query.filter(Photo.width >= args["min_width"])
+    if args.get("min_height") is not None:
+        query = query.filter(Photo.height >= args["min_height"])
+    if args.get("camera"):
+        query = query.filter(Photo.camera_model == args["camera"])
+    return query
+
+
+def filter_tags(query, names, match):
+    """Keep photos carrying all (or any) of the tag ``names``.
+
+    Rare tags drive the query from the (tag_id, photo_id) index and look the
+    photos up by id. Common tags are cheaper the other way round: walk the
+    photos in list order and probe photo_tag's primary key for each one
+    until the page is full.
+    """
+    counts = dict(
+        db.session.query(Tag.id, func.count(photo_tags.c.photo_id))
+        .outerjoin(photo_tags, photo_tags.c.tag_id == Tag.id)
+        .filter(Tag.name.in_(names))
+        .group_by(Tag.id)
+    )
+    if not counts or (match == "all" and len(counts) < len(names)):
+        return query.filter(false())
+
+    def tagged(tag_ids):
+        return db.session.query(photo_tags.c.photo_id).filter(photo_tags.c.tag_id.in_(tag_ids))
+
+    def has_tags(tag_ids):
+        return tagged(tag_ids).filter(photo_tags.c.photo_id == Photo.id).exists()
+
+    threshold = app.config['TAG_INDEX_THRESHOLD']
+    if match == "any":
+        if sum(counts.values()) <= threshold:
+            return query.filter(Photo.id.in_(tagged(list(counts))))
+        return query.filter(has_tags(list(counts)))
+
+    rarest = min(counts, key=counts.get)
+    if counts[rarest] <= threshold:
+        query = query.filter(Photo.id.in_(tagged([rarest])))
+    for tag_id in counts:
+        if tag_id != rarest or counts[rarest] > threshold:
+            query = query.filter(has_tags([tag_id]))
+    return query
+
+
 class PhotoListAPI(Resource):
     def __init__(self):
         self.reqparse = reqparse.RequestParser()
@@ -28,15 +145,61 @@ class PhotoListAPI(Resource):
         )
         self.reqparse.add_argument("public", type=inputs.boolean, location="form")
         self.reqparse.add_argument("file", type=werkzeug.datastructures.FileStorage, location='files')
+        # Comma separated, e.g. "beach,sunset"
+        self.reqparse.add_argument("tags", type=str, location="form")
+
+        self.list_reqparse = reqparse.RequestParser()
+        self.list_reqparse.add_argument("limit", type=inputs.positive, location="args")
+        self.list_reqparse.add_argument("cursor", type=str, location="args")
+        add_filter_arguments(self.list_reqparse)
+
+        self.bulk_reqparse = reqparse.RequestParser()
+        self.bulk_reqparse.add_argument(
+            "ids", type=int, action="append", required=True, location="json"
+        )
+        self.bulk_reqparse.add_argument("changes", type=dict, location="json")
         super(PhotoListAPI, self).__init__()
 
     # TODO: Return only public for non-logged in user
     def get(self):
-        query = Photo.query.all()
-        # Each record comes in as a Response object that needs
-        # to be serialized for the return value.
-        photos = [marshal(photo, photo_fields) for photo in query]
-        return photos, 200
+        args = self.list_reqparse.parse_args()
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+
+        return cache.cached(
+            lambda: self.page(args, limit),
+            lambda photos: [cache.LIST_TAG] + [cache.photo_tag(photo["id"]) for photo in photos]
+        )
+
+    @staticmethod
+    def page(args, limit, endpoint="photos", **values):
+        """One page of photos matching ``args``, with a Link to the next page
+        of ``endpoint``.
+        """
+        query = filter_photos(Photo.query, args).with_entities(*PHOTO_COLUMNS, Photo.version)
+        try:
+            rows, next_cursor = paginate(query, args["cursor"], limit)
+        except ValueError:
+            abort(400)
+
+        # The page is identified by its members and their versions. There is
+        # no Last-Modified: a photo leaving the page would not move it.
+        etag = make_etag(next_cursor, *((row.id, row.version) for row in rows))
+        unchanged = not_modified(etag)
+        if unchanged is not None:
+            return unchanged
+
+        photos = serialize_photos(rows)
+
+        # The body stays a plain list; the next page is advertised in headers.
+        headers = validator_headers(etag)
+        if next_cursor is not None:
+            next_args = request.args.copy()
+            next_args["cursor"] = next_cursor
+            next_args["limit"] = limit
+            next_url = url_for(endpoint, **values, **next_args.to_dict())
+            headers["Link"] = f'<{next_url}>; rel="next"'
+            headers["X-Next-Cursor"] = next_cursor
+        return photos, 200, headers
 
     def post(self):
         args = self.reqparse.parse_args()
@@ -51,14 +214,63 @@ class PhotoListAPI(Resource):
             abort(400)
 
         if upload_file and self.allowed_filename(upload_file.filename):
-            filename = secure_filename(upload_file.filename)
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            upload_file.save(file_path)
-            p = Photo(args["title"], args["upload_date"], args["public"], filename)
-            db.session.add(p)
-            db.session.commit()
+            if app.config['INGEST_MODE'] == "async":
+                job = ingest.start(
+                    upload_file, args["title"], args["upload_date"], args["public"], args["tags"]
+                )
+                data = ingest.job_representation(job)
+                return data, 202, {"Location": data["uri"]}
+
+            p = stored_photo(upload_file, args["title"], args["upload_date"], args["public"])
+            p, created = save_photo(p, args["tags"])
+            if not created:
+                return serialize_photo(p), 200
 
-            return marshal(p, photo_fields), 201
+            derivatives.enqueue(p.id, p.path)
+            return serialize_photo(p), 201
+
+    def patch(self):
+        """Apply ``changes`` to every photo in ``ids`` with one UPDATE."""
+        args = self.bulk_reqparse.parse_args()
+        ids = self.bulk_ids(args)
+        changes = args["changes"] or {}
+        if not changes or not set(changes) <= {"title", "public"}:
+            abort(400)
+
+        values = {}
+        if "title" in changes:
+            if not isinstance(changes["title"], str):
+                abort(400)
+            values["title"] = changes["title"]
+        if "public" in changes:
+            try:
+                values["public"] = inputs.boolean(changes["public"])
+            except ValueError:
+                abort(400)
+
+        updated = Photo.bulk_update(ids, values)
+        db.session.commit()
+        return {"updated": updated}, 200
+
+    def delete(self):
+        """Delete every photo in ``ids``, then remove their files."""
+        ids = self.bulk_ids(self.bulk_reqparse.parse_args())
+        paths = Photo.bulk_delete(ids)
+        db.session.commit()
+
+        # Files go only after the rows are gone, so a failed commit never
+        # leaves photos pointing at missing files.
+        for path in paths:
+            storage.delete_file(path)
+            derivatives.delete_derivatives(path)
+        return {"deleted": len(paths)}, 200
+
+    @staticmethod
+    def bulk_ids(args):
+        ids = set(args["ids"] or ())
+        if not ids or len(ids) > app.config['BULK_LIMIT']:
+            abort(400)
+        return list(ids)
 
     @staticmethod
     def allowed_filename(filename):
@@ -66,53 +278,366 @@ class PhotoListAPI(Resource):
             filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
 
+class PhotoBatchAPI(Resource):
+    """Upload many photos in one request and one transaction.
+
+    Files are sent as repeated ``files`` parts. An optional ``metadata``
+    part holds a JSON array of ``{"title", "upload_date", "public", "tags"}``
+    objects matched to the files by position. The response lists one
+    result per file, in order, each with its own status code.
+    """
+
+    def post(self):
+        files = request.files.getlist("files")
+        if not files:
+            abort(400)
+        if len(files) > app.config['BATCH_UPLOAD_LIMIT']:
+            abort(413)
+
+        try:
+            metadata = json.loads(request.form.get("metadata") or "[]")
+        except ValueError:
+            abort(400)
+        if not isinstance(metadata, list) or not all(isinstance(m, dict) for m in metadata):
+            abort(400)
+
+        results = []
+        photos = {}
+        tags = {}
+        for index, upload_file in enumerate(files):
+            meta = metadata[index] if index < len(metadata) else {}
+            result = {"index": index}
+            results.append(result)
+
+            if not PhotoListAPI.allowed_filename(upload_file.filename):
+                result.update(status=400, error="File type not allowed")
+                continue
+            try:
+                public = inputs.boolean(meta.get("public", False))
+            except ValueError:
+                result.update(status=400, error="public must be a boolean")
+                continue
+            names = meta.get("tags", [])
+            if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+                result.update(status=400, error="tags must be a list of strings")
+                continue
+            upload_date = meta.get("upload_date")
+            if upload_date is not None and (
+                not isinstance(upload_date, int) or isinstance(upload_date, bool)
+            ):
+                result.update(status=400, error="upload_date must be an integer")
+                continue
+            title = meta.get("title")
+            if title is not None and not isinstance(title, str):
+                result.update(status=400, error="title must be a string")
+                continue
+
+            title = title or secure_filename(upload_file.filename).rsplit('.', 1)[0]
+            p = stored_photo(upload_file, title, upload_date, public)
+            # Repeats within the batch resolve to the first copy.
+            p = photos.setdefault(p.content_hash, p)
+            tags.setdefault(p.content_hash, names)
+            result["photo"] = p
+
+        ids, created = self.insert(photos, tags)
+
+        rows = Photo.query.filter(Photo.id.in_(ids.values())).with_entities(*PHOTO_COLUMNS)
+        serialized = {photo["id"]: photo for photo in serialize_photos(rows.all())}
+        for result in results:
+            p = result.pop("photo", None)
+            if p is not None:
+                result["status"] = 201 if p.content_hash in created else 200
+                result["photo"] = serialized[ids[p.content_hash]]
+
+        for content_hash, path in created.items():
+            derivatives.enqueue(ids[content_hash], path)
+        return results, 200
+
+    @staticmethod
+    def insert(photos, tags):
+        """Insert the photos that are not stored yet in a single transaction.
+
+        ``photos`` maps content hashes to new Photo objects and ``tags`` maps
+        them to tag names. Returns the id for every hash, and
+        ``{content_hash: path}`` for the rows created.
+        """
+        for attempt in range(2):
+            ids = dict(
+                Photo.query.filter(Photo.content_hash.in_(list(photos)))
+                .with_entities(Photo.content_hash, Photo.id)
+            )
+            new = [p for content_hash, p in photos.items() if content_hash not in ids]
+
+            known = {
+                tag.name: tag
+                for tag in Tag.get_or_create(n for p in new for n in tags[p.content_hash])
+            }
+            for p in new:
+                p.tags = [known[name] for name in Tag.normalize(tags[p.content_hash])]
+
+            db.session.add_all(new)
+            try:
+                db.session.flush()
+                ids.update((p.content_hash, p.id) for p in new)
+                created = {p.content_hash: p.path for p in new}
+                db.session.commit()
+                return ids, created
+            except IntegrityError:
+                # Another request stored one of these files meanwhile; look
+                # the hashes up again and retry without it.
+                db.session.rollback()
+                for p in new:
+                    p.id = None
+        abort(409)
+
+
+class PhotoExport(Resource):
+    """Stream every matching photo without building the whole list in memory."""
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument(
+            "format", choices=("ndjson", "json"), default="ndjson", location="args"
+        )
+        add_filter_arguments(self.reqparse)
+        super(PhotoExport, self).__init__()
+
+    def get(self):
+        args = self.reqparse.parse_args()
+        query = filter_photos(Photo.query, args).with_entities(*PHOTO_COLUMNS)
+        rows = query.order_by(Photo.id).yield_per(app.config['EXPORT_BATCH_SIZE'])
+
+        if args["format"] == "json":
+            body, mimetype = self.json_array(rows), "application/json"
+        else:
+            body, mimetype = self.ndjson(rows), "application/x-ndjson"
+        return Response(stream_with_context(body), mimetype=mimetype)
+
+    @staticmethod
+    def ndjson(rows):
+        for photo in iter_serialized(rows, app.config['EXPORT_BATCH_SIZE']):
+            yield dumps(photo) + "\n"
+
+    @staticmethod
+    def json_array(rows):
+        # Send the opening bracket straight away so the first byte does not
+        # wait on the database.
+        yield "["
+        separator = ""
+        for photo in iter_serialized(rows, app.config['EXPORT_BATCH_SIZE']):
+            yield separator + dumps(photo)
+            separator = ","
+        yield "]\n"
+
+
 class PhotoAPI(Resource):
     def __init__(self):
         self.reqparse = reqparse.RequestParser()
         self.reqparse.add_argument("title", type=str, location="json")
         self.reqparse.add_argument("public", type=bool, location="json")
+        self.reqparse.add_argument("tags", type=tag_list, location="json")
         super(PhotoAPI, self).__init__()
 
     def get(self, id):
+        return cache.cached(lambda: self.render(id), lambda photo: [cache.photo_tag(photo["id"])])
+
+    @staticmethod
+    def render(id):
         photo = Photo.query.get(id)
         if photo is None:
             return "Not found", 404
-        return marshal(photo, photo_fields), 200
+
+        etag = make_etag(photo.id, photo.version)
+        unchanged = not_modified(etag, photo.updated_at)
+        if unchanged is not None:
+            return unchanged
+        return serialize_photo(photo), 200, validator_headers(etag, photo.updated_at)
+
+    @staticmethod
+    def conflict(photo):
+        return conflict(make_etag(photo.id, photo.version), photo.updated_at)
 
     def put(self, id):
         if id is None:
             abort(400)
         photo = Photo.query.get(id)
+        if photo is None:
+            return "Not found", 404
+        if precondition_failed(make_etag(photo.id, photo.version)):
+            return self.conflict(photo)
         args = self.reqparse.parse_args()
         # Check for an empty argument object and return
         if args is not None:
             # Check that at least one value is not NoneType
             if not all(val is None for val in args.values()):
+                tags = args.pop("tags")
+                if tags is not None:
+                    photo.set_tags(tags)
                 for k, v in dict(args).items():
                     if v is not None:
                         photo.update(k, v)
+                try:
+                    db.session.commit()
+                except StaleDataError:
+                    # Another request updated the photo since it was loaded
+                    db.session.rollback()
+                    photo = Photo.query.get(id)
+                    if photo is None:
+                        return "Not found", 404
+                    return self.conflict(photo)
 
-                return marshal(photo, photo_fields), 200
+                etag = make_etag(photo.id, photo.version)
+                return serialize_photo(photo), 200, validator_headers(etag, photo.updated_at)
             else:
                 abort(400)
 
     def delete(self, id):
         photo = Photo.query.filter_by(id=id).first()
+        if photo is None:
+            return "Not found", 404
         # Get the file_path as a variable before deletion
-        os.remove(os.path.join(app.config['UPLOAD_FOLDER'], photo.filename))
+        path = photo.path
         db.session.delete(photo)
         db.session.commit()
+        storage.delete_file(path)
+        derivatives.delete_derivatives(path)
 
         return {"message": "Successfully deleted"}, 200
 
 
 class PhotoFile(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("size", type=inputs.positive, location="args")
+        self.reqparse.add_argument(
+            "format", choices=tuple(derivatives.EXTENSIONS), location="args"
+        )
+        super(PhotoFile, self).__init__()
+
+    def get(self, filename):
+        args = self.reqparse.parse_args()
+        store = storage.get_storage()
+        substitute = False
+        with timed("file"):
+            if args["size"] is not None:
+                filename, substitute = self.derivative(
+                    store, filename, args["size"], args["format"]
+                )
+            if store.presigned:
+                return self.redirect(store, filename, args, substitute)
+
+            stat = store.stat(filename)
+            if stat is None:
+                abort(404)
+
+        etag = make_etag(filename, stat.st_size, stat.st_mtime_ns)
+        last_modified = datetime.utcfromtimestamp(int(stat.st_mtime))
+        resp = not_modified(etag, last_modified)
+        if resp is None:
+            # Opens the file; the body is sent after the request is timed.
+            with timed("file"):
+                resp = serving.send_upload(
+                    filename, stat.st_size, etag, last_modified, substitute
+                )
+        else:
+            resp.headers["Cache-Control"] = serving.cache_control(filename, substitute)
+
+        if args["size"] is not None and args["format"] is None:
+            resp.vary.add("Accept")
+        return resp
+
+    @staticmethod
+    def derivative(store, filename, size, fmt):
+        """Return the resized copy to send, or the original if it is not ready.
+
+        Returns ``(path, substitute)``; ``substitute`` is True for the original.
+        """
+        if fmt is None:
+            webp = request.accept_mimetypes["image/webp"]
+            fmt = "webp" if webp and "webp" in app.config['DERIVATIVE_FORMATS'] else "jpeg"
+
+        resized = derivatives.derivative_path(filename, derivatives.pick_width(size), fmt)
+        if store.exists(resized):
+            return resized, False
+        return filename, True
+
+    @staticmethod
+    def redirect(store, filename, args, substitute=False):
+        """Send the client to a presigned URL for the object.
+
+        The redirect itself may be cached for half the URL's lifetime, so a
+        cached redirect never points at an expired URL. A redirect to a
+        substitute original is not cached at all.
+        """
+        resp = redirect(store.url(filename), code=302)
+        if substitute:
+            resp.headers["Cache-Control"] = serving.REVALIDATE
+        else:
+            max_age = app.config['PRESIGNED_URL_EXPIRY'] // 2
+            resp.headers["Cache-Control"] = f"private, max-age={max_age}"
+        if args["size"] is not None and args["format"] is None:
+            resp.vary.add("Accept")
+        return resp
+
+
+class PhotoTransform(Resource):
+    """Resize an uploaded file on demand, e.g. ``?w=300&h=300&fit=cover``."""
+
+    def __init__(self):
+        dimension = inputs.int_range(1, app.config['TRANSFORM_MAX_DIMENSION'])
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("w", type=dimension, location="args")
+        self.reqparse.add_argument("h", type=dimension, location="args")
+        self.reqparse.add_argument(
+            "fit", choices=transform.FITS, default="contain", location="args"
+        )
+        self.reqparse.add_argument(
+            "format", choices=tuple(transform.MIMETYPES), default="jpeg", location="args"
+        )
+        super(PhotoTransform, self).__init__()
+
     def get(self, filename):
-        root_dir = os.path.dirname(os.getcwd())
-        print(os.path.join(root_dir, 'static', 'uploads'))
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        args = self.reqparse.parse_args()
+        if args["w"] is None and args["h"] is None:
+            abort(400)
+
+        store = storage.get_storage()
+        stat = store.stat(filename)
+        if stat is None:
+            abort(404)
+
+        key = transform.variant_key(
+            filename, stat, args["w"], args["h"], args["fit"], args["format"]
+        )
+        # A variant never changes once rendered, so its key is its ETag.
+        unchanged = not_modified(key)
+        if unchanged is not None:
+            return unchanged
+
+        def render(dest):
+            with store.local_copy(filename) as source:
+                transform.render(source, dest, args["w"], args["h"], args["fit"], args["format"])
+
+        try:
+            with timed("file"):
+                f = transform.get_cache().open(key, transform.EXTENSIONS[args["format"]], render)
+        except (IOError, SyntaxError, ValueError, Image.DecompressionBombError):
+            # Pillow raises these for files it cannot decode, or will not
+            abort(415)
+
+        resp = send_file(
+            f, mimetype=transform.MIMETYPES[args["format"]],
+            conditional=False, add_etags=False
+        )
+        resp.content_length = os.fstat(f.fileno()).st_size
+        resp.set_etag(key)
+        resp.headers["Cache-Control"] = serving.cache_control(filename)
+        return resp
 
 
 api.add_resource(PhotoListAPI, "/api/v1.0/photos", endpoint="photos")
+api.add_resource(PhotoBatchAPI, "/api/v1.0/photos/batch", endpoint="photo_batch")
+api.add_resource(PhotoExport, "/api/v1.0/photos/export", endpoint="photo_export")
 api.add_resource(PhotoAPI, "/api/v1.0/photos/<id>", endpoint="photo")
 api.add_resource(PhotoFile, "/static/uploads/<path:filename>")
+api.add_resource(PhotoTransform, "/static/transform/<path:filename>")
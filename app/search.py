@@ -0,0 +1,95 @@
+import re
+from flask import request, url_for
+from flask_restful import Resource, reqparse, inputs
+from sqlalchemy import DDL, column, event, table, text
+from app import api, app, db
+from app.models import Photo
+from app.photo import add_filter_arguments, filter_photos
+from app.serializers import PHOTO_COLUMNS, serialize_photos
+
+# External-content FTS5 index over Photo.title. Triggers keep it in step
+# with every write to the photo table, including bulk UPDATE/DELETE
+# statements that never pass through the ORM. The same statements are
+# applied by the migration for existing databases.
+FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS photo_fts USING fts5(
+        title, content='photo', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_ai AFTER INSERT ON photo BEGIN
+        INSERT INTO photo_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_ad AFTER DELETE ON photo BEGIN
+        INSERT INTO photo_fts(photo_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_au AFTER UPDATE OF title ON photo BEGIN
+        INSERT INTO photo_fts(photo_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO photo_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+)
+
+for statement in FTS_SCHEMA:
+    event.listen(Photo.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+event.listen(
+    Photo.__table__, "before_drop",
+    DDL("DROP TABLE IF EXISTS photo_fts").execute_if(dialect="sqlite")
+)
+
+photo_fts = table("photo_fts", column("rowid"), column("rank"))
+
+
+def search_terms(q):
+    return re.findall(r"\w+", q or "")
+
+
+def fts_query(terms):
+    """Turn plain words into an FTS5 query: every word, each as a prefix."""
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_photos(query, terms):
+    """Filter and order ``query`` by how well titles match ``terms``."""
+    if db.engine.dialect.name == "sqlite":
+        return (
+            query.join(photo_fts, photo_fts.c.rowid == Photo.id)
+            .filter(text("photo_fts MATCH :match").bindparams(match=fts_query(terms)))
+            .order_by(photo_fts.c.rank, Photo.id)
+        )
+
+    # No FTS5 elsewhere; fall back to substring matching, newest first.
+    for term in terms:
+        escaped = term.replace("\\", "\\\\").replace("_", "\\_")
+        query = query.filter(Photo.title.ilike(f"%{escaped}%", escape="\\"))
+    return query.order_by(Photo.upload_date.desc(), Photo.id.desc())
+
+
+class PhotoSearchAPI(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("q", type=str, required=True, location="args")
+        self.reqparse.add_argument("limit", type=inputs.positive, location="args")
+        self.reqparse.add_argument("offset", type=inputs.natural, default=0, location="args")
+        add_filter_arguments(self.reqparse)
+        super(PhotoSearchAPI, self).__init__()
+
+    def get(self):
+        args = self.reqparse.parse_args()
+        terms = search_terms(args["q"])
+        if not terms:
+            return {"message": "Search needs at least one word"}, 400
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+
+        query = filter_photos(Photo.query, args).with_entities(*PHOTO_COLUMNS)
+        rows = search_photos(query, terms).offset(args["offset"]).limit(limit + 1).all()
+
+        headers = {}
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_args = request.args.copy()
+            next_args["offset"] = args["offset"] + limit
+            next_args["limit"] = limit
+            headers["Link"] = f'<{url_for("photo_search", **next_args.to_dict())}>; rel="next"'
+        return serialize_photos(rows), 200, headers
+
+
+api.add_resource(PhotoSearchAPI, "/api/v1.0/photos/search", endpoint="photo_search")
@@ -0,0 +1,108 @@
+import json
+from itertools import islice
+from flask import request, url_for
+from app.metrics import timed
+from app.models import Photo
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speedup
+    orjson = None
+
+
+# Columns read for every serialized photo, in output order (minus the uri).
+# Listing them lets queries use with_entities() and skip building ORM objects.
+# Rows may carry extra trailing columns; the serializer ignores them.
+PHOTO_COLUMNS = (
+    Photo.id, Photo.title, Photo.upload_date, Photo.public, Photo.filename, Photo.path,
+    Photo.derivatives, Photo.taken_at, Photo.camera_make, Photo.camera_model, Photo.width,
+    Photo.height, Photo.latitude, Photo.longitude
+)
+
+_URI_MARKER = "__photo_id__"
+_uri_templates = {}
+
+
+def photo_uri_prefix():
+    """Return the path every photo uri starts with, e.g. ``/api/v1.0/photos/``.
+
+    url_for is only called once per script root instead of once per row.
+    """
+    script_root = request.script_root
+    prefix = _uri_templates.get(script_root)
+    if prefix is None:
+        prefix = url_for("photo", id=_URI_MARKER).split(_URI_MARKER)[0]
+        _uri_templates[script_root] = prefix
+    return prefix
+
+
+def photo_row(photo):
+    """Return the PHOTO_COLUMNS values of a Photo instance as a tuple."""
+    return (
+        photo.id, photo.title, photo.upload_date, photo.public, photo.filename, photo.path,
+        photo.derivatives, photo.taken_at, photo.camera_make, photo.camera_model, photo.width,
+        photo.height, photo.latitude, photo.longitude
+    )
+
+
+def photo_serializer(tags=None):
+    """Build a function turning a PHOTO_COLUMNS row into the photo_fields dict.
+
+    The output matches ``marshal(photo, photo_fields)`` key for key, including
+    the defaults flask-restful applies to missing values. Tag names come from
+    ``tags``, a mapping of photo id to names as built by Photo.tag_names_for.
+    """
+    prefix = photo_uri_prefix()
+    tags = tags or {}
+
+    def serialize(row):
+        (id, title, upload_date, public, filename, path, derivatives, taken_at, camera_make,
+         camera_model, width, height, latitude, longitude) = row[:14]
+        return {
+            "id": 0 if id is None else int(id),
+            "title": None if title is None else str(title),
+            "upload_date": 0 if upload_date is None else int(upload_date),
+            "public": None if public is None else bool(public),
+            "uri": prefix + str(id),
+            "filename": None if filename is None else str(filename),
+            "path": None if path is None else str(path),
+            "derivatives": None if derivatives is None else str(derivatives),
+            "taken_at": None if taken_at is None else taken_at.isoformat(),
+            "camera_make": None if camera_make is None else str(camera_make),
+            "camera_model": None if camera_model is None else str(camera_model),
+            "width": None if width is None else int(width),
+            "height": None if height is None else int(height),
+            "latitude": None if latitude is None else float(latitude),
+            "longitude": None if longitude is None else float(longitude),
+            "tags": tags.get(id, []),
+        }
+
+    return serialize
+
+
+def serialize_photos(rows):
+    with timed("serialize"):
+        serialize = photo_serializer(Photo.tag_names_for([row[0] for row in rows]))
+        return [serialize(row) for row in rows]
+
+
+def iter_serialized(rows, chunk_size):
+    """Serialize a stream of rows lazily, looking up tags one chunk at a time."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield from serialize_photos(chunk)
+
+
+def serialize_photo(photo):
+    with timed("serialize"):
+        return photo_serializer({photo.id: photo.tag_names})(photo_row(photo))
+
+
+def dumps(data):
+    """Encode to a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data)
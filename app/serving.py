@@ -0,0 +1,57 @@
+import mimetypes
+import re
+from urllib.parse import quote
+from flask import request, Response, send_file
+from app import app, storage
+
+# Original uploads and their derivatives are named after their SHA-256, so
+# the bytes behind one of these paths can never change.
+CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(_\d+)?\.\w+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+
+def cache_control(path, substitute=False):
+    """Cache-Control for sending ``path``.
+
+    A ``substitute`` stands in for the file the URL names, like an original
+    sent while its derivative is rendered. It must be revalidated, or
+    caches would keep it under that URL for good.
+    """
+    if substitute:
+        return REVALIDATE
+    return IMMUTABLE if CONTENT_ADDRESSED.match(path) else REVALIDATE
+
+
+def send_upload(path, size, etag, last_modified, substitute=False):
+    """Send a file from UPLOAD_FOLDER according to FILE_SERVING.
+
+    ``direct`` streams the file from this worker and honours Range requests.
+    ``x-accel-redirect`` (nginx) and ``x-sendfile`` (Apache, lighttpd) return
+    an empty response and let the front proxy transfer the file, so the
+    worker is released immediately.
+    """
+    mode = app.config['FILE_SERVING']
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if mode == "x-accel-redirect":
+        resp = Response(mimetype=mimetype)
+        prefix = app.config['X_ACCEL_REDIRECT_PREFIX'].rstrip("/")
+        resp.headers["X-Accel-Redirect"] = f"{prefix}/{quote(path)}"
+    elif mode == "x-sendfile":
+        resp = Response(mimetype=mimetype)
+        resp.headers["X-Sendfile"] = storage.full_path(path)
+    else:
+        resp = send_file(
+            storage.full_path(path), mimetype=mimetype,
+            conditional=False, add_etags=False
+        )
+
+    resp.set_etag(etag)
+    resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = cache_control(path, substitute)
+    if mode == "direct":
+        # Validators must be in place first so If-Range can be checked.
+        resp.make_conditional(request, accept_ranges=True, complete_length=size)
+    return resp
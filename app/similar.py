@@ -0,0 +1,294 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+import click
+from flask_restful import Resource, reqparse, inputs
+from PIL import Image, ImageOps
+from app import api, app, db, storage
+from app.models import Photo
+from app.serializers import PHOTO_COLUMNS, serialize_photos
+
+# dHash compares neighbouring pixels of a HASH_SIZE x HASH_SIZE grey
+# thumbnail, giving HASH_SIZE ** 2 bits.
+HASH_SIZE = 8
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def image_phash(image):
+    """dHash of a Pillow image as a 16 character hex string.
+
+    Each bit says whether a pixel is brighter than its right neighbour, so
+    the hash survives resizing, recompression and small colour changes.
+    """
+    image = ImageOps.exif_transpose(image).convert("L")
+    pixels = image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            left = pixels[row * (HASH_SIZE + 1) + col]
+            value = value << 1 | (left > pixels[row * (HASH_SIZE + 1) + col + 1])
+    return f"{value:0{HASH_SIZE * HASH_SIZE // 4}x}"
+
+
+def phash_of(fileobj):
+    """dHash of an image file, or None if Pillow cannot decode it.
+
+    JPEGs are decoded at a reduced scale; only a tiny thumbnail is needed.
+    Images too large to open safely get None as well.
+    """
+    try:
+        with Image.open(fileobj) as image:
+            image.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+            return image_phash(image)
+    except (IOError, SyntaxError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def read_file_phash(path):
+    """phash_of for a stored file. Runs in backfill worker processes."""
+    try:
+        with storage.get_storage().local_copy(path) as source:
+            return phash_of(source)
+    except (OSError, storage.ClientError):
+        return None
+
+
+def distance(a, b):
+    """Number of differing bits between two integer hashes."""
+    return bin(a ^ b).count("1")
+
+
+class MultiIndex(object):
+    """Integer hashes indexed for Hamming-distance range queries.
+
+    Multi-index hashing: each hash is split into CHUNKS chunks, and every
+    chunk has a table from its value to the ids and hashes that have it. If
+    two hashes differ by at most ``radius`` bits, then by the pigeonhole
+    principle at least one of their chunks differs by at most
+    ``radius // CHUNKS`` bits. So a search only looks up the chunk values
+    that close to the query's, then checks the full distance of those
+    candidates.
+
+    For 64-bit hashes this beats a BK-tree, which at a radius of 10 ends up
+    visiting most of its nodes.
+    """
+
+    CHUNKS = 4
+
+    def __init__(self, bits=HASH_SIZE * HASH_SIZE):
+        self.chunk_bits = bits // self.CHUNKS
+        self.tables = [{} for _ in range(self.CHUNKS)]
+        self.size = 0
+        self._flips = {}
+
+    def chunks(self, value):
+        mask = (1 << self.chunk_bits) - 1
+        return [(value >> (i * self.chunk_bits)) & mask for i in range(self.CHUNKS)]
+
+    def add(self, value, id):
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            table.setdefault(chunk, {})[id] = value
+        self.size += 1
+
+    def discard(self, value, id):
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            bucket = table.get(chunk)
+            if bucket is None or bucket.pop(id, None) is None:
+                return
+            if not bucket:
+                del table[chunk]
+        self.size -= 1
+
+    def flips(self, bits):
+        """XOR masks of every chunk value within ``bits`` of another."""
+        masks = self._flips.get(bits)
+        if masks is None:
+            masks = [0]
+            for count in range(1, bits + 1):
+                for positions in combinations(range(self.chunk_bits), count):
+                    masks.append(sum(1 << position for position in positions))
+            self._flips[bits] = masks
+        return masks
+
+    def search(self, value, radius):
+        """Return ``(distance, id)`` for every id within ``radius``."""
+        masks = self.flips(radius // self.CHUNKS)
+        candidates = {}
+        for table, chunk in zip(self.tables, self.chunks(value)):
+            for mask in masks:
+                bucket = table.get(chunk ^ mask)
+                if bucket:
+                    candidates.update(bucket)
+
+        found = []
+        for id, candidate in candidates.items():
+            d = distance(value, candidate)
+            if d <= radius:
+                found.append((d, id))
+        return found
+
+
+class SimilarIndex(object):
+    """A MultiIndex over the perceptual hashes of every photo.
+
+    Each process builds its own from the database on first use. Before a
+    search, photos with ids above the last one seen are added, which picks
+    up uploads made by any process with one range scan of the primary key.
+    Deleted photos, and ids reused for other photos, are corrected when a
+    search finds the stored hash differs from the indexed one. The whole
+    index is rebuilt after SIMILAR_INDEX_MAX_AGE seconds to catch anything
+    else, such as a backfill.
+    """
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.index = MultiIndex()
+        self.hashes = {}
+        self.max_id = 0
+        self.built_at = None
+
+    def refresh(self):
+        with self.lock:
+            if self.built_at is None or time.monotonic() - self.built_at > self.max_age:
+                self.index = MultiIndex()
+                self.hashes = {}
+                self.max_id = 0
+                self.built_at = time.monotonic()
+            rows = (
+                Photo.query.filter(Photo.id > self.max_id, Photo.phash.isnot(None))
+                .with_entities(Photo.id, Photo.phash)
+                .order_by(Photo.id)
+            )
+            for id, phash in rows:
+                self.index.add(int(phash, 16), id)
+                self.hashes[id] = int(phash, 16)
+                self.max_id = id
+
+    def search(self, phash, radius):
+        """Ids within ``radius`` bits of ``phash``, closest first."""
+        self.refresh()
+        with self.lock:
+            return sorted(self.index.search(int(phash, 16), radius))
+
+    def sync(self, hashes):
+        """Bring the entries for ``{id: phash}`` up to date.
+
+        A phash of None drops the id. Others replace what was indexed under
+        the id if it differs, which happens when SQLite hands the id of a
+        deleted photo to a new one.
+        """
+        with self.lock:
+            for id, phash in hashes.items():
+                value = None if phash is None else int(phash, 16)
+                if self.hashes.get(id) == value:
+                    continue
+                old = self.hashes.pop(id, None)
+                if old is not None:
+                    self.index.discard(old, id)
+                if value is not None:
+                    self.index.add(value, id)
+                    self.hashes[id] = value
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarIndex(app.config['SIMILAR_INDEX_MAX_AGE'])
+        return _index
+
+
+def reset_index():
+    """Rebuild the index on next use, e.g. after hashes changed in bulk."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+class SimilarPhotosAPI(Resource):
+    """Near-duplicates of a photo: re-encoded, resized or lightly edited
+    copies, closest first.
+    """
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument(
+            "distance", type=inputs.int_range(0, app.config['SIMILAR_MAX_DISTANCE']),
+            default=app.config['SIMILAR_DISTANCE'], location="args"
+        )
+        self.reqparse.add_argument("limit", type=inputs.positive, location="args")
+        super(SimilarPhotosAPI, self).__init__()
+
+    def get(self, id):
+        args = self.reqparse.parse_args()
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+        photo = Photo.query.with_entities(Photo.phash).filter(Photo.id == id).first()
+        if photo is None:
+            return "Not found", 404
+        if photo.phash is None:
+            return [], 200
+
+        index = get_index()
+        matches = index.search(photo.phash, args["distance"])
+        matches = [(d, match) for d, match in matches if match != id][:limit]
+        rows = {}
+        if matches:
+            query = Photo.query.filter(Photo.id.in_([match for _, match in matches]))
+            rows = {row.id: row for row in query.with_entities(*PHOTO_COLUMNS, Photo.phash)}
+        # Photos deleted or rehashed since they were indexed, or whose id
+        # now belongs to another photo
+        current = {match: rows[match].phash if match in rows else None for _, match in matches}
+        index.sync(current)
+
+        # Distances from the stored hashes, in case the indexed ones were stale
+        value = int(photo.phash, 16)
+        found = sorted(
+            (distance(value, int(current[match], 16)), match) for _, match in matches
+            if current[match] is not None
+        )
+        found = [(d, rows[match]) for d, match in found if d <= args["distance"]]
+        photos = serialize_photos([row for _, row in found])
+        for (d, _), data in zip(found, photos):
+            data["distance"] = d
+        return photos, 200
+
+
+@app.cli.command("backfill-phash")
+@click.option("--all", "everything", is_flag=True,
+              help="Rehash every photo, not only those without a hash.")
+@click.option("--workers", type=int, default=0,
+              help="Worker processes; defaults to the number of CPUs.")
+@click.option("--batch-size", type=int, default=500, show_default=True)
+def backfill_phash(everything, workers, batch_size):
+    """Compute perceptual hashes of stored files."""
+    query = Photo.query.filter(Photo.path.isnot(None))
+    if not everything:
+        query = query.filter(Photo.phash.is_(None))
+    rows = query.with_entities(Photo.id, Photo.path).order_by(Photo.id).all()
+    if not rows:
+        click.echo("Nothing to backfill.")
+        return
+
+    # The hash is not part of any response, so versions are left alone.
+    table = Photo.__table__
+    statement = table.update().where(table.c.id == db.bindparam("_id"))
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            hashes = pool.map(read_file_phash, [path for _, path in batch], chunksize=16)
+            params = [{"_id": id, "phash": phash} for (id, _), phash in zip(batch, hashes)]
+            db.session.execute(statement, params)
+            db.session.commit()
+            done += len(batch)
+            click.echo(f"{done}/{len(rows)} photos")
+    reset_index()
+
+
+api.add_resource(SimilarPhotosAPI, "/api/v1.0/photos/<int:id>/similar", endpoint="photo_similar")
@@ -0,0 +1,311 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from contextlib import closing, contextmanager
+from werkzeug.security import safe_join
+from app import app
+from app.metrics import timed
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - boto3 is only needed for the s3 backend
+    boto3 = None
+
+    class ClientError(Exception):
+        """Same shape as botocore's, for clients built without it."""
+
+        def __init__(self, error_response, operation_name):
+            super(ClientError, self).__init__(error_response, operation_name)
+            self.response = error_response
+
+# What stat() returns for objects that are not on the local disk
+FileStat = namedtuple("FileStat", ["st_size", "st_mtime_ns"])
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def upload_root():
+    """Absolute path of UPLOAD_FOLDER.
+
+    Relative folders resolve against the application root, the same way
+    send_from_directory resolves them when files are served back.
+    """
+    folder = app.config['UPLOAD_FOLDER']
+    if not os.path.isabs(folder):
+        folder = os.path.join(app.root_path, folder)
+    return folder
+
+
+def content_path(content_hash, ext):
+    """Sharded location of a file, e.g. ``ab/cd/abcd...ef.jpg``.
+
+    Always uses forward slashes so it can be used in URLs as well.
+    """
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{ext}"
+
+
+def full_path(path):
+    """Local path of ``path`` under UPLOAD_FOLDER.
+
+    With the s3 backend only scratch files (spooled uploads, downloads being
+    resized) live there.
+    """
+    return os.path.join(upload_root(), *path.split("/"))
+
+
+@contextmanager
+def scratch_file(suffix=""):
+    """A temporary file under UPLOAD_FOLDER/.tmp, removed afterwards.
+
+    Yields its path. Keeping it on the upload volume lets LocalStorage move
+    it into place with a rename.
+    """
+    tmp_dir = full_path(".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=suffix)
+    os.close(fd)
+    try:
+        yield tmp_path
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def copy_hashed(stream, dest):
+    """Copy ``stream`` to the file ``dest`` in UPLOAD_CHUNK_SIZE chunks.
+
+    Returns the SHA-256 of the content and its first EXIF_HEADER_BYTES.
+    """
+    digest = hashlib.sha256()
+    head = bytearray()
+    head_size = app.config['EXIF_HEADER_BYTES']
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    with open(dest, "wb") as f:
+        for chunk in iter(lambda: stream.read(chunk_size), b""):
+            digest.update(chunk)
+            f.write(chunk)
+            if len(head) < head_size:
+                head += chunk[:head_size - len(head)]
+    return digest.hexdigest(), bytes(head)
+
+
+class LocalStorage(object):
+    """Files in the sharded tree under UPLOAD_FOLDER."""
+
+    name = "local"
+    # Files are sent by PhotoFile itself (or the front proxy)
+    presigned = False
+
+    def __init__(self, root):
+        self.root = root
+
+    def path(self, key):
+        """Local path of ``key``, or None if it would leave the root."""
+        return safe_join(self.root, key)
+
+    def save(self, stream, ext):
+        with scratch_file() as tmp_path:
+            content_hash, head = copy_hashed(stream, tmp_path)
+            key = content_path(content_hash, ext)
+            if not os.path.exists(self.path(key)):
+                # mkstemp creates the file owner-only; stored files are public.
+                os.chmod(tmp_path, 0o644)
+                self.put_file(tmp_path, key)
+        return content_hash, key, head
+
+    def put_file(self, local_path, key):
+        """Move a local file into storage under ``key``."""
+        dest = self.path(key)
+        if os.path.abspath(local_path) == os.path.abspath(dest):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(local_path, dest)
+
+    def stat(self, key):
+        path = self.path(key)
+        if path is None or not os.path.isfile(path):
+            return None
+        return os.stat(path)
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def read_head(self, key, size):
+        with self.open(key) as f:
+            return f.read(size)
+
+    def delete(self, key):
+        path = self.path(key)
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def local_copy(self, key):
+        """Yield a local path to read ``key`` from; here the file itself."""
+        yield self.path(key)
+
+    def url(self, key):
+        return None
+
+
+class S3Storage(object):
+    """Objects in an S3-compatible bucket, e.g. AWS S3 or MinIO.
+
+    Uploads are hashed into a scratch file before they are sent, since the
+    key depends on the hash; boto3 then streams the file up in parts. Reads
+    are redirected to presigned URLs so file bytes never pass through the
+    API.
+    """
+
+    name = "s3"
+    presigned = True
+
+    def __init__(self, client, bucket, prefix="", expiry=3600):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expiry = expiry
+
+    def object_key(self, key):
+        return self.prefix + key
+
+    def save(self, stream, ext):
+        with scratch_file() as tmp_path:
+            content_hash, head = copy_hashed(stream, tmp_path)
+            key = content_path(content_hash, ext)
+            if not self.exists(key):
+                self.put_file(tmp_path, key)
+        return content_hash, key, head
+
+    def put_file(self, local_path, key):
+        """Upload a local file under ``key`` and remove the local copy."""
+        self.client.upload_file(local_path, self.bucket, self.object_key(key))
+        os.remove(local_path)
+
+    def stat(self, key):
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if _not_found(e):
+                return None
+            raise
+        mtime_ns = int(head["LastModified"].timestamp()) * 1000000000
+        return FileStat(head["ContentLength"], mtime_ns)
+
+    def exists(self, key):
+        return self.stat(key) is not None
+
+    def open(self, key):
+        """A streaming body; read it in chunks rather than all at once."""
+        return self.client.get_object(Bucket=self.bucket, Key=self.object_key(key))["Body"]
+
+    def read_head(self, key, size):
+        body = self.client.get_object(
+            Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes=0-{size - 1}"
+        )["Body"]
+        try:
+            return body.read()
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    @contextmanager
+    def local_copy(self, key):
+        """Download ``key`` to a scratch file and yield its path."""
+        with scratch_file(suffix=os.path.splitext(key)[1]) as tmp_path:
+            with closing(self.open(key)) as body, open(tmp_path, "wb") as f:
+                shutil.copyfileobj(body, f, app.config['UPLOAD_CHUNK_SIZE'])
+            yield tmp_path
+
+    def url(self, key):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.object_key(key)},
+            ExpiresIn=self.expiry
+        )
+
+
+def _not_found(error):
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+def make_storage(name):
+    if name == "s3":
+        if boto3 is None or not app.config['S3_BUCKET']:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs boto3 and S3_BUCKET")
+        client = boto3.client(
+            "s3", endpoint_url=app.config['S3_ENDPOINT_URL'],
+            region_name=app.config['S3_REGION']
+        )
+        return S3Storage(
+            client, app.config['S3_BUCKET'], app.config['S3_PREFIX'],
+            app.config['PRESIGNED_URL_EXPIRY']
+        )
+    return LocalStorage(upload_root())
+
+
+def get_storage():
+    """The storage for the configured backend.
+
+    Rebuilt when the configuration changes and in each new process, since
+    boto3 clients must not be shared across a fork.
+    """
+    global _storage
+    signature = (
+        os.getpid(), app.config['STORAGE_BACKEND'], upload_root(), app.config['S3_BUCKET'],
+        app.config['S3_PREFIX'], app.config['S3_ENDPOINT_URL']
+    )
+    with _storage_lock:
+        if _storage is None or _storage[0] != signature:
+            _storage = (signature, make_storage(app.config['STORAGE_BACKEND']))
+        return _storage[1]
+
+
+def save_upload(stream, ext):
+    """Stream a file into content-addressed storage.
+
+    The stream is copied to a scratch file in fixed-size chunks while its
+    SHA-256 is computed, then moved into place. A file that is already
+    stored is not written twice. The first EXIF_HEADER_BYTES are kept aside
+    so metadata can be read without opening the file again. Returns
+    ``(content_hash, path, head)``.
+    """
+    with timed("file"):
+        return get_storage().save(stream, ext)
+
+
+def store_file(local_path, content_hash, ext):
+    """Move a local file whose SHA-256 is already known into storage.
+
+    For files checked on arrival, such as finalized resumable uploads, so
+    they are not copied and hashed again. A file that is already stored is
+    not written twice; the local copy is then left for the caller. Returns
+    ``(path, head)`` like save_upload.
+    """
+    with timed("file"):
+        with open(local_path, "rb") as f:
+            head = f.read(app.config['EXIF_HEADER_BYTES'])
+        key = content_path(content_hash, ext)
+        store = get_storage()
+        if not store.exists(key):
+            os.chmod(local_path, 0o644)
+            store.put_file(local_path, key)
+        return key, head
+
+
+def delete_file(path):
+    """Remove a stored file, ignoring files that are already gone."""
+    get_storage().delete(path)
@@ -0,0 +1,133 @@
+import click
+from flask_restful import Resource, reqparse, inputs
+from sqlalchemy import DDL, Date, cast, event, func
+from app import api, app, db
+from app.models import Photo, TimelineDay
+
+GRANULARITIES = {"year": 4, "month": 7, "day": 10}
+
+# Triggers keep photo_timeline in step with every insert, delete and change
+# of upload_date or public, including bulk statements that never pass
+# through the ORM. Photos without an upload_date are not counted. Migration
+# a73c5e19f4b8 installs a copy and counts the photos already stored.
+SQLITE_SCHEMA = (
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_ai AFTER INSERT ON photo
+    WHEN date(new.upload_date, 'unixepoch') IS NOT NULL BEGIN
+        INSERT INTO photo_timeline(day, public, count)
+        VALUES (date(new.upload_date, 'unixepoch'), coalesce(new.public, 0), 1)
+        ON CONFLICT(day, public) DO UPDATE SET count = count + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_ad AFTER DELETE ON photo
+    WHEN date(old.upload_date, 'unixepoch') IS NOT NULL BEGIN
+        UPDATE photo_timeline SET count = count - 1
+        WHERE day = date(old.upload_date, 'unixepoch') AND public = coalesce(old.public, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_au AFTER UPDATE OF upload_date, public ON photo
+    BEGIN
+        UPDATE photo_timeline SET count = count - 1
+        WHERE day = date(old.upload_date, 'unixepoch') AND public = coalesce(old.public, 0);
+        INSERT INTO photo_timeline(day, public, count)
+        SELECT date(new.upload_date, 'unixepoch'), coalesce(new.public, 0), 1
+        WHERE date(new.upload_date, 'unixepoch') IS NOT NULL
+        ON CONFLICT(day, public) DO UPDATE SET count = count + 1;
+    END""",
+)
+
+POSTGRESQL_SCHEMA = (
+    """CREATE OR REPLACE FUNCTION photo_timeline_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' AND OLD.upload_date IS NOT NULL THEN
+            UPDATE photo_timeline SET count = count - 1
+            WHERE day = (to_timestamp(OLD.upload_date) AT TIME ZONE 'UTC')::date
+            AND public = coalesce(OLD.public, false);
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.upload_date IS NOT NULL THEN
+            INSERT INTO photo_timeline(day, public, count)
+            VALUES ((to_timestamp(NEW.upload_date) AT TIME ZONE 'UTC')::date,
+                    coalesce(NEW.public, false), 1)
+            ON CONFLICT (day, public) DO UPDATE SET count = photo_timeline.count + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER photo_timeline_update
+    AFTER INSERT OR DELETE OR UPDATE OF upload_date, public ON photo
+    FOR EACH ROW EXECUTE PROCEDURE photo_timeline_update()""",
+)
+
+# After every table exists, since the triggers write to photo_timeline
+for statement in SQLITE_SCHEMA:
+    event.listen(db.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRESQL_SCHEMA:
+    event.listen(db.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+def upload_day(column):
+    """The UTC date of an upload_date column, as the triggers compute it."""
+    if db.engine.dialect.name == "sqlite":
+        return func.date(column, "unixepoch")
+    return cast(func.timezone("UTC", func.to_timestamp(column)), Date)
+
+
+def rebuild():
+    """Recount photo_timeline from the photo table. Returns the days counted."""
+    day = upload_day(Photo.upload_date)
+    counts = (
+        db.session.query(day, func.coalesce(Photo.public, False), func.count(Photo.id))
+        .filter(Photo.upload_date.isnot(None))
+        .group_by(day, func.coalesce(Photo.public, False))
+    )
+    table = TimelineDay.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(["day", "public", "count"], counts))
+    db.session.commit()
+    return db.session.query(func.count(func.distinct(table.c.day))).scalar()
+
+
+class TimelineAPI(Resource):
+    """Photo counts per year, month or day of upload, newest first.
+
+    One range read of the photo_timeline primary key, however many photos
+    there are.
+    """
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument(
+            "granularity", choices=tuple(GRANULARITIES), default="month", location="args"
+        )
+        self.reqparse.add_argument("public", type=inputs.boolean, location="args")
+        self.reqparse.add_argument("after", type=inputs.date, location="args")
+        self.reqparse.add_argument("before", type=inputs.date, location="args")
+        super(TimelineAPI, self).__init__()
+
+    def get(self):
+        args = self.reqparse.parse_args()
+        query = db.session.query(TimelineDay.day, func.sum(TimelineDay.count)).filter(
+            TimelineDay.count > 0
+        )
+        if args["public"] is not None:
+            query = query.filter(TimelineDay.public == args["public"])
+        if args["after"] is not None:
+            query = query.filter(TimelineDay.day >= args["after"].date())
+        if args["before"] is not None:
+            query = query.filter(TimelineDay.day < args["before"].date())
+
+        width = GRANULARITIES[args["granularity"]]
+        buckets = []
+        for day, count in query.group_by(TimelineDay.day).order_by(TimelineDay.day.desc()):
+            period = day.isoformat()[:width]
+            if buckets and buckets[-1]["period"] == period:
+                buckets[-1]["count"] += int(count)
+            else:
+                buckets.append({"period": period, "count": int(count)})
+        return buckets, 200
+
+
+@app.cli.command("timeline-rebuild")
+def timeline_rebuild():
+    """Recount the upload timeline from the photo table."""
+    click.echo(f"Counted photos on {rebuild()} days.")
+
+
+api.add_resource(TimelineAPI, "/api/v1.0/photos/timeline", endpoint="photo_timeline")
@@ -0,0 +1,167 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from PIL import Image, ImageOps
+from app import app
+
+FITS = ("contain", "cover", "fill")
+MIMETYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+EXTENSIONS = {"jpeg": "jpg", "webp": "webp", "png": "png"}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def variant_key(source, stat, width, height, fit, fmt):
+    """Identify one rendering of one version of a source file."""
+    raw = f"{source}|{stat.st_size}|{stat.st_mtime_ns}|{width}|{height}|{fit}|{fmt}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def render(source, dest, width, height, fit, fmt):
+    """Write a resized copy of ``source`` to ``dest``.
+
+    ``contain`` fits inside the box, ``cover`` fills it and crops the
+    overflow, ``fill`` stretches to the exact size. With only one dimension
+    the other follows the aspect ratio. ``contain`` never upscales.
+    """
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+
+    if width and height and fit == "cover":
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    elif width and height and fit == "fill":
+        image = image.resize((width, height), Image.LANCZOS)
+    else:
+        image.thumbnail((width or 1 << 16, height or 1 << 16), Image.LANCZOS)
+
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.save(dest, format=fmt.upper(), quality=82)
+
+
+class TransformCache(object):
+    """Rendered variants on disk, bounded by total size with LRU eviction.
+
+    The in-memory index maps each key to the size of its file, oldest use
+    first. Concurrent requests for a variant that is still rendering wait on
+    the first request's result instead of rendering it again.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._index = OrderedDict()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        # Rebuild the index from disk, least recently used first.
+        entries = []
+        for dirpath, _, filenames in os.walk(self.directory):
+            for name in filenames:
+                if name.endswith(".part"):
+                    os.remove(os.path.join(dirpath, name))
+                    continue
+                stat = os.stat(os.path.join(dirpath, name))
+                entries.append((stat.st_atime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+
+    def path(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    @property
+    def size(self):
+        return self._bytes
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def open(self, key, ext, render):
+        """Return an open file for a variant, calling ``render(dest)`` on a miss.
+
+        The file is opened while the index lock is held, so a concurrent
+        eviction can unlink it without affecting the caller.
+        """
+        name = f"{key}.{ext}"
+        while True:
+            with self._lock:
+                if name in self._index:
+                    self._index.move_to_end(name)
+                    self.hits += 1
+                    try:
+                        return open(self.path(name), "rb")
+                    except FileNotFoundError:
+                        self._forget(name)
+                pending = self._inflight.get(name)
+                owner = pending is None
+                if owner:
+                    pending = self._inflight[name] = Future()
+                    self.misses += 1
+
+            if owner:
+                return self._render(name, pending, render)
+            # Another request is rendering this variant; wait for it and then
+            # read it from the index like any other hit.
+            pending.result()
+
+    def _render(self, name, pending, render):
+        dest = self.path(name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{threading.get_ident()}.part"
+        try:
+            render(tmp)
+            os.replace(tmp, dest)
+            size = os.path.getsize(dest)
+            with self._lock:
+                self._index[name] = size
+                self._bytes += size
+                f = open(dest, "rb")
+                self._evict(keep=name)
+                del self._inflight[name]
+        except BaseException as e:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            with self._lock:
+                self._inflight.pop(name, None)
+            pending.set_exception(e)
+            raise
+        pending.set_result(dest)
+        return f
+
+    def _evict(self, keep):
+        while self._bytes > self.max_bytes and len(self._index) > 1:
+            name = next(iter(self._index))
+            if name == keep:
+                break
+            self._forget(name)
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, name):
+        self._bytes -= self._index.pop(name)
+
+
+def get_cache():
+    """The shared cache for the configured folder and byte budget."""
+    global _cache
+    directory = app.config['TRANSFORM_CACHE_FOLDER']
+    if not os.path.isabs(directory):
+        directory = os.path.join(app.root_path, directory)
+    max_bytes = app.config['TRANSFORM_CACHE_BYTES']
+
+    with _cache_lock:
+        if _cache is None or (_cache.directory, _cache.max_bytes) != (directory, max_bytes):
+            _cache = TransformCache(directory, max_bytes)
+        return _cache
@@ -0,0 +1,341 @@
+import hashlib
+import os
+import re
+import uuid
+from datetime import datetime, timedelta
+import click
+from flask import abort, request, url_for
+from flask_restful import Resource, reqparse, fields, marshal, inputs
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.http import parse_content_range_header
+from werkzeug.utils import secure_filename
+from app import api, app, db, derivatives, ingest, storage
+from app.ingest import save_photo, spooled_photo
+from app.metrics import timed
+from app.models import IngestJob, Photo, UploadSession
+from app.photo import PhotoListAPI, tag_list
+from app.serializers import serialize_photo
+
+# Values of UploadSession.status
+UPLOADING = "uploading"
+FINALIZING = "finalizing"
+DONE = "done"
+
+upload_fields = {
+    "id": fields.String(),
+    "status": fields.String(),
+    "filename": fields.String(),
+    "size": fields.Integer(),
+    "offset": fields.Integer(attribute="received"),
+    "created_at": fields.DateTime(dt_format="iso8601"),
+    "updated_at": fields.DateTime(dt_format="iso8601"),
+}
+
+
+def sha256_hex(value):
+    value = str(value).lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", value):
+        raise ValueError("Expected a SHA-256 in hex")
+    return value
+
+
+def upload_representation(upload):
+    data = marshal(upload, upload_fields)
+    data["uri"] = url_for("upload", id=upload.id)
+    data["photo"] = None if upload.photo_id is None else url_for("photo", id=upload.photo_id)
+    data["job"] = None if upload.job_id is None else url_for("job", id=upload.job_id)
+    return data
+
+
+def upload_or_404(id):
+    upload = UploadSession.query.get(id)
+    if upload is None:
+        abort(404)
+    return upload
+
+
+def append_chunk(spool_path, offset, length):
+    """Write ``length`` bytes of the request body into the spool at ``offset``.
+
+    Anything after ``offset``, left by an earlier chunk that was cut off,
+    is dropped first. The body is copied in UPLOAD_CHUNK_SIZE pieces, never
+    held whole. Returns the number of bytes written, which is short if the
+    client went away; the piece being read then is lost, the ones before it
+    are kept. They are synced to disk before this returns.
+    """
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    written = 0
+    with timed("file"), open(storage.full_path(spool_path), "r+b") as f:
+        f.seek(offset)
+        f.truncate()
+        try:
+            while written < length:
+                data = request.stream.read(min(chunk_size, length - written))
+                if not data:
+                    break
+                f.write(data)
+                written += len(data)
+        except ClientDisconnected:
+            pass
+        f.flush()
+        os.fsync(f.fileno())
+    return written
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    with timed("file"), open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def remove_spool(spool_path):
+    if spool_path is None:
+        return
+    try:
+        os.remove(storage.full_path(spool_path))
+    except FileNotFoundError:
+        pass
+
+
+class UploadListAPI(Resource):
+    """Start a resumable upload.
+
+    For large files on unreliable connections: the file is sent in chunks
+    with PUT to the returned ``uri``, each of which can be retried on its
+    own, and the upload is finalized with a POST there once complete.
+    """
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("filename", type=str, required=True, location="json")
+        self.reqparse.add_argument("size", type=inputs.positive, required=True, location="json")
+        self.reqparse.add_argument("sha256", type=sha256_hex, location="json")
+        self.reqparse.add_argument("title", type=str, location="json")
+        self.reqparse.add_argument("upload_date", type=int, location="json")
+        self.reqparse.add_argument("public", type=inputs.boolean, location="json")
+        self.reqparse.add_argument("tags", type=tag_list, location="json")
+        super(UploadListAPI, self).__init__()
+
+    def post(self):
+        args = self.reqparse.parse_args()
+        if not PhotoListAPI.allowed_filename(args["filename"]):
+            abort(400)
+        if args["size"] > app.config['RESUMABLE_UPLOAD_MAX_SIZE']:
+            abort(413)
+        tags = args["tags"] or []
+
+        filename = secure_filename(args["filename"])
+        upload = UploadSession(
+            id=uuid.uuid4().hex, status=UPLOADING, size=args["size"], received=0,
+            sha256=args["sha256"], filename=filename,
+            title=args["title"] or filename.rsplit('.', 1)[0],
+            upload_date=args["upload_date"], public=args["public"], tags=",".join(tags)
+        )
+        upload.spool_path = ingest.spool_path_for(upload.id, filename)
+        dest = storage.full_path(upload.spool_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        open(dest, "wb").close()
+
+        db.session.add(upload)
+        db.session.commit()
+        data = upload_representation(upload)
+        return data, 201, {"Location": data["uri"]}
+
+
+class UploadAPI(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("sha256", type=sha256_hex, location="json")
+        super(UploadAPI, self).__init__()
+
+    def get(self, id):
+        """Where to resume: ``offset`` is the number of bytes stored."""
+        return upload_representation(upload_or_404(id)), 200
+
+    def put(self, id):
+        """Store one chunk, sent as the raw body.
+
+        ``Content-Range: bytes <first>-<last>/<size>`` places it, and must
+        start at the current offset. Otherwise, e.g. after a lost response,
+        the answer is a 409 with the offset to resume from.
+        """
+        upload = upload_or_404(id)
+        if upload.status != UPLOADING:
+            return upload_representation(upload), 409
+        content_range = parse_content_range_header(request.headers.get("Content-Range"))
+        if (
+            content_range is None
+            or content_range.units != "bytes"
+            or content_range.start is None
+            or content_range.length != upload.size
+        ):
+            abort(400)
+        start, length = content_range.start, content_range.stop - content_range.start
+        if request.content_length is not None and request.content_length != length:
+            abort(400)
+        if start != upload.received:
+            return upload_representation(upload), 409
+
+        written = append_chunk(upload.spool_path, start, length)
+        # Moved only from the offset this chunk started at, so of two
+        # requests sending the same chunk at once only one counts it.
+        moved = (
+            UploadSession.query.filter_by(id=id, received=start)
+            .update({"received": start + written, "updated_at": datetime.utcnow()},
+                    synchronize_session=False)
+        )
+        db.session.commit()
+        if not moved:
+            return upload_representation(upload), 409
+        if written < length:
+            # The body ended early; what did arrive is kept.
+            abort(400)
+        return upload_representation(upload), 200
+
+    def post(self, id):
+        """Finalize: check the SHA-256 of the file and store it as a photo.
+
+        Answers like a direct upload: 201 with the photo, 200 if the same
+        file is already stored, or 202 with a job in async ingest mode.
+        Finalizing again gives the same answer, or a 409 while another
+        request is still finalizing. If the checksum does not match, the
+        upload is reset to offset 0 to be sent again.
+        """
+        upload = upload_or_404(id)
+        if upload.status == DONE:
+            return self.finished(upload)
+        if upload.status != UPLOADING or upload.received != upload.size:
+            return upload_representation(upload), 409
+        expected = self.reqparse.parse_args()["sha256"] or upload.sha256
+        if expected is None:
+            abort(400)
+
+        spool = storage.full_path(upload.spool_path)
+        try:
+            actual = file_sha256(spool)
+        except FileNotFoundError:
+            # Finalized by a concurrent request since the status was read
+            return self.superseded(id)
+        if actual != expected:
+            open(spool, "wb").close()
+            upload.received = 0
+            db.session.commit()
+            data = upload_representation(upload)
+            data["message"] = "Checksum mismatch; send the file again"
+            return data, 400
+
+        if not self.claim(id):
+            return self.superseded(id)
+        spool_path = upload.spool_path
+
+        if app.config['INGEST_MODE'] == "async":
+            # The job takes over the spool file and commits the upload with it.
+            upload.spool_path = None
+            upload.status = DONE
+            upload.job_id = upload.id
+            job = ingest.queue(
+                upload.id, spool_path, upload.filename, upload.title, upload.upload_date,
+                upload.public, upload.tags
+            )
+            data = ingest.job_representation(job)
+            return data, 202, {"Location": data["uri"]}
+
+        try:
+            p = spooled_photo(
+                spool_path, actual, upload.filename, upload.title, upload.upload_date,
+                upload.public
+            )
+            p, created = save_photo(p, upload.tags)
+        except Exception:
+            # Let the client finalize again
+            db.session.rollback()
+            self.release(id, spool_path)
+            raise
+        upload.status = DONE
+        upload.photo_id = p.id
+        upload.spool_path = None
+        db.session.commit()
+        # Moved into storage, unless the file was stored already
+        remove_spool(spool_path)
+        if not created:
+            return serialize_photo(p), 200
+
+        derivatives.enqueue(p.id, p.path)
+        return serialize_photo(p), 201
+
+    @staticmethod
+    def claim(id):
+        """Mark the upload as finalizing, unless a concurrent request has.
+
+        Committed right away, so the row is not held while the file is
+        stored; a second request finalizing at the same time matches
+        nothing and leaves the photo to the first.
+        """
+        claimed = (
+            UploadSession.query.filter_by(id=id, status=UPLOADING)
+            .update({"status": FINALIZING, "updated_at": datetime.utcnow()},
+                    synchronize_session=False)
+        )
+        db.session.commit()
+        return claimed == 1
+
+    @staticmethod
+    def release(id, spool_path):
+        """Hand an upload whose finalize failed back to the client.
+
+        If the file already left the spool, it has to be sent again.
+        """
+        values = {"status": UPLOADING}
+        spool = storage.full_path(spool_path)
+        if not os.path.exists(spool):
+            open(spool, "wb").close()
+            values["received"] = 0
+        UploadSession.query.filter_by(id=id, status=FINALIZING).update(
+            values, synchronize_session=False
+        )
+        db.session.commit()
+
+    def superseded(self, id):
+        """Answer a finalize that another request got to first."""
+        db.session.rollback()
+        upload = upload_or_404(id)
+        if upload.status == DONE:
+            return self.finished(upload)
+        return upload_representation(upload), 409
+
+    @staticmethod
+    def finished(upload):
+        if upload.job_id is not None:
+            data = ingest.job_representation(IngestJob.query.get_or_404(upload.job_id))
+            return data, 202, {"Location": data["uri"]}
+        photo = Photo.query.get(upload.photo_id)
+        if photo is None:
+            return "Not found", 404
+        return serialize_photo(photo), 200
+
+    def delete(self, id):
+        """Abandon an upload and remove what was sent."""
+        upload = upload_or_404(id)
+        remove_spool(upload.spool_path)
+        db.session.delete(upload)
+        db.session.commit()
+        return {"message": "Successfully deleted"}, 200
+
+
+@app.cli.command("uploads-expire")
+def uploads_expire():
+    """Remove upload sessions idle for longer than UPLOAD_SESSION_TTL."""
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['UPLOAD_SESSION_TTL'])
+    uploads = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in uploads:
+        remove_spool(upload.spool_path)
+        db.session.delete(upload)
+    db.session.commit()
+    click.echo(f"Removed {len(uploads)} upload sessions.")
+
+
+api.add_resource(UploadListAPI, "/api/v1.0/uploads", endpoint="uploads")
+api.add_resource(UploadAPI, "/api/v1.0/uploads/<id>", endpoint="upload")
@@ -1,15 +1,152 @@
-from app import api
-from flask_restful import Resource
+from flask import abort, url_for
+from flask_restful import Resource, reqparse, fields, marshal, inputs
+from sqlalchemy.exc import IntegrityError
+from app import api, app, cache, db
+from app.models import Photo, User
+from app.pagination import paginate_by_id
+from app.photo import PhotoListAPI, add_filter_arguments
+
+# Email and the password hash are never sent back
+user_fields = {
+    "id": fields.Integer(),
+    "username": fields.String(),
+    "display_name": fields.String(),
+    "uri": fields.Url("user"),
+}
+
+
+def user_representation(user, photo_count):
+    data = marshal(user, user_fields)
+    data["photo_count"] = photo_count
+    data["photos"] = url_for("user_photos", id=user.id)
+    return data
+
+
+def user_or_404(id):
+    row = User.with_photo_counts().filter(User.id == id).first()
+    if row is None:
+        abort(404)
+    return row
+
+
+class UserListAPI(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("username", type=str, required=True, location="json")
+        self.reqparse.add_argument("email", type=str, required=True, location="json")
+        self.reqparse.add_argument("display_name", type=str, location="json")
+        self.reqparse.add_argument("password", type=str, required=True, location="json")
+
+        self.list_reqparse = reqparse.RequestParser()
+        self.list_reqparse.add_argument("limit", type=inputs.positive, location="args")
+        self.list_reqparse.add_argument("cursor", type=str, location="args")
+        super(UserListAPI, self).__init__()
+
+    def get(self):
+        """Users in id order, each with its photo count, in one query per page."""
+        args = self.list_reqparse.parse_args()
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+        try:
+            rows, next_cursor = paginate_by_id(
+                User.with_photo_counts(), User.id, args["cursor"], limit
+            )
+        except ValueError:
+            abort(400)
+
+        headers = {}
+        if next_cursor is not None:
+            next_url = url_for("users", cursor=next_cursor, limit=limit)
+            headers["Link"] = f'<{next_url}>; rel="next"'
+            headers["X-Next-Cursor"] = next_cursor
+        return [user_representation(user, count) for user, count in rows], 200, headers
+
+    def post(self):
+        args = self.reqparse.parse_args()
+        user = User(
+            username=args["username"], email=args["email"], display_name=args["display_name"]
+        )
+        user.set_password(args["password"])
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The username or email is taken
+            db.session.rollback()
+            abort(409)
+        return user_representation(user, 0), 201
 
 
 class UserAPI(Resource):
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("email", type=str, location="json")
+        self.reqparse.add_argument("display_name", type=str, location="json")
+        self.reqparse.add_argument("password", type=str, location="json")
+        super(UserAPI, self).__init__()
+
     def get(self, id):
-        pass
+        user, photo_count = user_or_404(id)
+        return user_representation(user, photo_count), 200
 
     def put(self, id):
-        pass
+        user, photo_count = user_or_404(id)
+        args = self.reqparse.parse_args()
+        if all(val is None for val in args.values()):
+            abort(400)
+
+        password = args.pop("password")
+        if password is not None:
+            user.set_password(password)
+        for k, v in args.items():
+            if v is not None:
+                setattr(user, k, v)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            abort(409)
+        return user_representation(user, photo_count), 200
 
     def delete(self, id):
-        pass
+        """Delete a user. Their photos are kept, without an owner."""
+        user = User.query.get(id)
+        if user is None:
+            return "Not found", 404
+        owned = Photo.query.filter_by(user_id=user.id).with_entities(Photo.id)
+        photo_ids = [photo_id for photo_id, in owned]
+        if photo_ids:
+            Photo.bulk_update(photo_ids, {"user_id": None})
+        db.session.delete(user)
+        db.session.commit()
+        return {"message": "Successfully deleted"}, 200
+
+
+class UserPhotosAPI(Resource):
+    """A user's photos, newest first, read from the (user_id, upload_date, id)
+    index with keyset pagination.
+    """
+
+    def __init__(self):
+        self.reqparse = reqparse.RequestParser()
+        self.reqparse.add_argument("limit", type=inputs.positive, location="args")
+        self.reqparse.add_argument("cursor", type=str, location="args")
+        add_filter_arguments(self.reqparse)
+        super(UserPhotosAPI, self).__init__()
+
+    def get(self, id):
+        # Checked outside the cache so a deleted user never serves a stale page
+        if User.query.get(id) is None:
+            return "Not found", 404
+        args = self.reqparse.parse_args()
+        args["user_id"] = id
+        limit = min(args["limit"] or app.config['PAGE_SIZE'], app.config['MAX_PAGE_SIZE'])
+
+        return cache.cached(
+            lambda: PhotoListAPI.page(args, limit, "user_photos", id=id),
+            lambda photos: [cache.LIST_TAG] + [cache.photo_tag(photo["id"]) for photo in photos]
+        )
+
 
-api.add_resource(UserAPI, "/photos/api/v1.0/user", endpoint="user")
+api.add_resource(UserListAPI, "/api/v1.0/users", endpoint="users")
+api.add_resource(UserAPI, "/api/v1.0/users/<int:id>", endpoint="user")
+api.add_resource(UserPhotosAPI, "/api/v1.0/users/<int:id>/photos", endpoint="user_photos")
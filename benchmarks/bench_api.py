@@ -0,0 +1,317 @@
+"""Measure API throughput and latency against a seeded database.
+
+    python -m benchmarks.bench_api --rows 100000 --output results.json
+    python -m benchmarks.bench_api --transport wsgi --concurrency 4
+    python -m benchmarks.bench_api --compare results.json
+
+Seeds ROWS photos into a fresh SQLite file, with FILES synthetic JPEGs in
+content-addressed storage shared between them. Then it times each scenario
+through the Flask test client or a real threaded WSGI server. Results are
+printed as JSON. With --compare, each scenario also reports its change
+against an earlier result file.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+from io import BytesIO
+from PIL import Image
+from werkzeug.serving import WSGIRequestHandler, make_server
+from app import app, db, storage
+from app.models import Photo
+from app.pagination import encode_cursor
+
+SCENARIOS = ("list", "list_pages", "detail", "update", "file", "upload", "delete")
+
+
+def make_jpeg(seed):
+    """A distinct 256x192 JPEG for every seed."""
+    noise = random.Random(seed).randbytes(32 * 24 * 3)
+    image = Image.frombytes("RGB", (32, 24), noise).resize((256, 192))
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def seed(rows, files, batch_size=10000):
+    """Insert ``rows`` photos, the first ``files`` of them with real files."""
+    paths = []
+    for i in range(files):
+        content_hash, path, _ = storage.save_upload(BytesIO(make_jpeg(i)), "jpg")
+        paths.append((content_hash, path))
+
+    table = Photo.__table__
+    now = datetime.utcnow()
+    for start in range(0, rows, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, rows)):
+            content_hash, path = paths[i] if i < files else (None, f"photo{i}.jpg")
+            batch.append({
+                "title": f"Photo {i}", "upload_date": 1500000000 + i * 60,
+                "public": i % 3 != 0, "filename": f"photo{i}.jpg", "path": path,
+                "content_hash": content_hash, "width": 256, "height": 192,
+                "version": 1, "updated_at": now,
+            })
+        db.session.execute(table.insert(), batch)
+        db.session.commit()
+    return [path for _, path in paths]
+
+
+class TestClientTransport(object):
+    """Requests through the Flask test client, one thread."""
+
+    name = "client"
+
+    def __init__(self):
+        self.client = app.test_client()
+
+    def request(self, method, url, body=None, headers=None):
+        resp = self.client.open(url, method=method, data=body, headers=headers, buffered=True)
+        resp.get_data()
+        return resp.status_code
+
+    def close(self):
+        pass
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class WSGITransport(object):
+    """Requests over HTTP to a threaded WSGI server on a local port."""
+
+    name = "wsgi"
+
+    def __init__(self):
+        self.server = make_server(
+            "127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler
+        )
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.local = threading.local()
+
+    def request(self, method, url, body=None, headers=None):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection("127.0.0.1", self.server.port)
+        conn.request(method, url, body=body, headers=headers or {})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status
+
+    def close(self):
+        self.server.shutdown()
+
+
+def multipart(fields, files):
+    boundary = f"bench{random.getrandbits(64):x}"
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            .encode("utf-8")
+        )
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\nContent-Type: image/jpeg\r\n\r\n'.encode("utf-8")
+            + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def scenario_requests(name, rows, paths, count):
+    """Yield the (method, url, body, headers) of ``count`` requests."""
+    rng = random.Random(name)
+    if name == "list":
+        for _ in range(count):
+            yield "GET", "/api/v1.0/photos?limit=50", None, None
+    elif name == "list_pages":
+        # Pages from random points of the timeline, through keyset cursors
+        for _ in range(count):
+            upload_date = 1500000000 + rng.randrange(rows) * 60
+            cursor = _cursor(upload_date)
+            yield "GET", f"/api/v1.0/photos?limit=50&cursor={cursor}", None, None
+    elif name == "detail":
+        for _ in range(count):
+            yield "GET", f"/api/v1.0/photos/{rng.randrange(1, rows + 1)}", None, None
+    elif name == "update":
+        for i in range(count):
+            body = json.dumps({"title": f"Renamed {i}"})
+            yield ("PUT", f"/api/v1.0/photos/{rng.randrange(1, rows + 1)}", body,
+                   {"Content-Type": "application/json"})
+    elif name == "file":
+        for _ in range(count):
+            yield "GET", f"/static/uploads/{rng.choice(paths)}", None, None
+    elif name == "upload":
+        for i in range(count):
+            body, headers = multipart(
+                {"title": f"Upload {i}", "public": "true"},
+                {"file": ("upload.jpg", make_jpeg(10 ** 6 + i))}
+            )
+            yield "POST", "/api/v1.0/photos", body, headers
+    elif name == "delete":
+        # The newest rows, so the other scenarios keep their data
+        for i in range(count):
+            yield "DELETE", f"/api/v1.0/photos/{rows - i}", None, None
+
+
+def _cursor(upload_date):
+    return encode_cursor(upload_date, (upload_date - 1500000000) // 60 + 1)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(transport, requests, concurrency):
+    requests = list(requests)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def work(chunk):
+        for method, url, body, headers in chunk:
+            start = time.perf_counter()
+            status = transport.request(method, url, body, headers)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                if status >= 400:
+                    errors.append(status)
+
+    started = time.perf_counter()
+    if concurrency == 1:
+        work(requests)
+    else:
+        threads = [
+            threading.Thread(target=work, args=(requests[i::concurrency],))
+            for i in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "per_second": round(len(latencies) / wall, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(results, baseline):
+    """Add the change in throughput and p50 against an earlier run."""
+    for name, current in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        current["vs_baseline"] = {
+            "per_second": round(current["per_second"] / before["per_second"] - 1, 3),
+            "p50_ms": round(current["p50_ms"] / before["p50_ms"] - 1, 3),
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario")
+    parser.add_argument("--transport", choices=("client", "wsgi"), default="client")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Client threads; wsgi transport only")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--cache", choices=("none", "memory"), default="none",
+                        help="Response cache backend while measuring")
+    parser.add_argument("--output", help="Also write the results to this file")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.transport == "client" and args.concurrency != 1:
+        parser.error("--concurrency needs --transport wsgi")
+    if "delete" in scenarios and args.requests >= args.rows - args.files:
+        parser.error("--requests must be smaller than --rows minus --files to delete")
+
+    directory = tempfile.mkdtemp()
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(directory, "bench.db"),
+        UPLOAD_FOLDER=os.path.join(directory, "uploads"),
+        CACHE_BACKEND=args.cache,
+        METRICS_ENABLED=False,
+        DERIVATIVE_WORKERS=0,
+        INGEST_MODE="sync",
+    )
+    transport = None
+    try:
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            paths = seed(args.rows, args.files)
+            seed_seconds = time.perf_counter() - started
+            db.session.remove()
+
+        transport = TestClientTransport() if args.transport == "client" else WSGITransport()
+        results = {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "rows": args.rows,
+            "files": args.files,
+            "transport": transport.name,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+            "seed_seconds": round(seed_seconds, 2),
+            "scenarios": {},
+        }
+        for name in scenarios:
+            requests = scenario_requests(name, args.rows, paths, args.requests)
+            results["scenarios"][name] = run_scenario(transport, requests, args.concurrency)
+    finally:
+        if transport is not None:
+            transport.close()
+        shutil.rmtree(directory)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Measure photo list reads while other processes keep writing.
+
+    python -m benchmarks.bench_concurrency --readers 4 --writers 2 --seconds 5
+
+Runs the same load twice against a fresh SQLite file: once with SQLite's
+defaults (rollback journal, no pragmas) and once with SQLITE_PRAGMAS. Each
+reader and writer is its own process, like gunicorn workers.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from sqlalchemy.exc import OperationalError
+from app import app, db
+from app.models import Photo
+
+
+def seed(rows):
+    db.session.bulk_insert_mappings(Photo, [
+        {"title": f"Photo {i}", "upload_date": 1589328000 + i, "version": 1,
+         "public": bool(i % 2), "filename": f"photo{i}.jpg"}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def reader(deadline, results):
+    db.engine.dispose()
+    client = app.test_client()
+    latencies, errors = [], 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            resp = client.get("/api/v1.0/photos?limit=50")
+            ok = resp.status_code == 200
+        except OperationalError:
+            ok = False
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            errors += 1
+    results.put(("read", latencies, errors))
+
+
+def writer(deadline, results):
+    db.engine.dispose()
+    latencies, errors, i = [], 0, 0
+    with app.app_context():
+        while time.time() < deadline:
+            i += 1
+            start = time.perf_counter()
+            try:
+                db.session.add(Photo(f"Upload {os.getpid()}-{i}", int(time.time()), True, "new.jpg"))
+                db.session.commit()
+                latencies.append(time.perf_counter() - start)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    results.put(("write", latencies, errors))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args, pragmas):
+    directory = tempfile.mkdtemp()
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(directory, "bench.db")
+    app.config["SQLITE_PRAGMAS"] = pragmas
+    try:
+        db.create_all()
+        seed(args.rows)
+        db.session.remove()
+        db.engine.dispose()
+
+        results = multiprocessing.Queue()
+        deadline = time.time() + args.seconds
+        workers = [
+            multiprocessing.Process(target=reader, args=(deadline, results))
+            for _ in range(args.readers)
+        ] + [
+            multiprocessing.Process(target=writer, args=(deadline, results))
+            for _ in range(args.writers)
+        ]
+        for process in workers:
+            process.start()
+        collected = [results.get() for _ in workers]
+        for process in workers:
+            process.join()
+    finally:
+        shutil.rmtree(directory)
+
+    summary = {}
+    for kind in ("read", "write"):
+        latencies = [t for k, times, _ in collected if k == kind for t in times]
+        summary[kind] = {
+            "per_second": round(len(latencies) / args.seconds, 1),
+            "p50_ms": round(percentile(latencies, 0.5) * 1000, 2) if latencies else None,
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+            "errors": sum(errors for k, _, errors in collected if k == kind),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    # Measure the database, not the response cache.
+    app.config["CACHE_BACKEND"] = "none"
+    tuned = app.config["SQLITE_PRAGMAS"]
+    print(json.dumps({
+        "rows": args.rows,
+        "readers": args.readers,
+        "writers": args.writers,
+        "seconds": args.seconds,
+        "defaults": run(args, ()),
+        "tuned": run(args, tuned),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
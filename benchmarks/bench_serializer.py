@@ -0,0 +1,60 @@
+"""Compare flask_restful.marshal with the precompiled photo serializer.
+
+    python -m benchmarks.bench_serializer --rows 20000
+"""
+import argparse
+import json
+import time
+from flask_restful import marshal
+from app import app, db
+from app.models import Photo
+from app.photo import photo_fields
+from app.serializers import PHOTO_COLUMNS, serialize_photos
+
+
+def seed(rows):
+    db.session.bulk_insert_mappings(Photo, [
+        {"title": f"Photo {i}", "upload_date": 1589328000 + i,
+         "public": bool(i % 2), "filename": f"photo{i}.jpg"}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.create_all()
+    seed(args.rows)
+
+    with app.test_request_context():
+        marshal_time = best_of(args.repeat, lambda: [
+            marshal(photo, photo_fields) for photo in Photo.query.all()
+        ])
+        fast_time = best_of(args.repeat, lambda: serialize_photos(
+            Photo.query.with_entities(*PHOTO_COLUMNS).all()
+        ))
+
+    print(json.dumps({
+        "rows": args.rows,
+        "marshal_us_per_row": round(marshal_time / args.rows * 1e6, 2),
+        "fast_us_per_row": round(fast_time / args.rows * 1e6, 2),
+        "speedup": round(marshal_time / fast_time, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
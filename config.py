@@ -7,6 +7,95 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = False
+    # Keep each request's SQL so the slow-request log can show it
+    SQLALCHEMY_RECORD_QUERIES = os.environ.get('SQLALCHEMY_RECORD_QUERIES') == '1'
+    # Run on every new SQLite connection, in this order. WAL lets readers
+    # carry on while a write commits; busy_timeout makes writers queue for
+    # the lock instead of failing. cache_size is in KiB when negative.
+    SQLITE_PRAGMAS = (
+        ('busy_timeout', 5000),
+        ('journal_mode', 'WAL'),
+        ('synchronous', 'NORMAL'),
+        ('cache_size', -64000),
+        ('mmap_size', 256 * 1024 * 1024),
+    )
+    # Connection pool for PostgreSQL, and for file-based SQLite so each
+    # connection keeps its page cache between requests
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 5))
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW', 10))
+    DATABASE_POOL_TIMEOUT = 30
+    DATABASE_POOL_RECYCLE = 1800
+    # Where uploads and derivatives are kept: 'local' (UPLOAD_FOLDER) or 's3'
+    # (any S3-compatible service; needs boto3). Credentials for s3 come from
+    # the usual AWS_* variables or boto3 configuration.
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    # Set for MinIO and other services that are not AWS
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+    S3_REGION = os.environ.get('S3_REGION')
+    # Lifetime in seconds of the URLs file requests are redirected to on s3
+    PRESIGNED_URL_EXPIRY = 3600
+    # Holds the files with the local backend, and scratch files with either
     UPLOAD_FOLDER = './static/uploads'
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    # Bytes kept from the start of each upload for reading EXIF; JPEG's
+    # APP1 segment is at most 64 KiB but may follow other segments.
+    EXIF_HEADER_BYTES = 256 * 1024
+    BATCH_UPLOAD_LIMIT = 500
+    # Resumable uploads (/api/v1.0/uploads): the largest file accepted, and
+    # how long an idle session is kept before 'flask uploads-expire'
+    # removes it
+    RESUMABLE_UPLOAD_MAX_SIZE = 512 * 1024 * 1024
+    UPLOAD_SESSION_TTL = 24 * 3600
+    # How upload files are sent: 'direct', 'x-accel-redirect' or 'x-sendfile'
+    FILE_SERVING = os.environ.get('FILE_SERVING', 'direct')
+    # nginx 'internal' location that maps onto UPLOAD_FOLDER
+    X_ACCEL_REDIRECT_PREFIX = '/protected/uploads'
+    # 'sync' stores uploads during the request; 'async' spools them, answers
+    # 202 with a job id and leaves the rest to INGEST_WORKERS threads
+    # (0 runs the job inside the request)
+    INGEST_MODE = os.environ.get('INGEST_MODE', 'sync')
+    INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+    DERIVATIVE_WIDTHS = (320, 640, 1280)
+    DERIVATIVE_FORMATS = ('webp', 'jpeg')
+    # Size of the resize process pool; 0 renders inline during the request
+    DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', 2))
+    TRANSFORM_CACHE_FOLDER = './static/transforms'
+    TRANSFORM_CACHE_BYTES = 512 * 1024 * 1024
+    TRANSFORM_MAX_DIMENSION = 4096
+    # Response cache for photo reads: 'memory' (per process), 'redis'
+    # (shared, needs the redis package and CACHE_URL) or 'none'
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')
+    CACHE_URL = os.environ.get('CACHE_URL')
+    CACHE_TTL = 300
+    CACHE_MAX_ENTRIES = 1024
+    # gzip, or Brotli when the brotli package is installed, for JSON
+    # responses of at least COMPRESS_MIN_SIZE bytes. Cached responses keep
+    # their compressed bodies. Turn off when a proxy in front compresses.
+    COMPRESS_RESPONSES = os.environ.get('COMPRESS_RESPONSES', '1') == '1'
+    COMPRESS_MIMETYPES = {'application/json'}
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    COMPRESS_BROTLI_QUALITY = 5
+    # Request timing, Server-Timing headers and /metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED') == '1'
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    # Requests slower than this, or running more queries, are logged
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))
+    QUERY_COUNT_WARNING = 20
+    # Bits two perceptual hashes may differ by for /photos/<id>/similar. 10
+    # of 64 catches resized and re-encoded copies; wider searches visit much
+    # more of the index, so they are capped.
+    SIMILAR_DISTANCE = 10
+    SIMILAR_MAX_DISTANCE = 16
+    # Seconds before a process rebuilds its near-duplicate index from scratch
+    SIMILAR_INDEX_MAX_AGE = 3600
+    PAGE_SIZE = 50
+    MAX_PAGE_SIZE = 500
+    EXPORT_BATCH_SIZE = 500
+    BULK_LIMIT = 1000
+    # Tags used by at most this many photos are filtered through the tag
+    # index; more common tags are checked while walking the photo list.
+    TAG_INDEX_THRESHOLD = 2000
@@ -0,0 +1,103 @@
+"""photo timeline
+
+Revision ID: a73c5e19f4b8
+Revises: d4f8a2b61e37
+Create Date: 2026-10-20 15:12:37.914462
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a73c5e19f4b8'
+down_revision = 'd4f8a2b61e37'
+branch_labels = None
+depends_on = None
+
+# Mirrors app.timeline. Like the title search triggers, the SQLite ones are
+# dropped when a batch migration recreates 'photo'; rerun them after one.
+SQLITE_SCHEMA = (
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_ai AFTER INSERT ON photo
+    WHEN date(new.upload_date, 'unixepoch') IS NOT NULL BEGIN
+        INSERT INTO photo_timeline(day, public, count)
+        VALUES (date(new.upload_date, 'unixepoch'), coalesce(new.public, 0), 1)
+        ON CONFLICT(day, public) DO UPDATE SET count = count + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_ad AFTER DELETE ON photo
+    WHEN date(old.upload_date, 'unixepoch') IS NOT NULL BEGIN
+        UPDATE photo_timeline SET count = count - 1
+        WHERE day = date(old.upload_date, 'unixepoch') AND public = coalesce(old.public, 0);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_timeline_au AFTER UPDATE OF upload_date, public ON photo
+    BEGIN
+        UPDATE photo_timeline SET count = count - 1
+        WHERE day = date(old.upload_date, 'unixepoch') AND public = coalesce(old.public, 0);
+        INSERT INTO photo_timeline(day, public, count)
+        SELECT date(new.upload_date, 'unixepoch'), coalesce(new.public, 0), 1
+        WHERE date(new.upload_date, 'unixepoch') IS NOT NULL
+        ON CONFLICT(day, public) DO UPDATE SET count = count + 1;
+    END""",
+)
+
+POSTGRESQL_SCHEMA = (
+    """CREATE OR REPLACE FUNCTION photo_timeline_update() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP <> 'INSERT' AND OLD.upload_date IS NOT NULL THEN
+            UPDATE photo_timeline SET count = count - 1
+            WHERE day = (to_timestamp(OLD.upload_date) AT TIME ZONE 'UTC')::date
+            AND public = coalesce(OLD.public, false);
+        END IF;
+        IF TG_OP <> 'DELETE' AND NEW.upload_date IS NOT NULL THEN
+            INSERT INTO photo_timeline(day, public, count)
+            VALUES ((to_timestamp(NEW.upload_date) AT TIME ZONE 'UTC')::date,
+                    coalesce(NEW.public, false), 1)
+            ON CONFLICT (day, public) DO UPDATE SET count = photo_timeline.count + 1;
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER photo_timeline_update
+    AFTER INSERT OR DELETE OR UPDATE OF upload_date, public ON photo
+    FOR EACH ROW EXECUTE PROCEDURE photo_timeline_update()""",
+)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('photo_timeline',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('public', sa.Boolean(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'public')
+    )
+    # ### end Alembic commands ###
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        schema = SQLITE_SCHEMA
+        day = "date(upload_date, 'unixepoch')"
+    elif dialect == 'postgresql':
+        schema = POSTGRESQL_SCHEMA
+        day = "(to_timestamp(upload_date) AT TIME ZONE 'UTC')::date"
+    else:
+        return
+    # Count the photos that are already there.
+    op.execute(f"""INSERT INTO photo_timeline(day, public, count)
+        SELECT {day}, coalesce(public, {"0" if dialect == "sqlite" else "false"}), count(*)
+        FROM photo WHERE upload_date IS NOT NULL GROUP BY 1, 2""")
+    for statement in schema:
+        op.execute(statement)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS photo_timeline_au")
+        op.execute("DROP TRIGGER IF EXISTS photo_timeline_ad")
+        op.execute("DROP TRIGGER IF EXISTS photo_timeline_ai")
+    elif dialect == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS photo_timeline_update ON photo")
+        op.execute("DROP FUNCTION IF EXISTS photo_timeline_update()")
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('photo_timeline')
+    # ### end Alembic commands ###
@@ -0,0 +1,55 @@
+"""photo title fts
+
+Revision ID: b81f5d3e7a92
+Revises: 47c6a1e9b2f8
+Create Date: 2026-10-19 10:15:44.382019
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f5d3e7a92'
+down_revision = '47c6a1e9b2f8'
+branch_labels = None
+depends_on = None
+
+# Mirrors app.search.FTS_SCHEMA. Note that batch_alter_table on 'photo'
+# recreates the table and drops these triggers; rerun them after any such
+# migration.
+FTS_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS photo_fts USING fts5(
+        title, content='photo', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_ai AFTER INSERT ON photo BEGIN
+        INSERT INTO photo_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_ad AFTER DELETE ON photo BEGIN
+        INSERT INTO photo_fts(photo_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS photo_fts_au AFTER UPDATE OF title ON photo BEGIN
+        INSERT INTO photo_fts(photo_fts, rowid, title) VALUES ('delete', old.id, old.title);
+        INSERT INTO photo_fts(rowid, title) VALUES (new.id, new.title);
+    END""",
+)
+
+
+def upgrade():
+    # Other databases search with LIKE and need no schema changes.
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in FTS_SCHEMA:
+        op.execute(statement)
+    # Index the titles that are already there.
+    op.execute("INSERT INTO photo_fts(photo_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute("DROP TRIGGER IF EXISTS photo_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS photo_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS photo_fts_ai")
+    op.execute("DROP TABLE IF EXISTS photo_fts")
@@ -24,3 +24,60 @@ class AllPhotosTestCase(unittest.TestCase):
         self.assertIsInstance(resp.json, list)
         self.assertEqual(2, len(resp.json))
         self.assertTrue(resp.status_code == 200)
+
+
+class PaginatedPhotosTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        photos = [
+            Photo(f"Photo{i}", 1000 + i, i % 2, f"photo{i}.jpg") for i in range(5)
+        ]
+        photos.append(Photo("Undated", None, 1, 'undated.jpg'))
+        photos[0].user_id = 7
+        db.session.add_all(photos)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def walk(self, url):
+        titles = []
+        while url:
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, 200)
+            titles += [photo["title"] for photo in resp.json]
+            link = resp.headers.get("Link")
+            url = link[1:link.index(">")] if link else None
+        return titles
+
+    def test_newest_first(self):
+        resp = self.client.get("/api/v1.0/photos?limit=2")
+        self.assertEqual(["Photo4", "Photo3"], [p["title"] for p in resp.json])
+        self.assertIn("X-Next-Cursor", resp.headers)
+
+    def test_walk_all_pages(self):
+        titles = self.walk("/api/v1.0/photos?limit=2")
+        self.assertEqual(
+            ["Photo4", "Photo3", "Photo2", "Photo1", "Photo0", "Undated"], titles
+        )
+
+    def test_last_page_has_no_cursor(self):
+        resp = self.client.get("/api/v1.0/photos?limit=10")
+        self.assertEqual(6, len(resp.json))
+        self.assertNotIn("Link", resp.headers)
+
+    def test_filter_public(self):
+        titles = self.walk("/api/v1.0/photos?limit=1&public=true")
+        self.assertEqual(["Photo3", "Photo1", "Undated"], titles)
+
+    def test_filter_user(self):
+        resp = self.client.get("/api/v1.0/photos?user_id=7")
+        self.assertEqual(["Photo0"], [p["title"] for p in resp.json])
+
+    def test_bad_cursor(self):
+        resp = self.client.get("/api/v1.0/photos?cursor=nonsense")
+        self.assertEqual(resp.status_code, 400)
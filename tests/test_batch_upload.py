@@ -0,0 +1,108 @@
+import json
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from sqlalchemy import event
+from app import app, db
+from app.models import Photo
+
+
+class BatchUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def batch(self, files, metadata=None):
+        data = {"files": [(BytesIO(content), name) for content, name in files]}
+        if metadata is not None:
+            data["metadata"] = json.dumps(metadata)
+        return self.client.post(
+            "/api/v1.0/photos/batch", buffered=True,
+            content_type="multipart/form-data", data=data
+        )
+
+    def test_batch_upload(self):
+        resp = self.batch(
+            [(b'one', 'one.jpg'), (b'two', 'two.png')],
+            [{"title": "First", "public": True, "upload_date": 100}, {"title": "Second"}]
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([201, 201], [r["status"] for r in resp.json])
+        self.assertEqual("First", resp.json[0]["photo"]["title"])
+        self.assertTrue(resp.json[0]["photo"]["public"])
+        self.assertFalse(resp.json[1]["photo"]["public"])
+        self.assertEqual(2, Photo.query.count())
+
+    def test_single_commit(self):
+        commits = []
+        listener = lambda session: commits.append(session)
+        event.listen(db.session, "after_commit", listener)
+        try:
+            self.batch([(bytes([i]) * 10, f'{i}.jpg') for i in range(20)])
+        finally:
+            event.remove(db.session, "after_commit", listener)
+        # One for the inserts plus one per derivative status update
+        self.assertEqual(21, len(commits))
+        self.assertEqual(20, Photo.query.count())
+
+    def test_title_defaults_to_filename(self):
+        resp = self.batch([(b'one', 'sunset.jpg')])
+        self.assertEqual("sunset", resp.json[0]["photo"]["title"])
+
+    def test_duplicates(self):
+        first = self.batch([(b'same', 'a.jpg')]).json[0]["photo"]
+        resp = self.batch([(b'same', 'b.jpg'), (b'new', 'c.jpg'), (b'new', 'd.jpg')])
+
+        self.assertEqual([200, 201, 201], [r["status"] for r in resp.json])
+        self.assertEqual(first["id"], resp.json[0]["photo"]["id"])
+        self.assertEqual(resp.json[1]["photo"]["id"], resp.json[2]["photo"]["id"])
+        self.assertEqual(2, Photo.query.count())
+
+    def test_per_item_errors(self):
+        resp = self.batch(
+            [(b'text', 'notes.txt'), (b'one', 'one.jpg'), (b'two', 'two.jpg')],
+            [{}, {}, {"public": "maybe"}]
+        )
+        self.assertEqual([400, 201, 400], [r["status"] for r in resp.json])
+        self.assertIn("error", resp.json[0])
+        self.assertEqual(1, Photo.query.count())
+
+    def test_bad_title_and_upload_date(self):
+        resp = self.batch(
+            [(b'one', 'one.jpg'), (b'two', 'two.jpg'), (b'three', 'three.jpg')],
+            [{"upload_date": "yesterday"}, {"title": ["a"]}, {"upload_date": {"a": 1}}]
+        )
+        self.assertEqual([400, 400, 400], [r["status"] for r in resp.json])
+        self.assertEqual(0, Photo.query.count())
+        self.assertEqual(200, self.client.get("/api/v1.0/photos").status_code)
+
+    def test_bad_metadata(self):
+        resp = self.batch([(b'one', 'one.jpg')], {"title": "not a list"})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_no_files(self):
+        resp = self.client.post(
+            "/api/v1.0/photos/batch", content_type="multipart/form-data", data={}
+        )
+        self.assertEqual(resp.status_code, 400)
+
+    def test_too_many_files(self):
+        app.config["BATCH_UPLOAD_LIMIT"] = 2
+        try:
+            resp = self.batch([(bytes([i]), f'{i}.jpg') for i in range(3)])
+        finally:
+            app.config["BATCH_UPLOAD_LIMIT"] = 500
+        self.assertEqual(resp.status_code, 413)
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import event
+from app import app, db
+from app.models import Photo
+
+
+class BulkUpdateTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        db.create_all()
+        self.client = app.test_client()
+
+        photos = [Photo(f"Photo{i}", 1000 + i, 0, f"photo{i}.jpg") for i in range(5)]
+        db.session.add_all(photos)
+        db.session.commit()
+        for photo in photos:
+            with open(os.path.join(app.config["UPLOAD_FOLDER"], photo.path), "wb") as f:
+                f.write(b'data')
+
+        self.commits = []
+        self.listener = self.commits.append
+        event.listen(db.session, "after_commit", self.listener)
+
+    def tearDown(self):
+        event.remove(db.session, "after_commit", self.listener)
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+
+    def send(self, method, url, body):
+        return getattr(self.client, method)(
+            url, data=json.dumps(body), headers={"Content-Type": "application/json"}
+        )
+
+    def test_put_commits_once(self):
+        resp = self.send("put", "/api/v1.0/photos/1", {"title": "New", "public": True})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(1, len(self.commits))
+        self.assertEqual(2, Photo.query.get(1).version)
+
+    def test_put_missing_photo(self):
+        resp = self.send("put", "/api/v1.0/photos/99", {"title": "New"})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_bulk_public(self):
+        resp = self.send("patch", "/api/v1.0/photos", {"ids": [1, 2, 3, 99], "changes": {"public": True}})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual({"updated": 3}, resp.json)
+        self.assertEqual(1, len(self.commits))
+
+        db.session.expire_all()
+        self.assertEqual([True, True, True, False, False], [p.public for p in Photo.query.order_by(Photo.id)])
+        self.assertEqual([2, 2, 2, 1, 1], [p.version for p in Photo.query.order_by(Photo.id)])
+
+    def test_bulk_update_changes_etag(self):
+        etag = self.client.get("/api/v1.0/photos/1").headers["ETag"]
+        self.send("patch", "/api/v1.0/photos", {"ids": [1], "changes": {"title": "Renamed"}})
+
+        resp = self.client.get("/api/v1.0/photos/1", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual("Renamed", resp.json["title"])
+
+    def test_bulk_update_rejects_unknown_fields(self):
+        resp = self.send("patch", "/api/v1.0/photos", {"ids": [1], "changes": {"filename": "x.jpg"}})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_update_needs_ids(self):
+        resp = self.send("patch", "/api/v1.0/photos", {"ids": [], "changes": {"public": True}})
+        self.assertEqual(resp.status_code, 400)
+
+    def test_bulk_delete(self):
+        resp = self.send("delete", "/api/v1.0/photos", {"ids": [2, 4]})
+        self.assertEqual({"deleted": 2}, resp.json)
+        self.assertEqual(1, len(self.commits))
+
+        self.assertEqual([1, 3, 5], [p.id for p in Photo.query.order_by(Photo.id)])
+        self.assertEqual(
+            ["photo0.jpg", "photo2.jpg", "photo4.jpg"],
+            sorted(f for f in os.listdir(app.config["UPLOAD_FOLDER"]))
+        )
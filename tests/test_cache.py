@@ -0,0 +1,161 @@
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from app import app, cache, db
+from app.models import Photo
+
+
+class MemoryBackendTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        backend = cache.MemoryBackend(max_entries=2, ttl=60)
+        backend.set("a", 1, ["t"], 0)
+        backend.set("b", 2, ["t"], 0)
+        backend.get("a")
+        backend.set("c", 3, ["t"], 0)
+        self.assertEqual((1, None, 3), (backend.get("a"), backend.get("b"), backend.get("c")))
+
+    def test_ttl(self):
+        backend = cache.MemoryBackend(max_entries=10, ttl=0.01)
+        backend.set("a", 1, [], 0)
+        time.sleep(0.02)
+        self.assertIsNone(backend.get("a"))
+        self.assertEqual(0, len(backend))
+
+    def test_invalidate_by_tag(self):
+        backend = cache.MemoryBackend(max_entries=10, ttl=60)
+        backend.set("list", 1, ["photos", "photo:1", "photo:2"], 0)
+        backend.set("one", 2, ["photo:1"], 0)
+        backend.set("two", 3, ["photo:2"], 0)
+        backend.invalidate(["photo:1"])
+        self.assertEqual(
+            (None, None, 3), (backend.get("list"), backend.get("one"), backend.get("two"))
+        )
+
+    def test_stale_epoch_is_not_stored(self):
+        backend = cache.MemoryBackend(max_entries=10, ttl=60)
+        epoch = backend.epoch()
+        backend.invalidate(["photo:1"])
+        self.assertFalse(backend.set("one", 1, ["photo:1"], epoch))
+        self.assertIsNone(backend.get("one"))
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+        db.session.add_all([
+            Photo("First", 1000, 1, "first.jpg"),
+            Photo("Second", 2000, 0, "second.jpg"),
+        ])
+        db.session.commit()
+        self.cache = cache.get_cache()
+        self.cache.clear()
+
+    def tearDown(self):
+        app.config["CACHE_BACKEND"] = "memory"
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def counts(self):
+        return self.cache.hits, self.cache.misses
+
+    def titles(self, url="/api/v1.0/photos"):
+        return [photo["title"] for photo in self.client.get(url).json]
+
+    def test_second_read_is_a_hit(self):
+        hits, misses = self.counts()
+        first = self.client.get("/api/v1.0/photos/1")
+        second = self.client.get("/api/v1.0/photos/1")
+        self.assertEqual((hits + 1, misses + 1), self.counts())
+        self.assertEqual(first.json, second.json)
+        self.assertEqual(first.headers["ETag"], second.headers["ETag"])
+
+        self.client.get("/api/v1.0/photos?public=true")
+        self.client.get("/api/v1.0/photos?public=true")
+        self.assertEqual((hits + 2, misses + 2), self.counts())
+
+    def test_hit_answers_conditional_requests(self):
+        etag = self.client.get("/api/v1.0/photos").headers["ETag"]
+        resp = self.client.get("/api/v1.0/photos", headers={"If-None-Match": etag})
+        self.assertEqual(304, resp.status_code)
+
+    def test_update_invalidates_photo_and_pages_showing_it(self):
+        self.client.get("/api/v1.0/photos/1")
+        self.client.get("/api/v1.0/photos/2")
+        self.titles()
+        self.client.put(
+            "/api/v1.0/photos/1", content_type="application/json",
+            data=json.dumps({"title": "Renamed"})
+        )
+        hits, misses = self.counts()
+        self.assertEqual("Renamed", self.client.get("/api/v1.0/photos/1").json["title"])
+        self.client.get("/api/v1.0/photos/2")
+        self.assertEqual(["Second", "Renamed"], self.titles())
+        self.assertEqual((hits + 1, misses + 2), self.counts())
+
+    def test_listed_attribute_invalidates_every_page(self):
+        self.assertEqual(["First"], self.titles("/api/v1.0/photos?public=true"))
+        self.client.put(
+            "/api/v1.0/photos/2", content_type="application/json",
+            data=json.dumps({"public": True})
+        )
+        self.assertEqual(["Second", "First"], self.titles("/api/v1.0/photos?public=true"))
+
+    def test_insert_and_delete(self):
+        self.titles()
+        db.session.add(Photo("Third", 3000, 1, "third.jpg"))
+        db.session.commit()
+        self.assertEqual(["Third", "Second", "First"], self.titles())
+
+        self.client.get("/api/v1.0/photos/3")
+        self.client.delete("/api/v1.0/photos/3")
+        self.assertEqual(404, self.client.get("/api/v1.0/photos/3").status_code)
+        self.assertEqual(["Second", "First"], self.titles())
+
+    def test_bulk_update_clears(self):
+        self.titles()
+        self.client.patch(
+            "/api/v1.0/photos", content_type="application/json",
+            data=json.dumps({"ids": [1, 2], "changes": {"title": "Same"}})
+        )
+        self.assertEqual(["Same", "Same"], self.titles())
+
+    def test_rollback_keeps_entries(self):
+        self.titles()
+        Photo.query.get(1).title = "Never saved"
+        db.session.flush()
+        db.session.rollback()
+        hits, misses = self.counts()
+        self.assertEqual(["Second", "First"], self.titles())
+        self.assertEqual((hits + 1, misses), self.counts())
+
+    def test_stats(self):
+        self.client.get("/api/v1.0/photos/1")
+        stats = self.client.get("/api/v1.0/cache").json
+        self.assertEqual("MemoryBackend", stats["backend"])
+        self.assertEqual(1, stats["entries"])
+        self.assertEqual(self.cache.misses, stats["misses"])
+
+    def test_disabled(self):
+        app.config["CACHE_BACKEND"] = "none"
+        hits, misses = self.counts()
+        self.titles()
+        self.titles()
+        self.assertEqual((hits, misses), self.counts())
+
+    def test_redis_without_client_falls_back(self):
+        if cache.redis is not None:
+            self.skipTest("redis is installed")
+        backend = cache.make_backend("redis", "redis://localhost:6379/0", 60, 10)
+        self.assertIsInstance(backend, cache.MemoryBackend)
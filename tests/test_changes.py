@@ -0,0 +1,85 @@
+import unittest
+from app import app, db
+from app.models import Photo, PhotoChange
+
+
+class PhotoChangesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        photos = [Photo(f"Photo {i}", 1588291200 + i, True, f"{i}.jpg") for i in range(4)]
+        db.session.add_all(photos)
+        db.session.commit()
+        self.ids = [photo.id for photo in photos]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def sync(self, since, **args):
+        resp = self.client.get("/api/v1.0/photos/changes", query_string=dict(args, since=since))
+        self.assertEqual(200, resp.status_code)
+        return resp
+
+    def changed(self, resp):
+        return [(change["id"], change["deleted"]) for change in resp.json["changes"]]
+
+    def test_first_sync_lists_every_photo(self):
+        resp = self.sync(0)
+        self.assertEqual([(id, False) for id in self.ids], self.changed(resp))
+        self.assertEqual("Photo 0", resp.json["changes"][0]["photo"]["title"])
+        self.assertFalse(resp.json["more"])
+
+        # Nothing new since
+        resp = self.sync(resp.json["cursor"])
+        self.assertEqual([], resp.json["changes"])
+        self.assertEqual(4, resp.json["cursor"])
+
+    def test_updates_and_deletes(self):
+        cursor = self.sync(0).json["cursor"]
+
+        self.client.put(f"/api/v1.0/photos/{self.ids[1]}", json={"title": "Renamed"})
+        self.client.put(f"/api/v1.0/photos/{self.ids[1]}", json={"public": False})
+        self.client.delete(f"/api/v1.0/photos/{self.ids[2]}")
+        resp = self.sync(cursor)
+        # The two edits collapse into one entry with the current metadata
+        self.assertEqual([(self.ids[1], False), (self.ids[2], True)], self.changed(resp))
+        photo = resp.json["changes"][0]["photo"]
+        self.assertEqual(("Renamed", False), (photo["title"], photo["public"]))
+        self.assertIsNone(resp.json["changes"][1]["photo"])
+        self.assertEqual(PhotoChange.query.count(), 4)
+
+    def test_bulk_statements(self):
+        cursor = self.sync(0).json["cursor"]
+        self.client.patch(
+            "/api/v1.0/photos", json={"ids": self.ids[:2], "changes": {"public": False}}
+        )
+        self.client.delete("/api/v1.0/photos", json={"ids": [self.ids[3]]})
+        resp = self.sync(cursor)
+        self.assertEqual(
+            [(self.ids[0], False), (self.ids[1], False), (self.ids[3], True)], self.changed(resp)
+        )
+
+    def test_changes_hidden_from_responses_are_not_logged(self):
+        cursor = self.sync(0).json["cursor"]
+        table = Photo.__table__
+        db.session.execute(table.update().values(phash="0f0f0f0f0f0f0f0f"))
+        db.session.commit()
+        self.assertEqual([], self.sync(cursor).json["changes"])
+
+    def test_pages(self):
+        resp = self.sync(0, limit=3)
+        self.assertEqual(self.ids[:3], [id for id, _ in self.changed(resp)])
+        self.assertTrue(resp.json["more"])
+        self.assertIn(f"since={resp.json['cursor']}", resp.headers["Link"])
+
+        resp = self.sync(resp.json["cursor"], limit=3)
+        self.assertEqual(self.ids[3:], [id for id, _ in self.changed(resp)])
+        self.assertFalse(resp.json["more"])
+        self.assertNotIn("Link", resp.headers)
+
+    def test_bad_cursor(self):
+        self.assertEqual(400, self.client.get("/api/v1.0/photos/changes?since=-1").status_code)
+        self.assertEqual(400, self.client.get("/api/v1.0/photos/changes?since=99").status_code)
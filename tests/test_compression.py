@@ -0,0 +1,116 @@
+import gzip
+import json
+import unittest
+import zlib
+from unittest import mock
+from app import app, cache, compression, db
+from app.models import Photo
+
+
+class FakeBrotli(object):
+    """Stands in for the brotli package, which is optional."""
+
+    @staticmethod
+    def compress(data, quality):
+        return b"br:" + zlib.compress(data)
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+        db.session.add_all(
+            [Photo(f"Photo {i}", 1588291200 + i, True, f"{i}.jpg") for i in range(40)]
+        )
+        db.session.commit()
+        cache.get_cache().clear()
+
+    def tearDown(self):
+        app.config["COMPRESS_RESPONSES"] = True
+        app.config["CACHE_BACKEND"] = "memory"
+        db.session.remove()
+        db.drop_all()
+
+    def get(self, url="/api/v1.0/photos", encoding="gzip", **headers):
+        if encoding is not None:
+            headers["Accept-Encoding"] = encoding
+        return self.client.get(url, headers=headers)
+
+    def test_gzip(self):
+        resp = self.get()
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual("gzip", resp.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        photos = json.loads(gzip.decompress(resp.data))
+        self.assertEqual(40, len(photos))
+        self.assertEqual(len(resp.data), int(resp.headers["Content-Length"]))
+
+    def test_identity(self):
+        for encoding in (None, "identity", "gzip;q=0"):
+            resp = self.get(encoding=encoding)
+            self.assertNotIn("Content-Encoding", resp.headers)
+            self.assertIn("Accept-Encoding", resp.headers["Vary"])
+            self.assertEqual(40, len(resp.json))
+
+    def test_small_responses_are_sent_as_is(self):
+        resp = self.get("/api/v1.0/photos/1")
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertNotIn("Vary", resp.headers)
+
+    def test_disabled(self):
+        app.config["COMPRESS_RESPONSES"] = False
+        self.assertNotIn("Content-Encoding", self.get().headers)
+
+    def test_brotli_is_preferred(self):
+        with mock.patch.object(compression, "brotli", FakeBrotli):
+            resp = self.get(encoding="gzip, deflate, br")
+            self.assertEqual("br", resp.headers["Content-Encoding"])
+            self.assertEqual(40, len(json.loads(zlib.decompress(resp.data[3:]))))
+            # Unless the client says otherwise
+            resp = self.get(encoding="br;q=0.5, gzip")
+            self.assertEqual("gzip", resp.headers["Content-Encoding"])
+
+    def test_etag_is_weak_and_still_revalidates(self):
+        plain = self.get(encoding=None).headers["ETag"]
+        etag = self.get().headers["ETag"]
+        self.assertEqual(f"W/{plain}", etag)
+        self.assertEqual(304, self.get(**{"If-None-Match": etag}).status_code)
+
+    def test_not_modified_matches_the_compressed_response(self):
+        for backend in ("memory", "none"):
+            app.config["CACHE_BACKEND"] = backend
+            etag = self.get().headers["ETag"]
+            resp = self.get(**{"If-None-Match": etag})
+            self.assertEqual((304, etag), (resp.status_code, resp.headers["ETag"]))
+            self.assertIn("Accept-Encoding", resp.headers["Vary"])
+
+            plain = self.get(encoding=None).headers["ETag"]
+            resp = self.get(encoding=None, **{"If-None-Match": plain})
+            self.assertEqual((304, plain), (resp.status_code, resp.headers["ETag"]))
+
+        # Small responses are never compressed
+        etag = self.get("/api/v1.0/photos/1").headers["ETag"]
+        resp = self.get("/api/v1.0/photos/1", **{"If-None-Match": etag})
+        self.assertEqual((304, etag), (resp.status_code, resp.headers["ETag"]))
+        self.assertNotIn("Vary", resp.headers)
+
+    def test_cache_hit_skips_compression(self):
+        first = self.get()
+        with mock.patch.object(compression, "compress") as compress:
+            second = self.get()
+            identity = self.get(encoding=None)
+        compress.assert_not_called()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual("gzip", second.headers["Content-Encoding"])
+        self.assertEqual(json.loads(gzip.decompress(second.data)), identity.json)
+
+    def test_uncached_responses(self):
+        app.config["CACHE_BACKEND"] = "none"
+        resp = self.get("/api/v1.0/photos/changes")
+        self.assertEqual("gzip", resp.headers["Content-Encoding"])
+        self.assertEqual(40, len(json.loads(gzip.decompress(resp.data))["changes"]))
+
+    def test_streams_are_left_alone(self):
+        resp = self.get("/api/v1.0/photos/export")
+        self.assertNotIn("Content-Encoding", resp.headers)
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy import event
+from app import app, db
+from app.models import Photo
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        db.create_all()
+        self.client = app.test_client()
+
+        db.session.add(Photo("Existing Photo", 123456, 0, 'hello.jpg'))
+        db.session.commit()
+
+        with open(os.path.join(app.config["UPLOAD_FOLDER"], 'hello.jpg'), 'wb') as f:
+            f.write(b'Hello there')
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+
+    def test_detail_not_modified(self):
+        resp = self.client.get("/api/v1.0/photos/1")
+        etag = resp.headers["ETag"]
+        self.assertIn("Last-Modified", resp.headers)
+
+        resp = self.client.get("/api/v1.0/photos/1", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(b"", resp.data)
+        self.assertEqual(etag, resp.headers["ETag"])
+
+    def test_detail_if_modified_since(self):
+        resp = self.client.get("/api/v1.0/photos/1")
+        resp = self.client.get(
+            "/api/v1.0/photos/1",
+            headers={"If-Modified-Since": resp.headers["Last-Modified"]}
+        )
+        self.assertEqual(resp.status_code, 304)
+
+    def test_detail_etag_changes_on_update(self):
+        etag = self.client.get("/api/v1.0/photos/1").headers["ETag"]
+        self.client.put(
+            "/api/v1.0/photos/1", data=json.dumps({"title": "Changed"}),
+            headers={"Content-Type": "application/json"}
+        )
+
+        resp = self.client.get("/api/v1.0/photos/1", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(etag, resp.headers["ETag"])
+        self.assertEqual("Changed", resp.json["title"])
+
+    def concurrent_update(self, session, flush_context, instances):
+        session.execute("UPDATE photo SET title = 'Theirs', version = version + 1")
+
+    def test_lost_update_conflicts(self):
+        event.listen(db.session, "before_flush", self.concurrent_update, once=True)
+        resp = self.client.put("/api/v1.0/photos/1", json={"title": "Mine"})
+        self.assertEqual(409, resp.status_code)
+        current = self.client.get("/api/v1.0/photos/1").headers["ETag"]
+        self.assertEqual(current, resp.headers["ETag"])
+
+    def test_lost_update_with_if_match(self):
+        etag = self.client.get("/api/v1.0/photos/1").headers["ETag"]
+        event.listen(db.session, "before_flush", self.concurrent_update, once=True)
+        resp = self.client.put(
+            "/api/v1.0/photos/1", json={"title": "Mine"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(412, resp.status_code)
+
+    def test_put_if_match(self):
+        etag = self.client.get("/api/v1.0/photos/1").headers["ETag"]
+        resp = self.client.put(
+            "/api/v1.0/photos/1", json={"title": "First"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(etag, resp.headers["ETag"])
+
+        # The same precondition is stale now
+        resp = self.client.put(
+            "/api/v1.0/photos/1", json={"title": "Second"}, headers={"If-Match": etag}
+        )
+        self.assertEqual(412, resp.status_code)
+        self.assertEqual("First", Photo.query.get(1).title)
+        resp = self.client.put(
+            "/api/v1.0/photos/1", json={"title": "Second"},
+            headers={"If-Match": resp.headers["ETag"]}
+        )
+        self.assertEqual(200, resp.status_code)
+
+    def test_list_not_modified(self):
+        etag = self.client.get("/api/v1.0/photos").headers["ETag"]
+        resp = self.client.get("/api/v1.0/photos", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_list_revalidates_by_etag_only(self):
+        db.session.add(Photo("Another", 123457, 0, 'another.jpg'))
+        db.session.commit()
+        resp = self.client.get("/api/v1.0/photos")
+        self.assertNotIn("Last-Modified", resp.headers)
+
+        # Removing a photo leaves every remaining row's updated_at as it was
+        self.client.delete("/api/v1.0/photos/2")
+        resp = self.client.get(
+            "/api/v1.0/photos", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+        )
+        self.assertEqual((200, 1), (resp.status_code, len(resp.json)))
+
+    def test_list_etag_changes_on_insert(self):
+        etag = self.client.get("/api/v1.0/photos").headers["ETag"]
+        db.session.add(Photo("Another", 123457, 0, 'another.jpg'))
+        db.session.commit()
+
+        resp = self.client.get("/api/v1.0/photos", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(2, len(resp.json))
+
+    def test_file_not_modified(self):
+        resp = self.client.get("/static/uploads/hello.jpg")
+        self.assertEqual(b'Hello there', resp.data)
+        etag = resp.headers["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+        resp.close()
+
+        resp = self.client.get("/static/uploads/hello.jpg", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(b"", resp.data)
+
+    def test_missing_file(self):
+        resp = self.client.get("/static/uploads/missing.jpg")
+        self.assertEqual(resp.status_code, 404)
@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool, StaticPool
+from app import app, db
+
+
+class DatabaseSetupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(self.directory, "t.db")
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        shutil.rmtree(self.directory)
+
+    def pragma(self, name):
+        return db.session.execute(f"PRAGMA {name}").scalar()
+
+    def test_sqlite_pragmas(self):
+        self.assertEqual("wal", self.pragma("journal_mode"))
+        self.assertEqual(1, self.pragma("synchronous"))
+        self.assertEqual(5000, self.pragma("busy_timeout"))
+        self.assertEqual(-64000, self.pragma("cache_size"))
+        self.assertEqual(256 * 1024 * 1024, self.pragma("mmap_size"))
+
+    def test_sqlite_file_is_pooled(self):
+        self.assertIsInstance(db.engine.pool, QueuePool)
+        self.assertEqual(app.config["DATABASE_POOL_SIZE"], db.engine.pool.size())
+
+    def test_memory_database_unchanged(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.assertIsInstance(db.engine.pool, StaticPool)
+
+    def test_postgres_pool_options(self):
+        options = {}
+        db.apply_driver_hacks(app, make_url("postgresql://photos@db/photos"), options)
+        self.assertEqual(app.config["DATABASE_POOL_SIZE"], options["pool_size"])
+        self.assertEqual(app.config["DATABASE_MAX_OVERFLOW"], options["max_overflow"])
+        self.assertEqual(app.config["DATABASE_POOL_RECYCLE"], options["pool_recycle"])
+        self.assertTrue(options["pool_pre_ping"])
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from PIL import Image
+from app import app, db
+from app.derivatives import derivative_path, pick_width
+from app.models import Photo
+
+
+def make_jpeg(width=1600, height=1200, color=(200, 120, 40)):
+    buf = BytesIO()
+    Image.new("RGB", (width, height), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class DerivativesTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def upload(self, content, filename="photo.jpg"):
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True,
+            content_type="multipart/form-data",
+            data={"file": (BytesIO(content), filename), "title": "Photo"}
+        ).json
+
+    def test_derivative_path(self):
+        self.assertEqual("ab/cd/abcd_640.webp", derivative_path("ab/cd/abcd.jpg", 640, "webp"))
+        self.assertEqual("ab/cd/abcd_320.jpg", derivative_path("ab/cd/abcd.png", 320, "jpeg"))
+
+    def test_pick_width(self):
+        self.assertEqual(320, pick_width(100))
+        self.assertEqual(640, pick_width(321))
+        self.assertEqual(1280, pick_width(5000))
+
+    def test_upload_renders_derivatives(self):
+        photo = self.upload(make_jpeg())
+        self.assertEqual("ready", Photo.query.get(photo["id"]).derivatives)
+
+        for width in app.config["DERIVATIVE_WIDTHS"]:
+            for fmt in app.config["DERIVATIVE_FORMATS"]:
+                path = os.path.join(
+                    app.config["UPLOAD_FOLDER"], derivative_path(photo["path"], width, fmt)
+                )
+                with Image.open(path) as image:
+                    self.assertEqual(width, image.width)
+
+    def test_status_in_photo_fields(self):
+        photo = self.upload(make_jpeg())
+        resp = self.client.get(f'/api/v1.0/photos/{photo["id"]}')
+        self.assertEqual("ready", resp.json["derivatives"])
+
+    def test_never_upscales(self):
+        photo = self.upload(make_jpeg(400, 300))
+        path = os.path.join(
+            app.config["UPLOAD_FOLDER"], derivative_path(photo["path"], 1280, "jpeg")
+        )
+        with Image.open(path) as image:
+            self.assertEqual((400, 300), image.size)
+
+    def test_serve_size(self):
+        photo = self.upload(make_jpeg())
+        resp = self.client.get(f'/static/uploads/{photo["path"]}?size=600&format=jpeg')
+        with Image.open(BytesIO(resp.data)) as image:
+            self.assertEqual(640, image.width)
+            self.assertEqual("JPEG", image.format)
+        resp.close()
+
+    def test_serve_size_negotiates_webp(self):
+        photo = self.upload(make_jpeg())
+        resp = self.client.get(
+            f'/static/uploads/{photo["path"]}?size=300',
+            headers={"Accept": "image/webp,image/*"}
+        )
+        with Image.open(BytesIO(resp.data)) as image:
+            self.assertEqual("WEBP", image.format)
+            self.assertEqual(320, image.width)
+        self.assertIn("Accept", resp.headers["Vary"])
+        resp.close()
+
+    def test_unreadable_image_falls_back(self):
+        photo = self.upload(b'not an image')
+        self.assertEqual("failed", Photo.query.get(photo["id"]).derivatives)
+
+        resp = self.client.get(f'/static/uploads/{photo["path"]}?size=320')
+        self.assertEqual(b'not an image', resp.data)
+        resp.close()
+
+    def test_pending_derivative_is_not_cached_for_good(self):
+        photo = self.upload(make_jpeg())
+        url = f'/static/uploads/{photo["path"]}?size=600&format=jpeg'
+        resp = self.client.get(url)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+        resp.close()
+
+        # While the derivative is still being rendered the original stands in
+        os.remove(os.path.join(
+            app.config["UPLOAD_FOLDER"], derivative_path(photo["path"], 640, "jpeg")
+        ))
+        resp = self.client.get(url)
+        self.assertEqual("no-cache", resp.headers["Cache-Control"])
+        with Image.open(BytesIO(resp.data)) as image:
+            self.assertEqual(1600, image.width)
+        resp = self.client.get(url, headers={"If-None-Match": resp.headers["ETag"]})
+        self.assertEqual((304, "no-cache"), (resp.status_code, resp.headers["Cache-Control"]))
+
+    def test_delete_removes_derivatives(self):
+        photo = self.upload(make_jpeg())
+        self.client.delete(f'/api/v1.0/photos/{photo["id"]}')
+
+        path = os.path.join(
+            app.config["UPLOAD_FOLDER"], derivative_path(photo["path"], 320, "webp")
+        )
+        self.assertFalse(os.path.exists(path))
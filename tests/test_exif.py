@@ -0,0 +1,144 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from io import BytesIO
+from unittest import mock
+from PIL import Image, ImageFile
+from app import app, db, storage
+from app.exif import read_metadata
+from app.models import Photo
+
+
+def make_jpeg(size=(400, 300), color=(10, 90, 200), orientation=None, taken_at=None,
+              offset=None, camera=None, gps=None):
+    exif = Image.Exif()
+    if camera is not None:
+        exif[0x010F], exif[0x0110] = camera
+    if orientation is not None:
+        exif[0x0112] = orientation
+    if taken_at is not None:
+        exif.get_ifd(0x8769)[0x9003] = taken_at
+    if offset is not None:
+        exif.get_ifd(0x8769)[0x9011] = offset
+    if gps is not None:
+        (lat_ref, lat), (lon_ref, lon) = gps
+        exif.get_ifd(0x8825).update({1: lat_ref, 2: lat, 3: lon_ref, 4: lon})
+
+    buf = BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+class ReadMetadataTestCase(unittest.TestCase):
+    def test_reads_capture_details(self):
+        meta = read_metadata(make_jpeg(
+            taken_at="2021:06:01 12:30:00", camera=("Canon", "EOS R5"),
+            gps=(("S", (33.0, 52.0, 4.2)), ("E", (151.0, 12.0, 36.0)))
+        ))
+        self.assertEqual(datetime(2021, 6, 1, 12, 30), meta["taken_at"])
+        self.assertEqual(("Canon", "EOS R5"), (meta["camera_make"], meta["camera_model"]))
+        self.assertEqual((400, 300), (meta["width"], meta["height"]))
+        self.assertAlmostEqual(-33.8678333, meta["latitude"])
+        self.assertAlmostEqual(151.21, meta["longitude"])
+
+    def test_offset_converts_to_utc(self):
+        meta = read_metadata(make_jpeg(taken_at="2021:06:01 12:30:00", offset="+02:00"))
+        self.assertEqual(datetime(2021, 6, 1, 10, 30), meta["taken_at"])
+
+    def test_rotated_dimensions(self):
+        meta = read_metadata(make_jpeg(orientation=6))
+        self.assertEqual((300, 400), (meta["width"], meta["height"]))
+
+    def test_only_needs_the_header(self):
+        content = make_jpeg(size=(1200, 900), taken_at="2020:01:02 03:04:05")
+        meta = read_metadata(content[:4096])
+        self.assertEqual(datetime(2020, 1, 2, 3, 4, 5), meta["taken_at"])
+        self.assertEqual(1200, meta["width"])
+
+    def test_png_size_from_the_header(self):
+        buf = BytesIO()
+        Image.effect_noise((1200, 1200), 64).save(buf, format="PNG")
+        with mock.patch.object(ImageFile.ImageFile, "load") as load:
+            meta = read_metadata(buf.getvalue()[:4096])
+            load.assert_not_called()
+        self.assertEqual((1200, 1200), (meta["width"], meta["height"]))
+
+    def test_unreadable(self):
+        meta = read_metadata(b"not an image")
+        self.assertEqual({None}, set(meta.values()))
+
+
+class ExifAPITestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def upload(self, content, title="Photo"):
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True,
+            content_type="multipart/form-data",
+            data={"file": (BytesIO(content), "photo.jpg"), "title": title}
+        ).json
+
+    def titles(self, query):
+        resp = self.client.get(f"/api/v1.0/photos?{query}")
+        self.assertEqual(200, resp.status_code)
+        return sorted(photo["title"] for photo in resp.json)
+
+    def test_upload_stores_metadata(self):
+        photo = self.upload(make_jpeg(taken_at="2019:08:07 06:05:04", camera=("Nikon", "Z6")))
+        self.assertEqual("2019-08-07T06:05:04", photo["taken_at"])
+        self.assertEqual("Z6", photo["camera_model"])
+        self.assertEqual((400, 300), (photo["width"], photo["height"]))
+        self.assertIsNone(photo["latitude"])
+
+    def test_filters(self):
+        self.upload(make_jpeg(color=(1, 1, 1), taken_at="2019:01:01 10:00:00",
+                              camera=("Nikon", "Z6")), "winter")
+        self.upload(make_jpeg(size=(2000, 1000), color=(2, 2, 2),
+                              taken_at="2019:07:01 10:00:00"), "summer")
+        self.upload(make_jpeg(color=(3, 3, 3)), "undated")
+
+        self.assertEqual(["summer"], self.titles("taken_after=2019-06-01"))
+        self.assertEqual(["winter"], self.titles("taken_before=2019-01-01T11:00:00%2B00:00"))
+        self.assertEqual([], self.titles("taken_before=2019-01-01T11:00:00%2B02:00"))
+        self.assertEqual(["summer"], self.titles("min_width=1000"))
+        self.assertEqual(["winter"], self.titles("camera=Z6"))
+        self.assertEqual(400, self.client.get("/api/v1.0/photos?taken_after=soon").status_code)
+
+    def test_backfill(self):
+        content = make_jpeg(taken_at="2018:02:03 04:05:06")
+        _, path, _ = storage.save_upload(BytesIO(content), "jpg")
+        photo = Photo("Old", 1, 1, "old.jpg")
+        photo.path = path
+        missing = Photo("Missing", 2, 1, "missing.jpg")
+        db.session.add_all([photo, missing])
+        db.session.commit()
+        ids, version = (photo.id, missing.id), photo.version
+
+        result = app.test_cli_runner().invoke(args=["backfill-exif", "--workers", "1"])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("2/2 photos", result.output)
+
+        photo = Photo.query.get(ids[0])
+        self.assertEqual(datetime(2018, 2, 3, 4, 5, 6), photo.taken_at)
+        self.assertEqual(400, photo.width)
+        self.assertEqual(version + 1, photo.version)
+        self.assertIsNone(Photo.query.get(ids[1]).width)
+
+        # Photos already read are skipped; the missing file is tried again.
+        result = app.test_cli_runner().invoke(args=["backfill-exif", "--workers", "1"])
+        self.assertIn("1/1 photos", result.output)
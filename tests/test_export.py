@@ -0,0 +1,51 @@
+import json
+import unittest
+from app import app, db
+from app.models import Photo
+
+
+class PhotoExportTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        photos = [Photo(f"Photo{i}", 1000 + i, i % 2, f"photo{i}.jpg") for i in range(3)]
+        db.session.add_all(photos)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_ndjson_export(self):
+        resp = self.client.get("/api/v1.0/photos/export")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.mimetype, "application/x-ndjson")
+        self.assertTrue(resp.is_streamed)
+
+        lines = resp.get_data(as_text=True).splitlines()
+        photos = [json.loads(line) for line in lines]
+        self.assertEqual(["Photo0", "Photo1", "Photo2"], [p["title"] for p in photos])
+        self.assertEqual("/api/v1.0/photos/1", photos[0]["uri"])
+
+    def test_json_export(self):
+        resp = self.client.get("/api/v1.0/photos/export?format=json")
+        self.assertEqual(resp.mimetype, "application/json")
+        photos = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(3, len(photos))
+
+    def test_json_export_matches_detail(self):
+        photos = json.loads(
+            self.client.get("/api/v1.0/photos/export?format=json").get_data(as_text=True)
+        )
+        self.assertEqual(self.client.get("/api/v1.0/photos/2").json, photos[1])
+
+    def test_empty_export(self):
+        resp = self.client.get("/api/v1.0/photos/export?format=json&user_id=9")
+        self.assertEqual([], json.loads(resp.get_data(as_text=True)))
+
+    def test_filtered_export(self):
+        resp = self.client.get("/api/v1.0/photos/export?public=true")
+        lines = resp.get_data(as_text=True).splitlines()
+        self.assertEqual(["Photo1"], [json.loads(line)["title"] for line in lines])
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from PIL import Image
+from app import app, db, ingest
+from app.models import IngestJob, Photo
+
+
+def make_jpeg(color=(40, 160, 90)):
+    buf = BytesIO()
+    Image.new("RGB", (800, 600), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class IngestTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        app.config["INGEST_MODE"] = "async"
+        app.config["INGEST_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        app.config["INGEST_MODE"] = "sync"
+        app.config["INGEST_WORKERS"] = 2
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def upload(self, content, filename="photo.jpg", tags=None):
+        data = {"file": (BytesIO(content), filename), "title": "Queued", "public": True}
+        if tags is not None:
+            data["tags"] = tags
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True, content_type="multipart/form-data", data=data
+        )
+
+    def test_upload_returns_job(self):
+        resp = self.upload(make_jpeg(), tags="beach")
+        self.assertEqual(202, resp.status_code)
+        self.assertTrue(resp.headers["Location"].endswith(f'/api/v1.0/jobs/{resp.json["id"]}'))
+
+        job = self.client.get(resp.json["uri"]).json
+        self.assertEqual("done", job["status"])
+        self.assertIsNone(job["stage"])
+        self.assertFalse(job["duplicate"])
+
+        photo = self.client.get(job["photo"]).json
+        self.assertEqual("Queued", photo["title"])
+        self.assertEqual(["beach"], photo["tags"])
+        self.assertEqual(800, photo["width"])
+        self.assertEqual("ready", photo["derivatives"])
+
+    def test_spool_is_removed(self):
+        self.upload(make_jpeg())
+        spool = os.path.join(app.config["UPLOAD_FOLDER"], ".spool")
+        self.assertEqual([], os.listdir(spool))
+
+    def test_duplicate(self):
+        first = self.client.get(self.upload(make_jpeg()).json["uri"]).json
+        second = self.client.get(self.upload(make_jpeg()).json["uri"]).json
+        self.assertTrue(second["duplicate"])
+        self.assertEqual(first["photo_id"], second["photo_id"])
+        self.assertEqual(1, Photo.query.count())
+
+    def test_failed_job(self):
+        job = IngestJob(id="f" * 32, status=ingest.QUEUED, filename="gone.jpg",
+                        spool_path=".spool/gone.jpg", title="Gone")
+        db.session.add(job)
+        db.session.commit()
+        ingest.run(job.id)
+
+        resp = self.client.get(f"/api/v1.0/jobs/{'f' * 32}").json
+        self.assertEqual("failed", resp["status"])
+        self.assertIsNotNone(resp["error"])
+        self.assertEqual(0, Photo.query.count())
+
+    def test_worker_thread(self):
+        app.config["INGEST_WORKERS"] = 1
+        resp = self.upload(make_jpeg())
+        self.assertEqual(202, resp.status_code)
+        # Wait for the worker to finish the job.
+        ingest.executor().shutdown(wait=True)
+        ingest._executor = None
+
+        db.session.expire_all()
+        self.assertEqual("done", self.client.get(resp.json["uri"]).json["status"])
+        self.assertEqual(1, Photo.query.count())
+
+    def test_unknown_job(self):
+        self.assertEqual(404, self.client.get("/api/v1.0/jobs/nope").status_code)
+
+    def test_sync_mode_unchanged(self):
+        app.config["INGEST_MODE"] = "sync"
+        resp = self.upload(make_jpeg())
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual("Queued", resp.json["title"])
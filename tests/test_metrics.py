@@ -0,0 +1,79 @@
+import unittest
+from app import app, db, metrics
+from app.models import Photo
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.config = {
+            k: app.config[k] for k in ("METRICS_ENABLED", "CACHE_BACKEND", "SLOW_REQUEST_MS")
+        }
+        app.config["METRICS_ENABLED"] = True
+        app.config["CACHE_BACKEND"] = "none"
+        metrics._registry = None
+        db.create_all()
+        self.client = app.test_client()
+
+        db.session.add_all([
+            Photo("First", 1000, 1, "first.jpg"),
+            Photo("Second", 2000, 1, "second.jpg"),
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        app.config.update(self.config)
+        db.session.remove()
+        db.drop_all()
+
+    def metric_lines(self):
+        resp = self.client.get("/metrics")
+        self.assertEqual(200, resp.status_code)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        return resp.get_data(as_text=True).splitlines()
+
+    def test_server_timing(self):
+        resp = self.client.get("/api/v1.0/photos")
+        phases = [part.split(";")[0] for part in resp.headers["Server-Timing"].split(", ")]
+        self.assertEqual(["db", "serialize", "compress", "file", "total"], phases)
+
+    def test_request_metrics(self):
+        self.client.get("/api/v1.0/photos")
+        self.client.get("/api/v1.0/photos/1")
+        self.client.get("/api/v1.0/photos/99")
+        lines = self.metric_lines()
+
+        self.assertIn(
+            'photoapi_requests_total{endpoint="photos",method="GET",status="200"} 1', lines
+        )
+        self.assertIn(
+            'photoapi_requests_total{endpoint="photo",method="GET",status="404"} 1', lines
+        )
+        self.assertIn(
+            'photoapi_request_duration_seconds_count{endpoint="photo",method="GET"} 2', lines
+        )
+        self.assertIn(
+            'photoapi_request_duration_seconds_bucket{endpoint="photos",method="GET",le="+Inf"} 1',
+            lines
+        )
+
+    def test_query_counts(self):
+        self.client.get("/api/v1.0/photos/1")
+        lines = self.metric_lines()
+        # One query for the photo, one for its tags
+        self.assertIn('photoapi_request_queries_sum{endpoint="photo"} 2.0', lines)
+        self.assertIn('photoapi_request_queries_bucket{endpoint="photo",le="1"} 0', lines)
+        self.assertIn('photoapi_request_queries_bucket{endpoint="photo",le="2"} 1', lines)
+
+    def test_slow_request_log(self):
+        app.config["SLOW_REQUEST_MS"] = 0
+        with self.assertLogs("app.metrics", level="WARNING") as logs:
+            self.client.get("/api/v1.0/photos?limit=1")
+        self.assertIn("Slow request GET /api/v1.0/photos?limit=1 -> 200", logs.output[0])
+        self.assertIn('photoapi_slow_requests_total{endpoint="photos"} 1', self.metric_lines())
+
+    def test_disabled(self):
+        app.config["METRICS_ENABLED"] = False
+        resp = self.client.get("/api/v1.0/photos")
+        self.assertNotIn("Server-Timing", resp.headers)
+        self.assertEqual(404, self.client.get("/metrics").status_code)
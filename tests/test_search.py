@@ -0,0 +1,90 @@
+import json
+import unittest
+from app import app, db
+from app.models import Photo
+from app.search import fts_query, search_terms
+
+
+class PhotoSearchTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        titles = [
+            "Sunset over the beach",
+            "Beach volleyball",
+            "Mountain sunrise",
+            "Café in Paris",
+            "Sunset sunset sunset",
+        ]
+        db.session.add_all(
+            [Photo(title, 1000 + i, i % 2, f"{i}.jpg") for i, title in enumerate(titles)]
+        )
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def search(self, query):
+        resp = self.client.get(f"/api/v1.0/photos/search?{query}")
+        self.assertEqual(resp.status_code, 200)
+        return [photo["title"] for photo in resp.json]
+
+    def test_terms(self):
+        self.assertEqual(["sun", "beach"], search_terms('sun "beach*'))
+        self.assertEqual('"sun"* "beach"*', fts_query(["sun", "beach"]))
+
+    def test_word_search(self):
+        self.assertEqual(
+            ["Beach volleyball", "Sunset over the beach"], sorted(self.search("q=beach"))
+        )
+
+    def test_ranked(self):
+        self.assertEqual("Sunset sunset sunset", self.search("q=sunset")[0])
+
+    def test_all_words_must_match(self):
+        self.assertEqual(["Sunset over the beach"], self.search("q=beach+sunset"))
+
+    def test_prefix_and_diacritics(self):
+        self.assertEqual(["Mountain sunrise"], self.search("q=mount"))
+        self.assertEqual(["Café in Paris"], self.search("q=cafe"))
+
+    def test_pagination(self):
+        resp = self.client.get("/api/v1.0/photos/search?q=sun&limit=2")
+        self.assertEqual(2, len(resp.json))
+        link = resp.headers["Link"]
+        rest = self.client.get(link[1:link.index(">")]).json
+        self.assertEqual(1, len(rest))
+        self.assertNotIn(rest[0]["id"], [p["id"] for p in resp.json])
+
+    def test_filters_apply(self):
+        self.assertEqual(["Beach volleyball"], self.search("q=beach&public=true"))
+
+    def test_index_follows_updates(self):
+        self.client.put(
+            "/api/v1.0/photos/3", data=json.dumps({"title": "Glacier"}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual([], self.search("q=mountain"))
+        self.assertEqual(["Glacier"], self.search("q=glacier"))
+
+    def test_index_follows_bulk_changes(self):
+        self.client.patch(
+            "/api/v1.0/photos", data=json.dumps({"ids": [4], "changes": {"title": "Bistro"}}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.client.delete(
+            "/api/v1.0/photos", data=json.dumps({"ids": [2]}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual(["Bistro"], self.search("q=bistro"))
+        self.assertEqual(["Sunset over the beach"], self.search("q=beach"))
+
+    def test_operators_are_plain_words(self):
+        self.assertEqual([], self.search('q=NEAR("sunset"'))
+
+    def test_needs_a_word(self):
+        resp = self.client.get("/api/v1.0/photos/search?q=%22%22")
+        self.assertEqual(resp.status_code, 400)
@@ -0,0 +1,62 @@
+import json
+import unittest
+from datetime import datetime
+from flask_restful import marshal
+from app import app, db
+from app.models import Photo
+from app.photo import photo_fields
+from app.serializers import PHOTO_COLUMNS, photo_row, serialize_photo, serialize_photos
+
+
+class PhotoSerializerTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+
+        photos = [
+            Photo("Plain", 123456, 0, 'plain.jpg'),
+            Photo("Public", 999123, 1, 'public.jpg'),
+            Photo(None, None, None, None),
+            Photo("Fractional", 1589328000.75, True, 'frac.jpg'),
+            Photo("Exif", 1589328001, True, 'exif.jpg'),
+        ]
+        photos[-1].taken_at = datetime(2020, 5, 13, 9, 15, 2)
+        photos[-1].camera_make, photos[-1].camera_model = "FUJIFILM", "X-T4"
+        photos[-1].width, photos[-1].height = 6240, 4160
+        photos[-1].latitude, photos[-1].longitude = 48.8583701, 2.2944813
+        db.session.add_all(photos)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def test_matches_marshal(self):
+        with app.test_request_context():
+            for photo in Photo.query.all():
+                self.assertEqual(
+                    json.dumps(marshal(photo, photo_fields)),
+                    json.dumps(serialize_photo(photo))
+                )
+
+    def test_rows_match_entities(self):
+        with app.test_request_context():
+            rows = Photo.query.with_entities(*PHOTO_COLUMNS).order_by(Photo.id).all()
+            photos = Photo.query.order_by(Photo.id).all()
+            self.assertEqual(
+                [marshal(photo, photo_fields) for photo in photos],
+                serialize_photos(rows)
+            )
+
+    def test_photo_row_order(self):
+        photo = Photo.query.get(1)
+        self.assertEqual(
+            (1, "Plain", 123456, False, 'plain.jpg', 'plain.jpg', None) + (None,) * 7,
+            photo_row(photo)
+        )
+
+    def test_uri_uses_script_root(self):
+        with app.test_request_context(base_url="http://localhost/gallery"):
+            photo = Photo.query.get(2)
+            self.assertEqual("/gallery/api/v1.0/photos/2", serialize_photo(photo)["uri"])
+            self.assertEqual(marshal(photo, photo_fields)["uri"], serialize_photo(photo)["uri"])
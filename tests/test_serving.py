@@ -0,0 +1,75 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from app import app
+
+
+class FileServingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            k: app.config[k] for k in ("UPLOAD_FOLDER", "FILE_SERVING")
+        }
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.client = app.test_client()
+
+        digest = hashlib.sha256(b'0123456789').hexdigest()
+        self.stored = f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+        for path in (self.stored, "legacy.jpg"):
+            full_path = os.path.join(app.config["UPLOAD_FOLDER"], path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "wb") as f:
+                f.write(b'0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config.update(self.config)
+
+    def get(self, path, **kwargs):
+        return self.client.get(f"/static/uploads/{path}", buffered=True, **kwargs)
+
+    def test_range_request(self):
+        resp = self.get(self.stored, headers={"Range": "bytes=2-5"})
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b'2345', resp.data)
+        self.assertEqual("bytes 2-5/10", resp.headers["Content-Range"])
+
+    def test_if_range_mismatch_sends_everything(self):
+        resp = self.get(self.stored, headers={"Range": "bytes=2-5", "If-Range": '"stale"'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b'0123456789', resp.data)
+
+    def test_unsatisfiable_range(self):
+        resp = self.get(self.stored, headers={"Range": "bytes=50-60"})
+        self.assertEqual(resp.status_code, 416)
+
+    def test_content_addressed_files_are_immutable(self):
+        self.assertIn("immutable", self.get(self.stored).headers["Cache-Control"])
+        self.assertEqual("no-cache", self.get("legacy.jpg").headers["Cache-Control"])
+
+    def test_not_modified_keeps_cache_control(self):
+        etag = self.get(self.stored).headers["ETag"]
+        resp = self.get(self.stored, headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+        self.assertIn("immutable", resp.headers["Cache-Control"])
+
+    def test_x_accel_redirect(self):
+        app.config["FILE_SERVING"] = "x-accel-redirect"
+        resp = self.get(self.stored)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(b'', resp.data)
+        self.assertEqual(f"/protected/uploads/{self.stored}", resp.headers["X-Accel-Redirect"])
+        self.assertEqual("image/jpeg", resp.mimetype)
+        self.assertIn("ETag", resp.headers)
+
+    def test_x_sendfile(self):
+        app.config["FILE_SERVING"] = "x-sendfile"
+        resp = self.get("legacy.jpg")
+        self.assertEqual(b'', resp.data)
+        self.assertEqual(
+            os.path.join(app.config["UPLOAD_FOLDER"], "legacy.jpg"), resp.headers["X-Sendfile"]
+        )
+
+    def test_directory_is_not_served(self):
+        self.assertEqual(404, self.get(self.stored.split("/")[0]).status_code)
@@ -0,0 +1,159 @@
+import random
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from app import app, db, similar, storage
+from app.models import Photo
+from app.similar import MultiIndex, distance, phash_of
+
+
+def make_image(seed):
+    noise = random.Random(seed).randbytes(16 * 12 * 3)
+    return Image.frombytes("RGB", (16, 12), noise).resize((800, 600), Image.BILINEAR)
+
+
+def encode(image, size=None, quality=90):
+    if size is not None:
+        image = image.resize(size, Image.LANCZOS)
+    buf = BytesIO()
+    image.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+class MultiIndexTestCase(unittest.TestCase):
+    def test_matches_linear_scan(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        # Some near copies so small radii find something
+        values += [value ^ (1 << rng.randrange(64)) for value in values[:50]]
+        index = MultiIndex()
+        for id, value in enumerate(values):
+            index.add(value, id)
+
+        for query in values[:20]:
+            for radius in (0, 3, 12, 16):
+                expected = sorted(
+                    (distance(query, value), id) for id, value in enumerate(values)
+                    if distance(query, value) <= radius
+                )
+                self.assertEqual(expected, sorted(index.search(query, radius)))
+
+    def test_discard(self):
+        index = MultiIndex()
+        index.add(0b1010, 1)
+        index.add(0b1010, 2)
+        index.add(0b1011, 3)
+        index.discard(0b1010, 1)
+        index.discard(0b1010, 1)
+        self.assertEqual([(0, 2), (1, 3)], sorted(index.search(0b1010, 1)))
+        self.assertEqual(2, index.size)
+
+
+class PerceptualHashTestCase(unittest.TestCase):
+    def test_resized_copy_is_close(self):
+        image = make_image(1)
+        original = phash_of(BytesIO(encode(image)))
+        copy = phash_of(BytesIO(encode(image, size=(400, 300), quality=60)))
+        other = phash_of(BytesIO(encode(make_image(2))))
+
+        self.assertEqual(16, len(original))
+        self.assertLessEqual(distance(int(original, 16), int(copy, 16)), 4)
+        self.assertGreater(distance(int(original, 16), int(other, 16)), 16)
+
+    def test_unreadable(self):
+        self.assertIsNone(phash_of(BytesIO(b"not an image")))
+
+    def test_decompression_bomb(self):
+        content = encode(make_image(1))
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            self.assertIsNone(phash_of(BytesIO(content)))
+
+
+class SimilarPhotosTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        similar.reset_index()
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        similar.reset_index()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def upload(self, content, title):
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True, content_type="multipart/form-data",
+            data={"file": (BytesIO(content), "photo.jpg"), "title": title}
+        ).json
+
+    def similar(self, id, query=""):
+        return self.client.get(f"/api/v1.0/photos/{id}/similar{query}")
+
+    def test_finds_near_duplicates(self):
+        image = make_image(1)
+        original = self.upload(encode(image), "original")
+        self.upload(encode(make_image(2)), "other")
+        # Uploaded after the index was first built
+        self.assertEqual([], self.similar(original["id"]).json)
+        self.upload(encode(image, size=(400, 300), quality=60), "resized")
+
+        resp = self.similar(original["id"])
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(["resized"], [photo["title"] for photo in resp.json])
+        self.assertLessEqual(resp.json[0]["distance"], 4)
+        widest = self.similar(original["id"], "?distance=16").json
+        self.assertEqual(["resized"], [photo["title"] for photo in widest])
+
+    def test_deleted_photos_are_dropped(self):
+        image = make_image(1)
+        original = self.upload(encode(image), "original")
+        copy = self.upload(encode(image, quality=50), "copy")
+        self.assertEqual(1, len(self.similar(original["id"]).json))
+
+        self.client.delete(f"/api/v1.0/photos/{copy['id']}")
+        self.assertEqual([], self.similar(original["id"]).json)
+        self.assertEqual(1, similar.get_index().index.size)
+
+    def test_reused_ids_are_reindexed(self):
+        image = make_image(1)
+        original = self.upload(encode(image), "original")
+        copy = self.upload(encode(image, quality=50), "copy")
+        self.assertEqual(1, len(self.similar(original["id"]).json))
+
+        # SQLite hands the id of the deleted copy to the next photo
+        self.client.delete(f"/api/v1.0/photos/{copy['id']}")
+        other = self.upload(encode(make_image(2)), "other")
+        self.assertEqual(copy["id"], other["id"])
+        self.assertEqual([], self.similar(original["id"]).json)
+        phash = Photo.query.get(other["id"]).phash
+        self.assertEqual(int(phash, 16), similar.get_index().hashes[other["id"]])
+
+    def test_errors(self):
+        self.assertEqual(404, self.similar(99).status_code)
+        photo = self.upload(encode(make_image(1)), "original")
+        self.assertEqual(400, self.similar(photo["id"], "?distance=64").status_code)
+
+    def test_backfill(self):
+        content = encode(make_image(3))
+        _, path, _ = storage.save_upload(BytesIO(content), "jpg")
+        photo = Photo("Old", 1, 1, "old.jpg")
+        photo.path = path
+        db.session.add(photo)
+        db.session.commit()
+        id = photo.id
+
+        result = app.test_cli_runner().invoke(args=["backfill-phash", "--workers", "1"])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn("1/1 photos", result.output)
+        self.assertEqual(phash_of(BytesIO(content)), Photo.query.get(id).phash)
@@ -1,6 +1,9 @@
 import os
+import shutil
+import tempfile
 import unittest
 import json
+import hashlib
 from io import BytesIO
 from datetime import datetime
 from pathlib import Path
@@ -11,6 +14,10 @@ from app.models import Photo
 class PhotoAPITestCase(unittest.TestCase):
     def setUp(self):
         app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
         db.create_all()
         self.client = app.test_client()
 
@@ -21,6 +28,21 @@ class PhotoAPITestCase(unittest.TestCase):
     def tearDown(self):
         db.session.remove()
         db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def upload(self, content, filename, title="New file"):
+        payload = {
+            "file": (BytesIO(content), filename),
+            "title": title,
+            "public": False
+        }
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True,
+            content_type="multipart/form-data",
+            data=payload
+        )
 
     def test_get_photo_by_id(self):
         resp = self.client.get("/api/v1.0/photos/1")
@@ -185,3 +207,41 @@ class PhotoAPITestCase(unittest.TestCase):
         photo = resp.json
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(photo["filename"], 'hello.jpg')
+
+    def test_upload_is_content_addressed(self):
+        resp = self.upload(b'Hello there', 'hello.jpg')
+        digest = hashlib.sha256(b'Hello there').hexdigest()
+        path = f"{digest[:2]}/{digest[2:4]}/{digest}.jpg"
+
+        self.assertEqual(resp.json["path"], path)
+        stored = os.path.join(app.config["UPLOAD_FOLDER"], path)
+        with open(stored, 'rb') as f:
+            self.assertEqual(b'Hello there', f.read())
+        self.assertEqual([], os.listdir(os.path.join(app.config["UPLOAD_FOLDER"], ".tmp")))
+
+    def test_duplicate_upload(self):
+        first = self.upload(b'Same bytes', 'one.jpg', title="One")
+        second = self.upload(b'Same bytes', 'two.jpg', title="Two")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.json["id"], second.json["id"])
+        self.assertEqual("One", second.json["title"])
+        self.assertEqual(1, Photo.query.filter_by(content_hash=hashlib.sha256(b'Same bytes').hexdigest()).count())
+
+    def test_same_name_does_not_overwrite(self):
+        first = self.upload(b'First', 'same.jpg').json
+        second = self.upload(b'Second', 'same.jpg').json
+
+        self.assertNotEqual(first["path"], second["path"])
+        resp = self.client.get(f'/static/uploads/{first["path"]}')
+        self.assertEqual(b'First', resp.data)
+        resp.close()
+
+    def test_delete_removes_file(self):
+        photo = self.upload(b'Delete me', 'gone.jpg').json
+        stored = os.path.join(app.config["UPLOAD_FOLDER"], photo["path"])
+        self.assertTrue(os.path.exists(stored))
+
+        self.client.delete(f'/api/v1.0/photos/{photo["id"]}')
+        self.assertFalse(os.path.exists(stored))
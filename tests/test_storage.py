@@ -0,0 +1,181 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from app import app, db, storage
+from app.storage import ClientError, LocalStorage, S3Storage
+
+
+def make_jpeg(width=800, height=600, color=(30, 90, 200)):
+    buf = BytesIO()
+    Image.new("RGB", (width, height), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class FakeS3Client(object):
+    """The parts of a boto3 S3 client the storage uses, kept in a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def upload_file(self, filename, bucket, key):
+        self.calls.append("upload_file")
+        with open(filename, "rb") as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def head_object(self, Bucket, Key):
+        self.calls.append("head_object")
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {
+            "ContentLength": len(self.objects[(Bucket, Key)]),
+            "LastModified": datetime(2020, 5, 1, tzinfo=timezone.utc),
+        }
+
+    def get_object(self, Bucket, Key, Range=None):
+        self.calls.append("get_object")
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        data = self.objects[(Bucket, Key)]
+        if Range is not None:
+            start, end = Range[len("bytes="):].split("-")
+            data = data[int(start):int(end) + 1]
+        return {"Body": BytesIO(data)}
+
+    def delete_object(self, Bucket, Key):
+        self.calls.append("delete_object")
+        self.objects.pop((Bucket, Key), None)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class LocalStorageTestCase(unittest.TestCase):
+    def setUp(self):
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.store = LocalStorage(app.config["UPLOAD_FOLDER"])
+
+    def tearDown(self):
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+
+    def test_save_is_sharded(self):
+        content_hash, key, head = self.store.save(BytesIO(b"0123456789"), "jpg")
+        self.assertEqual(f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.jpg", key)
+        self.assertEqual(b"0123456789", head)
+        self.assertEqual(10, self.store.stat(key).st_size)
+        self.assertEqual(b"0123", self.store.read_head(key, 4))
+        self.assertEqual([], os.listdir(storage.full_path(".tmp")))
+
+    def test_delete(self):
+        _, key, _ = self.store.save(BytesIO(b"0123456789"), "jpg")
+        self.store.delete(key)
+        self.store.delete(key)
+        self.assertFalse(self.store.exists(key))
+
+    def test_keys_stay_inside_the_root(self):
+        self.assertIsNone(self.store.stat("../outside.jpg"))
+        self.assertIsNone(self.store.url("ab/cd/abcd.jpg"))
+
+
+class S3StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.config = {
+            k: app.config[k]
+            for k in ("UPLOAD_FOLDER", "TRANSFORM_CACHE_FOLDER", "DERIVATIVE_WORKERS")
+        }
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        app.config["TRANSFORM_CACHE_FOLDER"] = tempfile.mkdtemp()
+        app.config["DERIVATIVE_WORKERS"] = 0
+        app.config["STORAGE_BACKEND"] = "s3"
+        self.s3 = FakeS3Client()
+        self.store = S3Storage(self.s3, "photos", prefix="uploads/", expiry=600)
+        patcher = mock.patch.object(storage, "make_storage", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        shutil.rmtree(app.config["TRANSFORM_CACHE_FOLDER"])
+        app.config.update(self.config)
+        app.config["STORAGE_BACKEND"] = "local"
+        storage._storage = None
+
+    def upload(self, content):
+        return self.client.post(
+            "/api/v1.0/photos", buffered=True, content_type="multipart/form-data",
+            data={"file": (BytesIO(content), "photo.jpg"), "title": "Remote"}
+        )
+
+    def keys(self):
+        return sorted(key for _, key in self.s3.objects)
+
+    def test_upload_stores_objects(self):
+        resp = self.upload(make_jpeg())
+        self.assertEqual(201, resp.status_code)
+        path = resp.json["path"]
+        stem = path.rsplit(".", 1)[0]
+
+        self.assertIn(f"uploads/{path}", self.keys())
+        self.assertIn(f"uploads/{stem}_640.webp", self.keys())
+        self.assertEqual("ready", resp.json["derivatives"])
+        self.assertEqual(800, resp.json["width"])
+        # Nothing is left on the local disk
+        self.assertEqual([], os.listdir(storage.full_path(".tmp")))
+
+    def test_duplicate_is_not_uploaded_again(self):
+        self.upload(make_jpeg())
+        uploads = self.s3.calls.count("upload_file")
+        self.assertEqual(200, self.upload(make_jpeg()).status_code)
+        self.assertEqual(uploads, self.s3.calls.count("upload_file"))
+
+    def test_file_redirects_to_presigned_url(self):
+        path = self.upload(make_jpeg()).json["path"]
+        resp = self.client.get(f"/static/uploads/{path}")
+        self.assertEqual(302, resp.status_code)
+        self.assertEqual(
+            f"https://s3.example.com/photos/uploads/{path}?expires=600", resp.headers["Location"]
+        )
+        self.assertEqual("private, max-age=1800", resp.headers["Cache-Control"])
+
+    def test_sized_file_redirects_to_derivative(self):
+        path = self.upload(make_jpeg()).json["path"]
+        resp = self.client.get(f"/static/uploads/{path}?size=300&format=webp")
+        stem = path.rsplit(".", 1)[0]
+        self.assertIn(f"/uploads/{stem}_320.webp?", resp.headers["Location"])
+
+    def test_pending_derivative_redirect_is_not_cached(self):
+        path = self.upload(make_jpeg()).json["path"]
+        stem = path.rsplit(".", 1)[0]
+        del self.s3.objects[("photos", f"uploads/{stem}_320.webp")]
+        resp = self.client.get(f"/static/uploads/{path}?size=300&format=webp")
+        self.assertIn(f"/uploads/{path}?", resp.headers["Location"])
+        self.assertEqual("no-cache", resp.headers["Cache-Control"])
+
+    def test_transform_reads_object(self):
+        path = self.upload(make_jpeg()).json["path"]
+        resp = self.client.get(f"/static/transform/{path}?w=100", buffered=True)
+        self.assertEqual(200, resp.status_code)
+        with Image.open(BytesIO(resp.data)) as image:
+            self.assertEqual((100, 75), image.size)
+
+    def test_delete_removes_objects(self):
+        resp = self.upload(make_jpeg())
+        self.client.delete(f"/api/v1.0/photos/{resp.json['id']}")
+        self.assertEqual([], self.keys())
+
+    def test_read_head_uses_range(self):
+        self.s3.objects[("photos", "uploads/a.jpg")] = b"0123456789"
+        self.assertEqual(b"0123", self.store.read_head("a.jpg", 4))
+        self.assertIsNone(self.store.stat("missing.jpg"))
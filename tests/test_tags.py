@@ -0,0 +1,177 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+from flask_restful import marshal
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from app import app, db, ingest
+from app.models import Photo, Tag
+from app.photo import photo_fields
+from app.serializers import serialize_photo
+
+
+class TagTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+
+        tagged = {
+            "both": ["beach", "sunset"],
+            "beach": ["beach"],
+            "sunset": ["Sunset "],
+            "none": [],
+        }
+        for i, (title, names) in enumerate(tagged.items()):
+            photo = Photo(title, 1000 + i, 1, f"{title}.jpg")
+            photo.set_tags(names)
+            db.session.add(photo)
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def titles(self, query):
+        resp = self.client.get(f"/api/v1.0/photos?{query}")
+        self.assertEqual(resp.status_code, 200)
+        return sorted(photo["title"] for photo in resp.json)
+
+    def test_normalize(self):
+        self.assertEqual(["a", "b"], Tag.normalize([" B", "a", "", "A "]))
+
+    def test_tags_are_shared(self):
+        self.assertEqual(2, Tag.query.count())
+        self.assertEqual(2, Tag.query.filter_by(name="beach").first().photos.count())
+
+    def test_tags_in_output(self):
+        photo = self.client.get("/api/v1.0/photos/1").json
+        self.assertEqual(["beach", "sunset"], photo["tags"])
+
+        with app.test_request_context():
+            photo = Photo.query.get(1)
+            self.assertEqual(marshal(photo, photo_fields), serialize_photo(photo))
+
+    def test_list_includes_tags(self):
+        photos = {p["title"]: p["tags"] for p in self.client.get("/api/v1.0/photos").json}
+        self.assertEqual(["sunset"], photos["sunset"])
+        self.assertEqual([], photos["none"])
+
+    def test_match_all(self):
+        self.assertEqual(["both"], self.titles("tags=beach,sunset"))
+        self.assertEqual(["both"], self.titles("tags=sunset,BEACH,beach&match=all"))
+
+    def test_match_any(self):
+        self.assertEqual(["beach", "both", "sunset"], self.titles("tags=beach,sunset&match=any"))
+
+    def test_unknown_tag(self):
+        self.assertEqual([], self.titles("tags=mountain"))
+
+    def test_export_filters_by_tag(self):
+        resp = self.client.get("/api/v1.0/photos/export?tags=beach&format=json")
+        photos = json.loads(resp.get_data(as_text=True))
+        self.assertEqual(["both", "beach"], [p["title"] for p in photos])
+        self.assertEqual(["beach", "sunset"], photos[0]["tags"])
+
+    def test_put_replaces_tags(self):
+        etag = self.client.get("/api/v1.0/photos/2").headers["ETag"]
+        resp = self.client.put(
+            "/api/v1.0/photos/2", data=json.dumps({"tags": ["Night", "city"]}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual(["city", "night"], resp.json["tags"])
+        self.assertEqual(["beach"], self.titles("tags=city"))
+        resp = self.client.get("/api/v1.0/photos/2", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 200)
+
+    def test_put_clears_tags(self):
+        resp = self.client.put(
+            "/api/v1.0/photos/1", data=json.dumps({"tags": []}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual([], resp.json["tags"])
+
+    def test_put_needs_a_list_of_strings(self):
+        for tags in ("beach", ["beach", 1], {"beach": True}):
+            resp = self.client.put("/api/v1.0/photos/1", json={"tags": tags})
+            self.assertEqual(400, resp.status_code)
+        self.assertEqual(["beach", "sunset"], self.client.get("/api/v1.0/photos/1").json["tags"])
+
+    def test_upload_with_tags(self):
+        resp = self.client.post(
+            "/api/v1.0/photos", buffered=True, content_type="multipart/form-data",
+            data={"file": (BytesIO(b'new'), 'new.jpg'), "title": "New", "tags": "beach, dunes"}
+        )
+        self.assertEqual(["beach", "dunes"], resp.json["tags"])
+        self.assertEqual(3, Tag.query.count())
+
+    def test_batch_with_tags(self):
+        resp = self.client.post(
+            "/api/v1.0/photos/batch", buffered=True, content_type="multipart/form-data",
+            data={
+                "files": [(BytesIO(b'one'), 'one.jpg'), (BytesIO(b'two'), 'two.jpg')],
+                "metadata": json.dumps([{"tags": ["forest"]}, {"tags": ["forest", "beach"]}])
+            }
+        )
+        self.assertEqual(["forest"], resp.json[0]["photo"]["tags"])
+        self.assertEqual(["beach", "forest"], resp.json[1]["photo"]["tags"])
+        self.assertEqual(["one", "two"], self.titles("tags=forest"))
+
+    def test_bulk_delete_removes_tag_links(self):
+        self.client.delete(
+            "/api/v1.0/photos", data=json.dumps({"ids": [1]}),
+            headers={"Content-Type": "application/json"}
+        )
+        self.assertEqual(["beach"], self.titles("tags=beach"))
+        self.assertEqual(1, Tag.query.filter_by(name="beach").first().photos.count())
+
+
+class TagRaceTestCase(unittest.TestCase):
+    """Another request adds the same new tag between lookup and insert."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        # A file, so the "other request" can use a connection of its own
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(self.folder, "db")
+        db.create_all()
+        self.client = app.test_client()
+        db.session.add(Photo("Photo", 1000, 1, "photo.jpg"))
+        db.session.commit()
+        event.listen(db.engine, "after_cursor_execute", self.race)
+
+    def tearDown(self):
+        event.remove(db.engine, "after_cursor_execute", self.race)
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        shutil.rmtree(self.folder)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+
+    def race(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT tag.") and " IN (" in statement:
+            with db.engine.connect() as other:
+                other.execute("INSERT OR IGNORE INTO tag (name) VALUES ('night')")
+
+    def test_put_uses_the_other_requests_tag(self):
+        resp = self.client.put("/api/v1.0/photos/1", json={"tags": ["night", "city"]})
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual(["city", "night"], resp.json["tags"])
+        self.assertEqual(1, Tag.query.filter_by(name="night").count())
+
+    def test_save_photo_only_treats_hash_conflicts_as_duplicates(self):
+        p = Photo("New", 2000, 1, "new.jpg")
+        p.content_hash = "ab" * 32
+        with mock.patch.object(db.session, "commit", side_effect=IntegrityError("", {}, None)):
+            with self.assertRaises(IntegrityError):
+                ingest.save_photo(p, None)
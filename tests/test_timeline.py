@@ -0,0 +1,71 @@
+import unittest
+from datetime import datetime, timezone
+from app import app, db
+from app.models import Photo, TimelineDay
+
+
+def timestamp(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp())
+
+
+class TimelineTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        self.photos = [
+            Photo("New year", timestamp(2020, 1, 1, 0, 30), True, "a.jpg"),
+            Photo("Same day", timestamp(2020, 1, 1, 23, 59), False, "b.jpg"),
+            Photo("Later", timestamp(2020, 3, 15, 12), True, "c.jpg"),
+            Photo("Last year", timestamp(2019, 12, 31, 23, 59), True, "d.jpg"),
+            Photo("Undated", None, True, "e.jpg"),
+        ]
+        db.session.add_all(self.photos)
+        db.session.commit()
+        self.ids = [photo.id for photo in self.photos]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def get(self, query=""):
+        resp = self.client.get(f"/api/v1.0/photos/timeline{query}")
+        self.assertEqual(200, resp.status_code)
+        return [(bucket["period"], bucket["count"]) for bucket in resp.json]
+
+    def test_granularities(self):
+        self.assertEqual([("2020-03", 1), ("2020-01", 2), ("2019-12", 1)], self.get())
+        self.assertEqual([("2020", 3), ("2019", 1)], self.get("?granularity=year"))
+        self.assertEqual(
+            [("2020-03-15", 1), ("2020-01-01", 2), ("2019-12-31", 1)],
+            self.get("?granularity=day")
+        )
+
+    def test_filters(self):
+        self.assertEqual([("2020-03", 1), ("2020-01", 1), ("2019-12", 1)], self.get("?public=true"))
+        self.assertEqual([("2020-01", 1)], self.get("?public=false"))
+        self.assertEqual([("2020-01", 2)], self.get("?after=2020-01-01&before=2020-03-01"))
+
+    def test_follows_changes(self):
+        # Public toggle through the API
+        self.client.put(f"/api/v1.0/photos/{self.ids[1]}", json={"public": True})
+        self.assertEqual([("2020-03", 1), ("2020-01", 2), ("2019-12", 1)], self.get("?public=true"))
+
+        # Bulk delete skips the ORM; the triggers still see it
+        self.client.delete("/api/v1.0/photos", json={"ids": [self.ids[2]]})
+        self.assertEqual([("2020-01", 2), ("2019-12", 1)], self.get())
+
+        photo = Photo.query.get(self.ids[3])
+        photo.upload_date = timestamp(2020, 1, 2)
+        db.session.commit()
+        self.assertEqual([("2020-01-02", 1), ("2020-01-01", 2)], self.get("?granularity=day"))
+
+    def test_rebuild(self):
+        db.session.execute(TimelineDay.__table__.delete())
+        db.session.commit()
+        self.assertEqual([], self.get())
+
+        result = app.test_cli_runner().invoke(args=["timeline-rebuild"])
+        self.assertIn("Counted photos on 3 days.", result.output)
+        self.assertEqual([("2020-03", 1), ("2020-01", 2), ("2019-12", 1)], self.get())
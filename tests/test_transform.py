@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from app import app
+from app.transform import TransformCache
+
+
+class TransformCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writer(self, content, calls=None, delay=0):
+        def render(dest):
+            if calls is not None:
+                calls.append(dest)
+            time.sleep(delay)
+            with open(dest, 'wb') as f:
+                f.write(content)
+        return render
+
+    def test_miss_then_hit(self):
+        cache = TransformCache(self.directory, 1024)
+        calls = []
+        with cache.open("aa11", "jpg", self.writer(b'one', calls)) as f:
+            self.assertEqual(b'one', f.read())
+        with cache.open("aa11", "jpg", self.writer(b'two', calls)) as f:
+            self.assertEqual(b'one', f.read())
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+
+    def test_evicts_least_recently_used(self):
+        cache = TransformCache(self.directory, 10)
+        cache.open("aa", "jpg", self.writer(b'1234')).close()
+        cache.open("bb", "jpg", self.writer(b'1234')).close()
+        # Touch "aa" so "bb" becomes the oldest entry
+        cache.open("aa", "jpg", self.writer(b'1234')).close()
+        cache.open("cc", "jpg", self.writer(b'1234')).close()
+
+        self.assertIn("aa.jpg", cache)
+        self.assertNotIn("bb.jpg", cache)
+        self.assertIn("cc.jpg", cache)
+        self.assertEqual(8, cache.size)
+        self.assertFalse(os.path.exists(cache.path("bb.jpg")))
+
+    def test_index_rebuilt_from_disk(self):
+        cache = TransformCache(self.directory, 1024)
+        cache.open("aa", "jpg", self.writer(b'1234')).close()
+
+        reloaded = TransformCache(self.directory, 1024)
+        self.assertIn("aa.jpg", reloaded)
+        self.assertEqual(4, reloaded.size)
+
+    def test_concurrent_requests_render_once(self):
+        cache = TransformCache(self.directory, 1024)
+        calls, results = [], []
+
+        def fetch():
+            with cache.open("aa", "jpg", self.writer(b'slow', calls, delay=0.2)) as f:
+                results.append(f.read())
+
+        threads = [threading.Thread(target=fetch) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([b'slow'] * 5, results)
+
+    def test_failed_render_is_not_cached(self):
+        cache = TransformCache(self.directory, 1024)
+
+        def broken(dest):
+            raise ValueError("bad image")
+
+        with self.assertRaises(ValueError):
+            cache.open("aa", "jpg", broken)
+        self.assertNotIn("aa.jpg", cache)
+        self.assertEqual([], os.listdir(os.path.join(self.directory, "aa")))
+
+
+class TransformRouteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.config = {
+            k: app.config[k] for k in ("UPLOAD_FOLDER", "TRANSFORM_CACHE_FOLDER")
+        }
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        app.config["TRANSFORM_CACHE_FOLDER"] = tempfile.mkdtemp()
+        self.client = app.test_client()
+
+        Image.new("RGB", (800, 600), (10, 20, 30)).save(
+            os.path.join(app.config["UPLOAD_FOLDER"], "photo.jpg")
+        )
+
+    def tearDown(self):
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        shutil.rmtree(app.config["TRANSFORM_CACHE_FOLDER"])
+        app.config.update(self.config)
+
+    def size_of(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        with Image.open(BytesIO(resp.data)) as image:
+            size, fmt = image.size, image.format
+        resp.close()
+        return size, fmt
+
+    def test_contain(self):
+        self.assertEqual(((200, 150), "JPEG"), self.size_of("/static/transform/photo.jpg?w=200&h=200"))
+
+    def test_single_dimension(self):
+        self.assertEqual((400, 300), self.size_of("/static/transform/photo.jpg?h=300")[0])
+
+    def test_cover(self):
+        self.assertEqual((200, 200), self.size_of("/static/transform/photo.jpg?w=200&h=200&fit=cover")[0])
+
+    def test_fill_webp(self):
+        self.assertEqual(
+            ((100, 50), "WEBP"),
+            self.size_of("/static/transform/photo.jpg?w=100&h=50&fit=fill&format=webp")
+        )
+
+    def test_not_modified(self):
+        resp = self.client.get("/static/transform/photo.jpg?w=100")
+        etag = resp.headers["ETag"]
+        resp.close()
+
+        resp = self.client.get("/static/transform/photo.jpg?w=100", headers={"If-None-Match": etag})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_requires_a_dimension(self):
+        self.assertEqual(400, self.client.get("/static/transform/photo.jpg").status_code)
+
+    def test_missing_source(self):
+        self.assertEqual(404, self.client.get("/static/transform/nope.jpg?w=10").status_code)
+
+    def test_not_an_image(self):
+        with open(os.path.join(app.config["UPLOAD_FOLDER"], "text.jpg"), "wb") as f:
+            f.write(b'plain text')
+        self.assertEqual(415, self.client.get("/static/transform/text.jpg?w=10").status_code)
+
+    def test_decompression_bomb(self):
+        with mock.patch.object(Image, "MAX_IMAGE_PIXELS", 1000):
+            self.assertEqual(415, self.client.get("/static/transform/photo.jpg?w=100").status_code)
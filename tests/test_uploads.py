@@ -0,0 +1,298 @@
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from app import app, db, storage, uploads
+from app.models import IngestJob, Photo, UploadSession
+
+
+def make_jpeg():
+    # Noise compresses badly, so the file is big enough to send in chunks.
+    noise = random.Random(0).getrandbits(8 * 200 * 150 * 3).to_bytes(200 * 150 * 3, "big")
+    buf = BytesIO()
+    Image.frombytes("RGB", (200, 150), noise).resize((800, 600)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class ResumableUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        db.create_all()
+        self.client = app.test_client()
+        self.content = make_jpeg()
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+
+    def tearDown(self):
+        app.config["INGEST_MODE"] = "sync"
+        app.config["INGEST_WORKERS"] = 2
+        db.session.remove()
+        db.drop_all()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def create(self, **values):
+        data = dict(filename="big.jpg", size=len(self.content), sha256=self.sha256)
+        data.update(values)
+        resp = self.client.post("/api/v1.0/uploads", json=data)
+        self.assertEqual(201, resp.status_code)
+        return resp.json["uri"]
+
+    def send(self, uri, start, stop):
+        return self.client.put(
+            uri, data=self.content[start:stop], content_type="application/octet-stream",
+            headers={"Content-Range": f"bytes {start}-{stop - 1}/{len(self.content)}"}
+        )
+
+    def send_all(self, uri, chunk=16384):
+        for start in range(0, len(self.content), chunk):
+            resp = self.send(uri, start, min(start + chunk, len(self.content)))
+            self.assertEqual(200, resp.status_code)
+        return resp
+
+    def test_chunked_upload(self):
+        uri = self.create(title="Big", public=True, tags=["raw", "Night"])
+        self.assertEqual(0, self.client.get(uri).json["offset"])
+        resp = self.send_all(uri)
+        self.assertEqual(len(self.content), resp.json["offset"])
+
+        resp = self.client.post(uri)
+        self.assertEqual(201, resp.status_code)
+        photo = Photo.query.get(resp.json["id"])
+        self.assertEqual(("Big", True, self.sha256), (photo.title, photo.public, photo.content_hash))
+        self.assertEqual(["night", "raw"], resp.json["tags"])
+        self.assertEqual(800, resp.json["width"])
+        with storage.get_storage().open(photo.path) as f:
+            self.assertEqual(self.content, f.read())
+        self.assertEqual([], os.listdir(storage.full_path(".spool")))
+
+        # Finalizing again, e.g. after a lost response, changes nothing
+        again = self.client.post(uri)
+        self.assertEqual((200, resp.json["id"]), (again.status_code, again.json["id"]))
+        self.assertEqual("done", self.client.get(uri).json["status"])
+        self.assertEqual(f"/api/v1.0/photos/{photo.id}", self.client.get(uri).json["photo"])
+
+    def test_resume_from_the_stored_offset(self):
+        uri = self.create()
+        self.send(uri, 0, 5000)
+        # The response to the next chunk was lost, and the client retries it
+        self.send(uri, 5000, 9000)
+        resp = self.send(uri, 5000, 9000)
+        self.assertEqual((409, 9000), (resp.status_code, resp.json["offset"]))
+
+        # A gap is refused as well
+        self.assertEqual(409, self.send(uri, 12000, 13000).status_code)
+        self.assertEqual(9000, self.client.get(uri).json["offset"])
+
+        self.assertEqual(200, self.send(uri, 9000, len(self.content)).status_code)
+        self.assertEqual(201, self.client.post(uri).status_code)
+
+    def test_interrupted_chunk_keeps_what_arrived(self):
+        app.config["UPLOAD_CHUNK_SIZE"] = 200
+        self.addCleanup(app.config.update, UPLOAD_CHUNK_SIZE=64 * 1024)
+        uri = self.create()
+        self.send(uri, 0, 1000)
+        # The connection drops 500 bytes into a 3000 byte chunk. The body is
+        # read 200 bytes at a time, and the last, partial read is lost.
+        resp = self.client.put(
+            uri, input_stream=BytesIO(self.content[1000:1500]),
+            headers={"Content-Range": f"bytes 1000-3999/{len(self.content)}"},
+            environ_overrides={"CONTENT_LENGTH": "3000"}
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(1400, self.client.get(uri).json["offset"])
+
+        self.assertEqual(200, self.send(uri, 1400, len(self.content)).status_code)
+        self.assertEqual(201, self.client.post(uri).status_code)
+
+    def test_bad_chunks(self):
+        uri = self.create()
+        self.assertEqual(400, self.client.put(uri, data=b"abc").status_code)
+        resp = self.client.put(uri, data=b"abc", headers={"Content-Range": "bytes 0-2/99"})
+        self.assertEqual(400, resp.status_code)
+        resp = self.client.put(
+            uri, data=b"abcd", headers={"Content-Range": f"bytes 0-2/{len(self.content)}"}
+        )
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual(404, self.client.get("/api/v1.0/uploads/missing").status_code)
+
+    def test_concurrent_finalize(self):
+        uri = self.create()
+        self.send_all(uri)
+        winner = Photo("Winner", 1, True, "winner.jpg")
+        db.session.add(winner)
+        db.session.commit()
+        winner_id = winner.id
+        file_sha256 = uploads.file_sha256
+
+        def finalized_meanwhile(path):
+            # Another request finishes the upload while this one hashes it
+            UploadSession.query.update(
+                {"status": "done", "photo_id": winner_id}, synchronize_session=False
+            )
+            db.session.commit()
+            return file_sha256(path)
+
+        with mock.patch.object(uploads, "file_sha256", finalized_meanwhile):
+            resp = self.client.post(uri)
+        self.assertEqual((200, winner_id), (resp.status_code, resp.json["id"]))
+        self.assertEqual(1, Photo.query.count())
+
+    def test_finalize_does_not_hash_again(self):
+        uri = self.create()
+        self.send_all(uri)
+        with mock.patch.object(uploads, "file_sha256", wraps=uploads.file_sha256) as hashed, \
+                mock.patch.object(storage, "copy_hashed") as copied:
+            self.assertEqual(201, self.client.post(uri).status_code)
+        self.assertEqual(1, hashed.call_count)
+        copied.assert_not_called()
+
+        # The same file again is not stored twice, and its spool is removed
+        uri = self.create()
+        self.send_all(uri)
+        self.assertEqual(200, self.client.post(uri).status_code)
+        self.assertEqual(1, Photo.query.count())
+        self.assertEqual([], os.listdir(storage.full_path(".spool")))
+
+    def test_finalizing_in_progress(self):
+        uri = self.create()
+        self.send_all(uri)
+        UploadSession.query.update({"status": "finalizing"})
+        db.session.commit()
+        resp = self.client.post(uri)
+        self.assertEqual((409, "finalizing"), (resp.status_code, resp.json["status"]))
+
+    def test_failed_finalize_can_be_retried(self):
+        uri = self.create()
+        self.send_all(uri)
+        with mock.patch.object(uploads, "save_photo", side_effect=RuntimeError("db down")):
+            self.assertEqual(500, self.client.post(uri).status_code)
+        # The file had already been moved out of the spool
+        resp = self.client.get(uri)
+        self.assertEqual(("uploading", 0), (resp.json["status"], resp.json["offset"]))
+
+        self.send_all(uri)
+        self.assertEqual(201, self.client.post(uri).status_code)
+
+    def test_finalize_needs_every_byte(self):
+        uri = self.create()
+        self.send(uri, 0, 100)
+        self.assertEqual(409, self.client.post(uri).status_code)
+
+    def test_checksum_mismatch_resets(self):
+        uri = self.create(sha256="0" * 64)
+        self.send_all(uri)
+        resp = self.client.post(uri)
+        self.assertEqual((400, 0), (resp.status_code, resp.json["offset"]))
+        self.assertEqual(0, Photo.query.count())
+
+        # The right checksum can also be given when finalizing
+        self.send_all(uri)
+        self.assertEqual(201, self.client.post(uri, json={"sha256": self.sha256}).status_code)
+
+    def test_checksum_is_required(self):
+        uri = self.create(sha256=None)
+        self.send_all(uri)
+        self.assertEqual(400, self.client.post(uri).status_code)
+
+    def test_create_validation(self):
+        post = self.client.post
+        self.assertEqual(400, post("/api/v1.0/uploads", json={"filename": "a.jpg"}).status_code)
+        self.assertEqual(
+            400, post("/api/v1.0/uploads", json={"filename": "a.gif", "size": 10}).status_code
+        )
+        self.assertEqual(400, post(
+            "/api/v1.0/uploads", json={"filename": "a.jpg", "size": 10, "sha256": "xyz"}
+        ).status_code)
+        self.assertEqual(400, post(
+            "/api/v1.0/uploads", json={"filename": "a.jpg", "size": 10, "tags": "beach"}
+        ).status_code)
+        too_big = app.config["RESUMABLE_UPLOAD_MAX_SIZE"] + 1
+        self.assertEqual(
+            413, post("/api/v1.0/uploads", json={"filename": "a.jpg", "size": too_big}).status_code
+        )
+
+    def test_async_ingest(self):
+        app.config["INGEST_MODE"] = "async"
+        app.config["INGEST_WORKERS"] = 0
+        uri = self.create()
+        self.send_all(uri)
+        resp = self.client.post(uri)
+        self.assertEqual(202, resp.status_code)
+        job = IngestJob.query.get(resp.json["id"])
+        self.assertEqual("done", job.status)
+        self.assertEqual(self.sha256, Photo.query.get(job.photo_id).content_hash)
+        self.assertEqual([], os.listdir(storage.full_path(".spool")))
+        self.assertEqual(202, self.client.post(uri).status_code)
+
+    def test_delete_and_expire(self):
+        uri = self.create()
+        self.send(uri, 0, 100)
+        self.assertEqual(200, self.client.delete(uri).status_code)
+        self.assertEqual(404, self.client.get(uri).status_code)
+        self.assertEqual([], os.listdir(storage.full_path(".spool")))
+
+        uri = self.create()
+        upload = UploadSession.query.one()
+        upload.updated_at = datetime.utcnow() - timedelta(days=2)
+        db.session.commit()
+        result = app.test_cli_runner().invoke(args=["uploads-expire"])
+        self.assertIn("Removed 1 upload sessions.", result.output)
+        self.assertEqual(0, UploadSession.query.count())
+        self.assertEqual([], os.listdir(storage.full_path(".spool")))
+
+
+class FinalizeLockTestCase(unittest.TestCase):
+    """Storing a finalized upload must not keep the database locked."""
+
+    def setUp(self):
+        self.upload_folder = app.config["UPLOAD_FOLDER"]
+        app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+        self.derivative_workers = app.config["DERIVATIVE_WORKERS"]
+        app.config["DERIVATIVE_WORKERS"] = 0
+        # A file, so another "request" can use a connection of its own
+        app.config["SQLALCHEMY_DATABASE_URI"] = (
+            "sqlite:///" + os.path.join(app.config["UPLOAD_FOLDER"], "db")
+        )
+        db.create_all()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        shutil.rmtree(app.config["UPLOAD_FOLDER"])
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        app.config["UPLOAD_FOLDER"] = self.upload_folder
+        app.config["DERIVATIVE_WORKERS"] = self.derivative_workers
+
+    def test_other_writers_go_on_while_storing(self):
+        content = make_jpeg()
+        uri = self.client.post("/api/v1.0/uploads", json={
+            "filename": "big.jpg", "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest()
+        }).json["uri"]
+        content_range = f"bytes 0-{len(content) - 1}/{len(content)}"
+        self.client.put(uri, data=content, headers={"Content-Range": content_range})
+        seen = []
+        spooled_photo = uploads.spooled_photo
+
+        def storing(*args):
+            with db.engine.connect() as other:
+                other.execute("INSERT INTO tag (name) VALUES ('meanwhile')")
+                seen.append(other.execute("SELECT status FROM upload_session").scalar())
+            return spooled_photo(*args)
+
+        with mock.patch.object(uploads, "spooled_photo", storing):
+            self.assertEqual(201, self.client.post(uri).status_code)
+        self.assertEqual(["finalizing"], seen)
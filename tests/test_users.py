@@ -0,0 +1,102 @@
+import unittest
+from sqlalchemy import event
+from app import app, db
+from app.models import Photo, User
+
+
+class UsersTestCase(unittest.TestCase):
+    def setUp(self):
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+        db.create_all()
+        self.client = app.test_client()
+
+        self.users = [User(username=f"user{i}", email=f"user{i}@example.com") for i in range(5)]
+        db.session.add_all(self.users)
+        db.session.flush()
+        photos = [Photo(f"Photo{i}", 1000 + i, i % 2, f"photo{i}.jpg") for i in range(6)]
+        for i, photo in enumerate(photos):
+            photo.user_id = self.users[i % 2].id
+        db.session.add_all(photos)
+        db.session.commit()
+        self.ids = [user.id for user in self.users]
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+
+    def count_queries(self, fn):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            result = fn()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return result, statements
+
+    def test_create_user(self):
+        resp = self.client.post("/api/v1.0/users", json={
+            "username": "new", "email": "new@example.com", "password": "secret"
+        })
+        self.assertEqual(201, resp.status_code)
+        self.assertEqual(0, resp.json["photo_count"])
+        self.assertNotIn("email", resp.json)
+        self.assertTrue(User.query.get(resp.json["id"]).check_password("secret"))
+
+    def test_duplicate_username(self):
+        resp = self.client.post("/api/v1.0/users", json={
+            "username": "user0", "email": "other@example.com", "password": "secret"
+        })
+        self.assertEqual(409, resp.status_code)
+
+    def test_get_user(self):
+        resp = self.client.get(f"/api/v1.0/users/{self.ids[0]}")
+        self.assertEqual("user0", resp.json["username"])
+        self.assertEqual(3, resp.json["photo_count"])
+        self.assertEqual(f"/api/v1.0/users/{self.ids[0]}/photos", resp.json["photos"])
+        self.assertEqual(404, self.client.get("/api/v1.0/users/999").status_code)
+
+    def test_list_counts_in_one_query(self):
+        resp, statements = self.count_queries(lambda: self.client.get("/api/v1.0/users"))
+        self.assertEqual([3, 3, 0, 0, 0], [user["photo_count"] for user in resp.json])
+        self.assertEqual(1, len(statements))
+
+    def test_list_pages(self):
+        first = self.client.get("/api/v1.0/users?limit=3")
+        self.assertEqual(["user0", "user1", "user2"], [u["username"] for u in first.json])
+        cursor = first.headers["X-Next-Cursor"]
+        second = self.client.get(f"/api/v1.0/users?limit=3&cursor={cursor}")
+        self.assertEqual(["user3", "user4"], [u["username"] for u in second.json])
+        self.assertNotIn("Link", second.headers)
+        self.assertEqual(400, self.client.get("/api/v1.0/users?cursor=bogus").status_code)
+
+    def test_user_photos(self):
+        url = f"/api/v1.0/users/{self.ids[0]}/photos"
+        first = self.client.get(f"{url}?limit=2")
+        self.assertEqual(["Photo4", "Photo2"], [p["title"] for p in first.json])
+        self.assertTrue(first.headers["Link"].startswith(f"<{url}?"))
+
+        second = self.client.get(f"{url}?limit=2&cursor={first.headers['X-Next-Cursor']}")
+        self.assertEqual(["Photo0"], [p["title"] for p in second.json])
+        # Filters combine with the owner
+        self.assertEqual([], self.client.get(f"{url}?public=true").json)
+
+    def test_user_photos_unknown_user(self):
+        self.assertEqual(404, self.client.get("/api/v1.0/users/999/photos").status_code)
+
+    def test_update_user(self):
+        url = f"/api/v1.0/users/{self.ids[2]}"
+        resp = self.client.put(url, json={"display_name": "Two"})
+        self.assertEqual("Two", resp.json["display_name"])
+        self.assertEqual(409, self.client.put(url, json={"email": "user0@example.com"}).status_code)
+        self.assertEqual(400, self.client.put(url, json={}).status_code)
+
+    def test_delete_keeps_photos(self):
+        resp = self.client.delete(f"/api/v1.0/users/{self.ids[0]}")
+        self.assertEqual(200, resp.status_code)
+        self.assertIsNone(User.query.get(self.ids[0]))
+        self.assertEqual(6, Photo.query.count())
+        self.assertEqual(3, Photo.query.filter(Photo.user_id.is_(None)).count())